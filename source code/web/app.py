@@ -6,6 +6,8 @@ from controllers.admin_controller import admin_blueprint
 import os
 import socket
 from config import SECRET_KEY, LOCAL_SERVER_HOST, LOCAL_SERVER_PORT
+from services.metrics import init_metrics
+from services.sessions import init_sessions
 
 # Initialize Flask app
 app = Flask(__name__, static_folder='static')
@@ -19,6 +21,12 @@ app.register_blueprint(main_blueprint)
 app.register_blueprint(auth_blueprint)
 app.register_blueprint(admin_blueprint)
 
+# Request latency histograms, exported at /metrics
+init_metrics(app)
+
+# Sessions live in a shared store; the cookie only carries the session id
+init_sessions(app)
+
 def get_local_ip():
     """Get the local IP address of your PC"""
     try:
@@ -0,0 +1,21 @@
+"""
+ASGI entry point for the async serving mode
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The event loop owns the client connections (keep-alive, slow uploads and PDF
+downloads) and hands each request to a Flask thread. The I/O-bound views in
+main_controller are coroutines: SQLite reads/writes and SMTP/Infobip sends are
+awaited on services.async_io's I/O pool and several sends for one request run
+concurrently; prediction and PDF rendering go to the inference process pool
+(HEARTCARE_WORKER_PROCESSES) or the CPU thread pool.
+"""
+
+import os
+from a2wsgi import WSGIMiddleware
+from app import app
+
+# Flask request threads; each mostly waits on awaited I/O, so this can be large
+ASGI_THREADS = int(os.environ.get('HEARTCARE_ASGI_THREADS', '64'))
+
+application = WSGIMiddleware(app, workers=ASGI_THREADS)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Load test for the prediction micro-batcher
+Drives concurrent single-row predictions through predict_heart_disease (unbatched)
+and through PredictionBatcher with several max-wait / max-batch settings, and
+reports throughput against p50/p99 latency as JSON.
+
+Usage: python bench/batcher_load.py --model xgboost --clients 32 --duration 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from models.heart_model import predict_heart_disease, _load_model
+from models.batcher import PredictionBatcher
+
+
+def random_features(rng):
+    return [
+        rng.randint(29, 77), rng.randint(0, 1), rng.randint(1, 4), rng.randint(94, 200),
+        rng.randint(126, 564), rng.randint(0, 1), rng.randint(0, 2), rng.randint(71, 202),
+        rng.randint(0, 1), round(rng.uniform(0, 6.2), 1), rng.randint(1, 3), rng.randint(0, 3),
+        rng.choice([3, 6, 7]),
+    ]
+
+
+def run_load(predict, clients, duration, seed=0):
+    latencies = [[] for _ in range(clients)]
+    stop_at = time.perf_counter() + duration
+
+    def client(idx):
+        rng = random.Random(seed + idx)
+        while time.perf_counter() < stop_at:
+            features = random_features(rng)
+            start = time.perf_counter()
+            predict(features)
+            latencies[idx].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = np.array([x for per_client in latencies for x in per_client]) * 1000.0
+    return {
+        'requests': int(all_latencies.size),
+        'throughput_rps': round(all_latencies.size / elapsed, 1),
+        'p50_ms': round(float(np.percentile(all_latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(all_latencies, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-batcher throughput vs p99 latency')
+    parser.add_argument('--model', default='logistic', choices=['logistic', 'random_forest', 'xgboost'])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--max-wait-ms', type=float, nargs='+', default=[0.5, 2.0, 5.0])
+    parser.add_argument('--max-batch', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--output', help='Write the JSON results to this file as well')
+    args = parser.parse_args()
+
+    # Load outside the timed region so cold-load cost is not measured
+    _load_model(args.model)
+
+    results = [dict(mode='unbatched', **run_load(lambda f: predict_heart_disease(f, args.model), args.clients, args.duration))]
+    for max_wait_ms in args.max_wait_ms:
+        for max_batch in args.max_batch:
+            batcher = PredictionBatcher(max_batch_size=max_batch, max_wait_ms=max_wait_ms)
+            stats = run_load(lambda f: batcher.predict(f, args.model), args.clients, args.duration)
+            stats.update(mode='batched', max_wait_ms=max_wait_ms, max_batch=max_batch,
+                         mean_batch_size=round(batcher.rows / max(batcher.batches, 1), 2))
+            results.append(stats)
+
+    report = {'model': args.model, 'clients': args.clients, 'duration_s': args.duration, 'results': results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for models/heart_model.py
+Times preprocess_features, preprocess_features_robust, _load_model (cold and
+warm), predict_heart_disease / predict_heart_disease_batch for each model and
+get_model_performance with the UCI download replaced by a synthetic dataset.
+Each case is warmed up, then run for several repeats with the garbage
+collector disabled (as timeit does); per-call min / median / mean / stdev are
+reported as JSON.
+
+Usage: python bench/bench_models.py --repeat 7 --output bench_models.json
+       python bench/bench_models.py --only predict preprocess
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+from contextlib import redirect_stdout
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from models import heart_model
+from models.heart_model import MODEL_PATHS, FEATURE_NAMES
+from batcher_load import random_features
+
+BATCH_SIZES = [1, 32, 256]
+
+
+def time_case(fn, number, repeat, warmup, setup=None):
+    """
+    Per-call seconds for each repeat: fn is called number times per repeat,
+    after warmup untimed calls. setup (if given) runs untimed before every call.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    per_call = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            elapsed = 0.0
+            for _ in range(number):
+                if setup:
+                    setup()
+                start = time.perf_counter()
+                fn()
+                elapsed += time.perf_counter() - start
+            per_call.append(elapsed / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return per_call
+
+
+def summarize(name, per_call, number, **params):
+    ms = [t * 1000.0 for t in per_call]
+    result = {
+        'name': name,
+        'number': number,
+        'repeat': len(ms),
+        'min_ms': round(min(ms), 4),
+        'median_ms': round(statistics.median(ms), 4),
+        'mean_ms': round(statistics.mean(ms), 4),
+        'stdev_ms': round(statistics.stdev(ms), 4) if len(ms) > 1 else 0.0,
+    }
+    result.update(params)
+    return result
+
+
+def synthetic_uci(n_rows, seed):
+    """Stand-in for fetch_ucirepo(id=45): same columns and value ranges as the UCI data"""
+    rng = random.Random(seed)
+    features = pd.DataFrame([random_features(rng) for _ in range(n_rows)], columns=FEATURE_NAMES)
+    targets = pd.DataFrame({'num': [rng.randint(0, 4) for _ in range(n_rows)]})
+    return types.SimpleNamespace(data=types.SimpleNamespace(features=features, targets=targets))
+
+
+def _reset_model_cache():
+    heart_model._models.clear()
+    heart_model._scaler = None
+
+
+def bench_preprocess(args, rows):
+    results = []
+    for name, fn in [('preprocess_features', heart_model.preprocess_features),
+                     ('preprocess_features_robust', heart_model.preprocess_features_robust)]:
+        per_call = time_case(lambda: fn(rows[0]), args.number, args.repeat, args.warmup)
+        results.append(summarize(name, per_call, args.number, batch_size=1))
+    for batch_size in BATCH_SIZES:
+        batch = rows[:batch_size]
+        per_call = time_case(lambda: heart_model.preprocess_features_batch(batch), args.number, args.repeat, args.warmup)
+        results.append(summarize('preprocess_features_batch', per_call, args.number, batch_size=batch_size))
+    return results
+
+
+def bench_load(args, rows):
+    results = []
+    for model_name in args.models:
+        # Cold: caches cleared before every call, so each call reads the artifact
+        per_call = time_case(lambda: heart_model._load_model(model_name), 1, args.repeat, 1, setup=_reset_model_cache)
+        results.append(summarize('_load_model', per_call, 1, model=model_name, cache='cold'))
+        heart_model._load_model(model_name)
+        per_call = time_case(lambda: heart_model._load_model(model_name), args.number * 100, args.repeat, args.warmup)
+        results.append(summarize('_load_model', per_call, args.number * 100, model=model_name, cache='warm'))
+    return results
+
+
+def bench_predict(args, rows):
+    results = []
+    for model_name in args.models:
+        heart_model._load_model(model_name)
+        per_call = time_case(lambda: heart_model.predict_heart_disease(rows[0], model_name), args.number, args.repeat, args.warmup)
+        results.append(summarize('predict_heart_disease', per_call, args.number, model=model_name, batch_size=1))
+        for batch_size in BATCH_SIZES:
+            batch = rows[:batch_size]
+            per_call = time_case(lambda: heart_model.predict_heart_disease_batch(batch, model_name), args.number, args.repeat, args.warmup)
+            results.append(summarize('predict_heart_disease_batch', per_call, args.number, model=model_name, batch_size=batch_size,
+                                     per_row_us=round(statistics.median(per_call) / batch_size * 1e6, 3)))
+    return results
+
+
+def bench_performance(args, rows):
+    results = []
+    original_fetch, original_savefig = heart_model.fetch_ucirepo, plt.savefig
+    with tempfile.TemporaryDirectory() as image_dir:
+        # Keep the rendering cost but write the charts outside static/images
+        plt.savefig = lambda path, *a, **k: original_savefig(os.path.join(image_dir, os.path.basename(path)), *a, **k)
+        try:
+            for n_rows in args.performance_rows:
+                dataset = synthetic_uci(n_rows, args.seed)
+                heart_model.fetch_ucirepo = lambda id: dataset
+                for model_name in args.models:
+                    heart_model._load_model(model_name)
+                    per_call = time_case(lambda: heart_model.get_model_performance(model_name), 1, args.repeat, 1)
+                    results.append(summarize('get_model_performance', per_call, 1, model=model_name, rows=n_rows))
+        finally:
+            heart_model.fetch_ucirepo, plt.savefig = original_fetch, original_savefig
+    return results
+
+
+GROUPS = {
+    'preprocess': bench_preprocess,
+    'load': bench_load,
+    'predict': bench_predict,
+    'performance': bench_performance,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='heart_model.py microbenchmarks')
+    parser.add_argument('--only', nargs='+', choices=list(GROUPS), default=list(GROUPS))
+    parser.add_argument('--models', nargs='+', choices=list(MODEL_PATHS), default=list(MODEL_PATHS))
+    parser.add_argument('--number', type=int, default=20, help='Calls per repeat')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--performance-rows', type=int, nargs='+', default=[303, 3000], help='Synthetic dataset sizes for get_model_performance')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON results to this file as well')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = [random_features(rng) for _ in range(max(BATCH_SIZES))]
+
+    results = []
+    # The model code prints DEBUG lines on every call; discard them while timing
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for group in args.only:
+            results.extend(GROUPS[group](args, rows))
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'flat_models': heart_model.FLAT_MODELS_ENABLED,
+        'mmap_mode': heart_model.MODEL_MMAP_MODE,
+        'results': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the HeartCare+ web app
+Serves the real Flask app on a local port against a scratch copy of users.db
+(sessions, jobs, rate limits and shadow logs go to the same scratch directory),
+with SMTP and Infobip replaced by local stand-ins that answer after a fixed
+delay, and drives a weighted mix of requests from concurrent clients:
+anonymous predictions, logged-in predictions (save_record), record browsing,
+PDF downloads, report links and admin stats.
+Reports throughput and p50/p95/p99 per endpoint as JSON so runs can be
+compared commit to commit. Requests turned away by admission control are
+counted apart from errors: throttled (429) and shed (503).
+
+Usage: python bench/load_suite.py --clients 16 --duration 30 --output bench_results.json
+"""
+
+import argparse
+import http.cookiejar
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import redirect_stdout
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(WEB_DIR)
+
+# Every benchmark client connects from 127.0.0.1, so the app's per-IP limits would
+# turn most of the run into 429s. Raise them before the app reads them at import;
+# setting the variables explicitly still wins.
+BENCH_LIMITS = {
+    'HEARTCARE_LOGIN_PER_IP': '1000000',
+    'HEARTCARE_PREDICT_PER_IP': '1000000',
+    'HEARTCARE_PREDICT_PER_USER': '1000000',
+    'HEARTCARE_PREDICT_BURST': '1000000',
+    'HEARTCARE_PREDICT_ROWS_PER_MINUTE': '100000000',
+}
+for _name, _value in BENCH_LIMITS.items():
+    os.environ.setdefault(_name, _value)
+
+# Everything the app writes goes to a scratch directory, never to real data.
+# The services read these paths at import, so they are set before any import of the app.
+SCRATCH_DIR = tempfile.mkdtemp(prefix='heartcare_bench_')
+SCRATCH_PATHS = {
+    'HEARTCARE_SESSION_DB': os.path.join(SCRATCH_DIR, 'sessions.db'),
+    'HEARTCARE_SESSION_DIR': os.path.join(SCRATCH_DIR, 'sessions'),
+    'HEARTCARE_JOBS_DB': os.path.join(SCRATCH_DIR, 'jobs.db'),
+    'HEARTCARE_RATE_LIMIT_DB': os.path.join(SCRATCH_DIR, 'rate_limits.db'),
+    'HEARTCARE_SHADOW_LOG_DIR': os.path.join(SCRATCH_DIR, 'shadow_log'),
+}
+os.environ.update(SCRATCH_PATHS)
+
+import numpy as np
+from batcher_load import random_features
+from models import user_model
+
+FEATURE_KEYS = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+
+# Scenario name -> relative weight in the request mix
+DEFAULT_MIX = {
+    'predict_anonymous': 35,
+    'predict_logged_in': 20,
+    'records': 15,
+    'download_report': 10,
+    'send_report_link': 5,
+    'download_report_link': 10,
+    'admin_stats': 5,
+}
+
+
+class FakeSMTP:
+    """Stand-in for smtplib.SMTP: accepts every message after the configured delay"""
+    delay = 0.05
+
+    def __init__(self, host='', port=0, *args, **kwargs):
+        time.sleep(self.delay / 2)
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, *args, **kwargs):
+        pass
+
+    def sendmail(self, *args, **kwargs):
+        time.sleep(self.delay / 2)
+        return {}
+
+    def send_message(self, *args, **kwargs):
+        return self.sendmail()
+
+    def quit(self):
+        pass
+
+
+class FakeInfobipResponse:
+    status = 200
+
+    def read(self):
+        return json.dumps({'messages': [{'messageId': uuid.uuid4().hex, 'status': {'groupName': 'PENDING'}}]}).encode('utf-8')
+
+
+class FakeHTTPSConnection:
+    """Stand-in for the Infobip http.client.HTTPSConnection"""
+    delay = 0.05
+
+    def __init__(self, host, *args, **kwargs):
+        self.host = host
+
+    def request(self, method, url, body=None, headers=None):
+        time.sleep(self.delay)
+
+    def getresponse(self):
+        return FakeInfobipResponse()
+
+    def close(self):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time each request on its own; a redirect counts as the response
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser-like session with its own cookie jar"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, path, form=None, json_body=None):
+        data, headers = None, {}
+        if json_body is not None:
+            data, headers = json.dumps(json_body).encode('utf-8'), {'Content-Type': 'application/json'}
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class AsgiServer:
+    """uvicorn serving asgi.application, with the same serve_forever/shutdown interface as make_server"""
+
+    def __init__(self):
+        import uvicorn
+        from asgi import application
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.server_port = sock.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(application, host='127.0.0.1', port=self.server_port, log_level='error'))
+
+    def serve_forever(self):
+        self._server.run()
+
+    def wait_until_started(self, timeout=30):
+        deadline = time.perf_counter() + timeout
+        while not self._server.started and time.perf_counter() < deadline:
+            time.sleep(0.05)
+
+    def shutdown(self):
+        self._server.should_exit = True
+
+
+def _features_payload(features):
+    return dict(zip(FEATURE_KEYS, features))
+
+
+def _scenarios(report_ids):
+    """Scenario name -> fn(clients, rng) returning the HTTP status"""
+
+    def predict_anonymous(c, rng):
+        return c['anon'].request('/predict', json_body=dict(_features_payload(random_features(rng)), model_name=rng.choice(['logistic', 'random_forest', 'xgboost'])))
+
+    def predict_logged_in(c, rng):
+        # Form posts are the path that calls save_record for logged-in users
+        return c['user'].request('/predict', form=dict(_features_payload(random_features(rng)), model_name='logistic'))
+
+    def records(c, rng):
+        return c['user'].request('/records')
+
+    def download_report(c, rng):
+        features = random_features(rng)
+        return c['user'].request('/download_report', form={
+            'prediction': str(rng.random()), 'reasoning': 'Load test report.',
+            'recommendations': str(['Exercise regularly.', 'Monitor blood pressure.']), 'features': str(features),
+        })
+
+    def send_report_link(c, rng):
+        return c['user'].request('/send_report_link', form={
+            'prediction': str(rng.random()), 'reasoning': 'Load test report.',
+            'recommendations': str(['Exercise regularly.']), 'features': str(random_features(rng)),
+            'email': 'loadtest@example.com', 'phone': '+10000000000',
+        })
+
+    def download_report_link(c, rng):
+        return c['anon'].request('/download_report/' + rng.choice(report_ids))
+
+    def admin_stats(c, rng):
+        return c['admin'].request('/api/admin/stats')
+
+    return {fn.__name__: fn for fn in [predict_anonymous, predict_logged_in, records, download_report,
+                                      send_report_link, download_report_link, admin_stats]}
+
+
+def _summarize(latencies, errors, throttled, shed, elapsed):
+    ms = np.array(latencies) * 1000.0
+    if ms.size == 0:
+        return {'requests': 0, 'errors': errors, 'throttled': throttled, 'shed': shed}
+    return {
+        'requests': int(ms.size),
+        'errors': errors,
+        'throttled': throttled,
+        'shed': shed,
+        'throughput_rps': round(ms.size / elapsed, 2),
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'p99_ms': round(float(np.percentile(ms, 99)), 2),
+        'max_ms': round(float(ms.max()), 2),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=WEB_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end HeartCare+ load test')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=3.0, help='Seconds of traffic before measurement starts')
+    parser.add_argument('--provider-latency-ms', type=float, default=50.0, help='Simulated SMTP / Infobip response time')
+    parser.add_argument('--mix', help='Override weights, e.g. "predict_anonymous=50,records=50"')
+    parser.add_argument('--server', default='werkzeug', choices=['werkzeug', 'asgi'], help='Threaded WSGI server or uvicorn + asgi.py')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Keep the app\'s DEBUG output')
+    parser.add_argument('--output', help='Write the JSON results to this file as well')
+    args = parser.parse_args()
+
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {name: float(weight) for name, weight in (item.split('=') for item in args.mix.split(','))}
+
+    # Scratch copy of the database so the benchmark never touches real data
+    db_path = os.path.join(SCRATCH_DIR, 'users.db')
+    shutil.copy(os.path.join(WEB_DIR, 'users.db'), db_path)
+    user_model.DB_PATH = db_path
+    user_model.init_db()
+
+    os.chdir(WEB_DIR)
+    from werkzeug.serving import make_server
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    from app import app
+    from models.heart_model import preload_models
+    from services import infobip_service, twilio_service
+
+    # Local stand-ins for the outbound providers, swapped in only where the services look them up
+    FakeSMTP.delay = FakeHTTPSConnection.delay = args.provider_latency_ms / 1000.0
+    twilio_service.smtplib = types.SimpleNamespace(SMTP=FakeSMTP)
+    infobip_service.http = types.SimpleNamespace(client=types.SimpleNamespace(HTTPSConnection=FakeHTTPSConnection))
+
+    print("🔄 Preparing benchmark data...")
+    preload_models()
+    report_ids = []
+    for i in range(50):
+        report_id = str(uuid.uuid4())
+        user_model.save_report_link(1, report_id, '0.42', 'Seeded report.', str(['Exercise regularly.']), str(random_features(random.Random(i))))
+        report_ids.append(report_id)
+
+    if args.server == 'asgi':
+        server = AsgiServer()
+    else:
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if args.server == 'asgi':
+        server.wait_until_started()
+    print(f"🚀 Serving on {base_url} ({args.server}) with {args.clients} clients")
+
+    admin_username = f'bench_admin_{uuid.uuid4().hex[:10]}'
+    user_model.create_admin(admin_username, 'bench-password', 'Bench Admin', f'{admin_username}@example.com')
+    sessions = []
+    for i in range(args.clients):
+        username = f'bench_{uuid.uuid4().hex[:10]}'
+        user_model.create_user(username, 'bench-password', f'Bench User {i}', f'{username}@example.com')
+        user, admin = Client(base_url), Client(base_url)
+        if user.request('/login', json_body={'username': username, 'password': 'bench-password'}) != 200:
+            sys.exit(f"❌ Could not log in benchmark user {username}")
+        if admin.request('/admin/login', json_body={'username': admin_username, 'password': 'bench-password'}) != 200:
+            sys.exit("❌ Could not log in as admin")
+        sessions.append({'anon': Client(base_url), 'user': user, 'admin': admin})
+
+    scenarios = _scenarios(report_ids)
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    latencies = {name: [[] for _ in range(args.clients)] for name in names}
+    errors = {name: [0] * args.clients for name in names}
+    throttled = {name: [0] * args.clients for name in names}
+    shed = {name: [0] * args.clients for name in names}
+    measure_from = time.perf_counter() + args.warmup
+    stop_at = measure_from + args.duration
+
+    def client(idx):
+        rng = random.Random(args.seed + idx)
+        while True:
+            start = time.perf_counter()
+            if start >= stop_at:
+                break
+            name = rng.choices(names, weights)[0]
+            try:
+                status = scenarios[name](sessions[idx], rng)
+            except Exception:
+                status = None
+            end = time.perf_counter()
+            if start < measure_from:
+                continue
+            if status == 429:
+                throttled[name][idx] += 1
+            elif status == 503:
+                shed[name][idx] += 1
+            elif status is None or status >= 400:
+                errors[name][idx] += 1
+            else:
+                latencies[name][idx].append(end - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    output = sys.stdout if args.verbose else io.StringIO()
+    with redirect_stdout(output):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    server.shutdown()
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+    endpoints = {name: _summarize([x for per_client in latencies[name] for x in per_client], sum(errors[name]),
+                                  sum(throttled[name]), sum(shed[name]), args.duration) for name in names}
+    total = _summarize([x for name in names for per_client in latencies[name] for x in per_client],
+                       *(sum(sum(counts[name]) for name in names) for counts in (errors, throttled, shed)), args.duration)
+    report = {
+        'commit': _git_commit(),
+        'server': args.server,
+        'clients': args.clients,
+        'duration_s': args.duration,
+        'provider_latency_ms': args.provider_latency_ms,
+        'mix': mix,
+        'total': total,
+        'endpoints': endpoints,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Resident memory per worker for different model loading strategies
+Forks 1, 4 and 16 worker processes that each score every model, and reports
+RSS, PSS (shared pages split between processes) and USS (private pages) per
+worker while all of them are alive:
+
+  joblib   - each worker joblib.loads its own copy (the old behaviour)
+  mmap     - each worker memory-maps the flattened arrays from models/convert_artifacts.py
+  preload  - the parent loads everything before fork (copy-on-write sharing)
+
+Linux only (reads /proc/self/smaps_rollup).
+Usage: python bench/measure_rss.py --workers 1 4 16
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import heart_model
+
+SAMPLE = [63, 1, 3, 145, 233, 1, 0, 150, 0, 2.3, 0, 0, 1]
+
+
+def memory_kib():
+    usage = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                usage[parts[0][:-1]] = int(parts[1])
+    return {'rss_kib': usage['Rss'], 'pss_kib': usage['Pss'], 'uss_kib': usage['Private_Clean'] + usage['Private_Dirty']}
+
+
+def worker(mode, ready, release, results):
+    if mode != 'preload':
+        heart_model._models.clear()
+        heart_model._scaler = None
+        heart_model.FLAT_MODELS_ENABLED = (mode == 'mmap')
+    for model_name in heart_model.MODEL_PATHS:
+        heart_model.predict_heart_disease_batch([SAMPLE] * 16, model_name)
+    ready.wait()
+    results.put(memory_kib())
+    release.wait()
+
+
+def measure(mode, n_workers):
+    ctx = multiprocessing.get_context('fork')
+    ready = ctx.Barrier(n_workers)
+    release = ctx.Barrier(n_workers + 1)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, ready, release, results)) for _ in range(n_workers)]
+    for p in procs:
+        p.start()
+    samples = [results.get() for _ in range(n_workers)]
+    release.wait()
+    for p in procs:
+        p.join()
+    mean = lambda key: round(sum(s[key] for s in samples) / len(samples) / 1024.0, 1)
+    return {
+        'mode': mode,
+        'workers': n_workers,
+        'rss_mib_per_worker': mean('rss_kib'),
+        'pss_mib_per_worker': mean('pss_kib'),
+        'uss_mib_per_worker': mean('uss_kib'),
+        'pss_mib_total': round(sum(s['pss_kib'] for s in samples) / 1024.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-worker memory for model loading strategies')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--output', help='Write the JSON results to this file as well')
+    args = parser.parse_args()
+
+    modes = ['joblib']
+    if all(heart_model.is_flat_model_dir(os.path.join(heart_model.FLAT_MODEL_DIR, m)) for m in ('random_forest', 'xgboost')):
+        modes.append('mmap')
+    else:
+        print("⚠️  mmap_models/ not found, run models/convert_artifacts.py to include the mmap mode")
+    # preload runs last because it leaves the models loaded in this process
+    modes.append('preload')
+
+    results = []
+    for mode in modes:
+        if mode == 'preload':
+            heart_model.preload_models()
+        for n_workers in args.workers:
+            row = measure(mode, n_workers)
+            results.append(row)
+            print(f"{mode:>8} x{n_workers:<3} RSS {row['rss_mib_per_worker']:7.1f} MiB  PSS {row['pss_mib_per_worker']:7.1f} MiB  USS {row['uss_mib_per_worker']:7.1f} MiB per worker")
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
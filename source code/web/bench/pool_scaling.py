@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Throughput scaling of the out-of-process inference pool
+Runs the same concurrent prediction + PDF workload against InferencePool with
+1, 2, 4 ... processes (up to the CPU count) and reports requests per second.
+
+Usage: python bench/pool_scaling.py --model random_forest --duration 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.heart_model import predict_heart_disease
+from services.inference_pool import InferencePool
+from services.report_service import build_report_pdf
+from batcher_load import random_features
+
+
+def run(pool, model_name, clients, duration, pdf_every):
+    done = [0] * clients
+    stop_at = time.perf_counter() + duration
+
+    def client(idx):
+        rng = random.Random(idx)
+        while time.perf_counter() < stop_at:
+            features = random_features(rng)
+            prediction = pool.call(predict_heart_disease, features, model_name)
+            if pdf_every and done[idx] % pdf_every == 0:
+                pool.call(build_report_pdf, prediction, 'Benchmark reasoning.', ['Benchmark recommendation.'], features)
+            done[idx] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(done) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inference pool throughput vs process count')
+    parser.add_argument('--model', default='random_forest', choices=['logistic', 'random_forest', 'xgboost'])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--pdf-every', type=int, default=5, help='Render a PDF every N predictions (0 disables)')
+    args = parser.parse_args()
+
+    counts = []
+    n = 1
+    while n <= (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+
+    results = []
+    for processes in counts:
+        pool = InferencePool(processes=processes, max_pending=processes * 4, queue_timeout=60)
+        pool.health_check()  # start and warm every worker before timing
+        rps = run(pool, args.model, processes * 4, args.duration, args.pdf_every)
+        pool.shutdown()
+        results.append({'processes': processes, 'throughput_rps': round(rps, 1)})
+        print(f"{processes:>3} processes: {rps:8.1f} req/s")
+
+    print(json.dumps({'model': args.model, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
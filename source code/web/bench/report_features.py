@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Row size and decode speed of report_links features: the repr text that
+download_report_by_id used to parse with ast.literal_eval against the packed
+features_blob of models/feature_codec.py.
+Sizes are the bytes of the value and the size of a SQLite table holding N
+links with only that column; decode times are per row (min of the repeats).
+
+Usage: python bench/report_features.py --rows 100000 --repeat 5
+"""
+
+import argparse
+import ast
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import feature_codec
+
+
+def random_features(rng):
+    # Same ranges as bench/batcher_load.py
+    return [
+        rng.randint(29, 77), rng.randint(0, 1), rng.randint(1, 4), rng.randint(94, 200),
+        rng.randint(126, 564), rng.randint(0, 1), rng.randint(0, 2), rng.randint(71, 202),
+        rng.randint(0, 1), round(rng.uniform(0, 6.2), 1), rng.randint(1, 3), rng.randint(0, 3),
+        rng.choice([3, 6, 7]),
+    ]
+
+
+def table_bytes(values):
+    """Size of a SQLite file holding the values in a report_links-like table"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE report_links (id INTEGER PRIMARY KEY, features)')
+        with conn:
+            conn.executemany('INSERT INTO report_links (features) VALUES (?)', ((v,) for v in values))
+        conn.execute('VACUUM')
+        conn.close()
+        return os.path.getsize(path)
+
+
+def per_row_seconds(fn, n_rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare repr text and packed binary report features')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = [random_features(rng) for _ in range(args.rows)]
+    version = '20250101120000-1a2b3c4d'
+    texts = [str(row) for row in rows]
+    blobs = [feature_codec.encode(row, version) for row in rows]
+
+    results = {
+        'rows': args.rows,
+        'value_bytes': {
+            'repr': sum(len(t.encode()) for t in texts) / args.rows,
+            'blob': sum(len(b) for b in blobs) / args.rows,
+        },
+        'table_bytes_per_row': {
+            'repr': table_bytes(texts) / args.rows,
+            'blob': table_bytes(map(sqlite3.Binary, blobs)) / args.rows,
+        },
+        'decode_us_per_row': {
+            'ast.literal_eval': per_row_seconds(lambda: [ast.literal_eval(t) for t in texts], args.rows, args.repeat) * 1e6,
+            'json.loads': per_row_seconds(lambda: [json.loads(t) for t in texts], args.rows, args.repeat) * 1e6,
+            'struct (decode)': per_row_seconds(lambda: [feature_codec.decode(b) for b in blobs], args.rows, args.repeat) * 1e6,
+            'np.frombuffer (decode_many)': per_row_seconds(lambda: feature_codec.decode_many(blobs), args.rows, args.repeat) * 1e6,
+        },
+    }
+    assert all(feature_codec.decode(b)[0] == row for b, row in zip(blobs[:1000], rows))
+
+    print(f"📦 {args.rows:,} report features")
+    for label, value in results['value_bytes'].items():
+        print(f"  {label:<6} {value:6.1f} bytes/value, {results['table_bytes_per_row'][label]:6.1f} bytes/row in SQLite")
+    for label, value in results['decode_us_per_row'].items():
+        print(f"  {label:<28} {value:8.3f} µs/row")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
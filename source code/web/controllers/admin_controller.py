@@ -1,11 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, Response
 from models.user_model import create_admin, check_admin, get_all_users, delete_user
-from models.heart_model import get_model_performance
+from models.heart_model import model_versions, MODEL_PATHS
+from models import model_store, drift, calibration, user_model
+from models.user_model import get_drift_counts, set_confirmed_outcome
 from models.user_model import get_all_users
 from models.heart_model import get_total_reports
 from .main_controller import get_all_messages
+from .auth_controller import refuse_login
+from services.inference_pool import get_pool, pool_enabled
+from services.profiler import profile, ProfilerBusyError, DEFAULT_INTERVAL
+from services.passwords import HasherBusyError
+from services import model_swap, shadow, jobs, rate_limit, sessions
 import sqlite3
-import os
+import math
+import datetime
 
 admin_blueprint = Blueprint('admin', __name__)
 
@@ -15,10 +23,17 @@ def admin_login():
         data = request.get_json() if request.is_json else request.form
         username = data.get('username', '')
         password = data.get('password', '')
-        
-        # Simple hardcoded admin credentials
-        if username == 'nuha' and password == '123':
-            session['admin_id'] = 1
+        retry_after = rate_limit.login_retry_after(request.remote_addr, 'admin:' + username)
+        if retry_after:
+            return refuse_login('Too many login attempts. Please wait a minute and try again.', retry_after, 'admin_login.html')
+        try:
+            admin_id = check_admin(username, password)
+        except HasherBusyError as e:
+            return refuse_login(str(e), 1, 'admin_login.html', 503)
+        if admin_id:
+            rate_limit.login_succeeded('admin:' + username)
+            sessions.regenerate()
+            session['admin_id'] = admin_id
             session['is_admin'] = True
             if request.is_json:
                 return {'success': True, 'message': 'Admin logged in successfully!'}
@@ -32,15 +47,24 @@ def admin_login():
 
 @admin_blueprint.route('/admin/signup', methods=['GET', 'POST'])
 def admin_signup():
+    # Only an admin can create another admin; the first one comes from
+    # HEARTCARE_ADMIN_USERNAME/PASSWORD or python heartcare.py create-admin
+    if not session.get('is_admin'):
+        return redirect(url_for('admin.admin_login'))
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
         name = request.form['name']
         email = request.form['email']
+        retry_after = rate_limit.signup_retry_after(request.remote_addr)
+        if retry_after:
+            return refuse_login('Too many attempts. Please wait a minute and try again.', retry_after, 'admin_signup.html')
         try:
             create_admin(username, password, name, email)
-            flash('Admin account created! Please log in.', 'success')
-            return redirect(url_for('admin.admin_login'))
+            flash(f'Admin account {username} created!', 'success')
+            return redirect(url_for('admin.admin_dashboard'))
+        except HasherBusyError as e:
+            return refuse_login(str(e), 1, 'admin_signup.html', 503)
         except Exception:
             flash('Admin username or email already exists.', 'danger')
     return render_template('admin_signup.html')
@@ -50,11 +74,23 @@ def admin_dashboard():
     if not session.get('is_admin'):
         return redirect(url_for('admin.admin_login'))
     model_name = request.args.get('model_name', 'logistic')
-    performance = get_model_performance(model_name)
+    # Scoring the UCI data and drawing the charts runs as a background job;
+    # the page shows the last evaluation of the version in service and polls a pending one
+    evaluate_params = {'model_name': model_name, 'version': model_versions().get(model_name)}
+    jobs.ensure_workers()
+    evaluation = jobs.latest('evaluate', evaluate_params)
+    pending_job = None
+    if evaluation is None or request.args.get('refresh'):
+        pending_job = jobs.enqueue('evaluate', evaluate_params, unique=True)
+    performance = evaluation['result'] if evaluation else None
+    evaluated_at = datetime.datetime.fromtimestamp(evaluation['finished_at']).strftime('%Y-%m-%d %H:%M') if evaluation else None
     users = get_all_users()
     user_count = len(users)
     report_count = get_total_reports() if 'get_total_reports' in globals() else 0
-    return render_template('admin_dashboard.html', performance=performance, user_count=user_count, report_count=report_count, model_name=model_name)
+    shadow_status = shadow.status()
+    calibration_summary = calibration.summary(model_name, model_versions().get(model_name))
+    return render_template('admin_dashboard.html', performance=performance, user_count=user_count, report_count=report_count, model_name=model_name, shadow=shadow_status, calibration=calibration_summary,
+                           evaluation=evaluation, evaluated_at=evaluated_at, pending_job=pending_job, recent_jobs=jobs.list_jobs(limit=10))
 
 @admin_blueprint.route('/admin/users')
 def admin_users():
@@ -67,6 +103,7 @@ def admin_users():
 def admin_logout():
     session.pop('admin_id', None)
     session.pop('is_admin', None)
+    sessions.regenerate()
     flash('Logged out from admin panel.', 'info')
     return redirect(url_for('admin.admin_login'))
 
@@ -97,8 +134,7 @@ def api_admin_stats():
     if not session.get('is_admin'):
         return {'error': 'Unauthorized'}, 401
     
-    DB_PATH = os.path.join(os.path.dirname(__file__), '../users.db')
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(user_model.DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -152,4 +188,174 @@ def api_admin_users():
         'name': user['name'],
         'email': user['email'],
         'is_admin': user['is_admin']
-    } for user in users])
\ No newline at end of file
+    } for user in users])
+
+@admin_blueprint.route('/api/admin/records/<int:record_id>/outcome', methods=['POST'])
+def api_admin_record_outcome(record_id):
+    """Store a clinician-confirmed diagnosis for a record: {"outcome": 0 or 1}, null clears it"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    outcome = (request.get_json(silent=True) or {}).get('outcome')
+    if outcome not in (0, 1, None):
+        return {'error': 'outcome must be 0, 1 or null'}, 400
+    if not set_confirmed_outcome(record_id, outcome):
+        return {'error': 'Record not found'}, 404
+    return {'id': record_id, 'confirmed_outcome': outcome}
+
+@admin_blueprint.route('/api/admin/workers', methods=['GET'])
+def api_admin_workers():
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    if not pool_enabled():
+        return {'enabled': False}
+    status = get_pool().health_check()
+    status['enabled'] = True
+    return jsonify(status), (200 if status['healthy'] else 503)
+
+@admin_blueprint.route('/api/admin/models', methods=['GET'])
+def api_admin_models():
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    serving = model_versions()
+    return jsonify({model_name: {
+        'serving_version': serving[model_name],
+        'active_version': model_store.active_version(model_name),
+        'versions': model_store.list_versions(model_name),
+        'swap': model_swap.status(model_name)
+    } for model_name in MODEL_PATHS})
+
+@admin_blueprint.route('/api/admin/models/<model_name>/activate', methods=['POST'])
+def api_admin_activate_model(model_name):
+    """Load a stored version in the background and swap it in: {"version": ...}"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    version = (request.get_json(silent=True) or {}).get('version')
+    if model_name not in MODEL_PATHS:
+        return {'error': 'Unknown model: ' + model_name}, 404
+    if not version:
+        return {'error': 'version is required'}, 400
+    try:
+        model_swap.start(model_name, version)
+    except model_store.ModelStoreError as e:
+        return {'error': str(e)}, 404
+    except model_swap.SwapInProgressError as e:
+        return {'error': str(e)}, 409
+    return jsonify(model_swap.status(model_name)), 202
+
+@admin_blueprint.route('/api/admin/shadow', methods=['GET'])
+def api_admin_shadow():
+    """Shadow candidate agreement and latency deltas over the last ?last=N logged rows"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    try:
+        last = int(request.args.get('last', 100000))
+    except ValueError:
+        return {'error': 'last must be an integer'}, 400
+    return jsonify(shadow.status(last))
+
+@admin_blueprint.route('/api/admin/drift', methods=['GET'])
+def api_admin_drift():
+    """PSI and KS of the incoming features and predictions against the training baseline"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    baseline = drift.load_baseline()
+    if baseline is None:
+        return {'error': 'No drift baseline; build one with python models/drift.py'}, 404
+    features = drift.compare(get_drift_counts(), baseline)
+    return jsonify({
+        'baseline': {key: baseline.get(key) for key in ('source', 'models', 'rows', 'created_at')},
+        'drifted': sorted(name for name, stats in features.items() if stats['status'] == 'significant'),
+        'features': features
+    })
+
+@admin_blueprint.route('/api/admin/calibration', methods=['GET'])
+def api_admin_calibration():
+    """Calibration method, reliability curves and ECE/Brier of the version in service, per model"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    return jsonify({model_name: {'version': version, 'calibration': calibration.summary(model_name, version)}
+                    for model_name, version in model_versions().items()})
+
+@admin_blueprint.route('/admin/calibration/<model_name>.png', methods=['GET'])
+def admin_calibration_plot(model_name):
+    """Reliability plot of the calibration of the version in service"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    if model_name not in MODEL_PATHS:
+        return {'error': 'Unknown model: ' + model_name}, 404
+    png = calibration.reliability_png(model_name, model_versions()[model_name])
+    if png is None:
+        return {'error': f'No calibration for {model_name}; fit one with python heartcare.py calibrate {model_name}'}, 404
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'private, max-age=60'})
+
+@admin_blueprint.route('/api/admin/jobs', methods=['GET'])
+def api_admin_jobs():
+    """Recent background jobs, newest first (?kind=... to filter, ?limit=N)"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return {'error': 'limit must be an integer'}, 400
+    jobs.ensure_workers()
+    return jsonify(jobs.list_jobs(request.args.get('kind'), limit))
+
+@admin_blueprint.route('/api/admin/jobs', methods=['POST'])
+def api_admin_enqueue_job():
+    """Queue a background job: {"kind": "evaluate|export|retrain|notify", "params": {...}}"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    data = request.get_json(silent=True) or {}
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return {'error': 'params must be an object'}, 400
+    jobs.ensure_workers()
+    try:
+        job = jobs.enqueue(data.get('kind'), params)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return jsonify(job), 202
+
+@admin_blueprint.route('/api/admin/jobs/<int:job_id>', methods=['GET'])
+def api_admin_job(job_id):
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    jobs.ensure_workers()
+    job = jobs.get(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    return jsonify(job)
+
+@admin_blueprint.route('/api/admin/jobs/<int:job_id>/cancel', methods=['POST'])
+def api_admin_cancel_job(job_id):
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    job = jobs.cancel(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    if job['state'] in ('succeeded', 'failed'):
+        return {'error': f"Job {job_id} already {job['state']}"}, 409
+    return jsonify(job), 202
+
+@admin_blueprint.route('/admin/profile', methods=['GET'])
+def admin_profile():
+    """Sample all request threads for ?seconds=N and download the stacks in collapsed (flamegraph) format"""
+    if not session.get('is_admin'):
+        return {'error': 'Unauthorized'}, 401
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', DEFAULT_INTERVAL * 1000)) / 1000.0
+    except ValueError:
+        return {'error': 'seconds and interval_ms must be numbers'}, 400
+    if not (math.isfinite(seconds) and math.isfinite(interval)):
+        return {'error': 'seconds and interval_ms must be finite numbers'}, 400
+    try:
+        sampler = profile(seconds, interval)
+    except ProfilerBusyError as e:
+        return {'error': str(e)}, 409
+    print(f"DEBUG: Profile collected {sampler.samples} samples, {len(sampler.stacks)} unique stacks")
+    return Response(sampler.collapsed(), mimetype='text/plain', headers={
+        'Content-Disposition': 'attachment; filename=heartcare_profile.collapsed',
+        'X-Profile-Samples': str(sampler.samples),
+    })
\ No newline at end of file
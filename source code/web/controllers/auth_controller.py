@@ -1,5 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
 from models.user_model import create_user, check_user, init_db, get_user_info
+from services import rate_limit, sessions
+from services.passwords import HasherBusyError
+import math
 
 auth_blueprint = Blueprint('auth', __name__)
 
@@ -8,6 +11,14 @@ auth_blueprint = Blueprint('auth', __name__)
 def setup():
     init_db()
 
+def refuse_login(message, retry_after, template, status=429):
+    """Turn away a login or signup without hashing the password"""
+    headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    if request.is_json:
+        return jsonify({'success': False, 'message': message}), status, headers
+    flash(message, 'danger')
+    return render_template(template), status, headers
+
 @auth_blueprint.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
@@ -51,6 +62,9 @@ def signup():
             flash(error_msg, 'danger')
             return render_template('signup.html')
         
+        retry_after = rate_limit.signup_retry_after(request.remote_addr)
+        if retry_after:
+            return refuse_login('Too many attempts. Please wait a minute and try again.', retry_after, 'signup.html')
         try:
             create_user(username, password, name, email)
             success_msg = 'Account created successfully!'
@@ -58,6 +72,8 @@ def signup():
                 return jsonify({'success': True, 'message': success_msg}), 201
             flash('Account created! Please log in.', 'success')
             return redirect(url_for('auth.login'))
+        except HasherBusyError as e:
+            return refuse_login(str(e), 1, 'signup.html', 503)
         except Exception:
             error_msg = 'Username or email already exists.'
             if request.is_json:
@@ -78,8 +94,17 @@ def login():
             username = request.form['username']
             password = request.form['password']
         
-        user_id = check_user(username, password)
+        # Cheap checks first: a throttled attempt never reaches the password hash
+        retry_after = rate_limit.login_retry_after(request.remote_addr, username)
+        if retry_after:
+            return refuse_login('Too many login attempts. Please wait a minute and try again.', retry_after, 'login.html')
+        try:
+            user_id = check_user(username, password)
+        except HasherBusyError as e:
+            return refuse_login(str(e), 1, 'login.html', 503)
         if user_id:
+            rate_limit.login_succeeded(username)
+            sessions.regenerate()
             session['user_id'] = user_id
             session['username'] = username
             # Fetch and store name/email for navbar dropdown
@@ -111,5 +136,6 @@ def login():
 @auth_blueprint.route('/logout')
 def logout():
     session.clear()
+    sessions.regenerate()
     flash('Logged out.', 'info')
     return redirect(url_for('auth.login'))
@@ -1,28 +1,32 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash, send_file, jsonify
-from models.heart_model import predict_heart_disease
-from models.user_model import save_record, get_records, get_user_info, save_report_link, get_report_by_id, cleanup_expired_reports
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, send_file, jsonify, Response, stream_with_context, g
+from models.batcher import batched_predict_explained
+from models.clinical_rules import explain_batch
+from models.heart_model import MODEL_PATHS
+from models.user_model import save_record, get_records, save_report_link, get_report_by_id, cleanup_expired_reports, report_features
+from models.feature_codec import parse_text as parse_features_text
+from models import screening, user_model
 from math import cos, sin, radians
 import smtplib
 from email.mime.text import MIMEText
 import tempfile
 import requests
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 import io
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle, SimpleDocTemplate, Paragraph, Spacer, Image, HRFlowable
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER
 import os
 import numpy as np
 import sqlite3
 from services.twilio_service import twilio_service
 from services.infobip_service import infobip_service
+from services.inference_pool import predict_batch_versioned, predict_explain_batch_versioned, PoolBusyError
+from services.report_service import build_report_pdf
+from services.async_io import run_io, run_cpu, gather_io
+from services.metrics import span
+from services.sessions import current_user_info
+from services import rate_limit
 import uuid
 import json
 import http.client
 import socket
+import math
 from config import LOCAL_SERVER_HOST, LOCAL_SERVER_PORT, LOCAL_SERVER_PROTOCOL
 
 main_blueprint = Blueprint('main', __name__)
@@ -43,54 +47,94 @@ def create_download_url(report_id):
     network_ip = get_network_ip()
     return f"{LOCAL_SERVER_PROTOCOL}://{network_ip}:{LOCAL_SERVER_PORT}/download_report/{report_id}"
 
+@main_blueprint.app_errorhandler(PoolBusyError)
+def handle_pool_busy(e):
+    # Inference workers are saturated: shed load instead of queueing without bound
+    response = jsonify({'error': 'Server is busy, please retry shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+# Routes that run the models; each request is admitted by rate_limit.admit_prediction
+PREDICTION_ENDPOINTS = ('main.predict', 'main.api_predict_batch', 'main.api_screening')
+
+@main_blueprint.before_request
+def admit_prediction():
+    if request.method != 'POST' or request.endpoint not in PREDICTION_ENDPOINTS:
+        return
+    # A batch is charged one row token per patient. A screening is charged chunk by chunk as it
+    # streams and takes an in-flight slot only while a chunk is scored (see api_screening)
+    rows = 1
+    if request.endpoint == 'main.api_predict_batch':
+        data = request.get_json(silent=True)
+        patients = data.get('patients') if isinstance(data, dict) else None
+        rows = len(patients) if isinstance(patients, list) else 1
+        if rows > rate_limit.MAX_BATCH_ROWS:
+            return jsonify({'error': f'At most {rate_limit.MAX_BATCH_ROWS} patients per batch; use /api/screening for larger files'}), 413
+    elif request.endpoint == 'main.api_screening':
+        rate_limit.admit_prediction(request.remote_addr, session.get('user_id'), 0, slot=False)
+        return
+    rate_limit.admit_prediction(request.remote_addr, session.get('user_id'), rows)
+    g.prediction_admitted = True
+
+@main_blueprint.teardown_request
+def release_prediction(exc):
+    if g.pop('prediction_admitted', False):
+        rate_limit.release_prediction()
+
+def refuse_prediction(message, status, retry_after):
+    headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    if request.endpoint == 'main.predict' and not request.is_json:
+        flash(message, 'danger')
+        return render_template('predict.html', prediction=None, current_page='predict'), status, headers
+    return jsonify({'error': message}), status, headers
+
+@main_blueprint.app_errorhandler(rate_limit.RateLimitedError)
+def handle_rate_limited(e):
+    return refuse_prediction('Too many predictions, please slow down.', 429, e.retry_after)
+
+@main_blueprint.app_errorhandler(rate_limit.OverloadedError)
+def handle_overloaded(e):
+    return refuse_prediction(str(e), 503, 1)
+
 @main_blueprint.route('/')
 def landing():
-    user_info = None
-    if 'user_id' in session:
-        user_info = get_user_info(session['user_id'])
-    return render_template('landing.html', current_page='home', user_info=user_info)
+    return render_template('landing.html', current_page='home', user_info=current_user_info())
 
 def get_reasoning(features, prediction):
-    # Simple example reasoning based on features
-    age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal = features
-    reasons = []
-    if age > 50: reasons.append('Age above 50 is a risk factor.')
-    if chol > 240: reasons.append('High cholesterol level.')
-    if trestbps > 130: reasons.append('Elevated blood pressure.')
-    if exang == 1: reasons.append('Exercise induced angina present.')
-    if oldpeak > 2: reasons.append('Significant ST depression (oldpeak).')
-    if not reasons:
-        reasons.append('No major risk factors detected.')
-    if prediction >= 0.5:
-        summary = 'High risk due to: ' + ', '.join(reasons)
-    else:
-        summary = 'Low risk. ' + ' '.join(reasons)
-    return summary
+    return explain_batch([features], [prediction])[0][0]
 
 def get_recommendations(features, prediction):
-    age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal = features
-    recs = []
-    if prediction >= 0.5:
-        recs.append('Consult a cardiologist for further evaluation.')
-        if chol > 240:
-            recs.append('Consider dietary changes to lower cholesterol.')
-        if trestbps > 130:
-            recs.append('Monitor and manage your blood pressure.')
-        if oldpeak > 2:
-            recs.append('Discuss ST depression findings with your doctor.')
-        recs.append('Maintain regular physical activity and a healthy diet.')
-    else:
-        recs.append('Continue a healthy lifestyle to maintain low risk.')
-        if chol > 200:
-            recs.append('Watch your cholesterol and consider regular checkups.')
-        if trestbps > 120:
-            recs.append('Monitor your blood pressure periodically.')
-    return recs
+    return explain_batch([features], [prediction])[1][0]
 
 def get_reasoning_and_recommendations(features, prediction):
-    reasoning = get_reasoning(features, prediction)
-    recommendations = get_recommendations(features, prediction)
-    return reasoning, recommendations
+    reasonings, recommendations = explain_batch([features], [prediction])
+    return reasonings[0], recommendations[0]
+
+def parse_features(data):
+    """Read the 13 model inputs from a JSON dict or form in the expected order"""
+    return [
+        int(data.get('age')),
+        int(data.get('sex')),
+        int(data.get('cp')),
+        int(data.get('trestbps')),
+        int(data.get('chol')),
+        int(data.get('fbs')),
+        int(data.get('restecg')),
+        int(data.get('thalach')),
+        int(data.get('exang')),
+        float(data.get('oldpeak')),
+        int(data.get('slope')),
+        int(data.get('ca')),
+        int(data.get('thal'))
+    ]
+
+def get_risk_level(prediction):
+    if prediction >= 0.7:
+        return "High"
+    elif prediction >= 0.4:
+        return "Medium"
+    return "Low"
 
 @main_blueprint.route('/predict', methods=['GET', 'POST'])
 def predict():
@@ -99,6 +143,8 @@ def predict():
     reasoning = None
     recommendations = None
     features = None
+    top_features = None
+    model_version = None
     model_name = 'logistic'  # Default to logistic regression
     if request.method == 'POST':
         # Handle JSON requests from React frontend
@@ -106,58 +152,31 @@ def predict():
             data = request.get_json()
             print("DEBUG: Received JSON data:", data)
             model_name = data.get('model_name', 'logistic')
-            features = [
-                int(data.get('age')),
-                int(data.get('sex')),
-                int(data.get('cp')),
-                int(data.get('trestbps')),
-                int(data.get('chol')),
-                int(data.get('fbs')),
-                int(data.get('restecg')),
-                int(data.get('thalach')),
-                int(data.get('exang')),
-                float(data.get('oldpeak')),
-                int(data.get('slope')),
-                int(data.get('ca')),
-                int(data.get('thal'))
-            ]
+            with span('parse_features'):
+                features = parse_features(data)
         else:
             # Handle form data from traditional web forms
             print("DEBUG: Received form data")
             model_name = request.form.get('model_name', 'logistic')
-            features = [
-                int(request.form.get('age')),
-                int(request.form.get('sex')),
-                int(request.form.get('cp')),
-                int(request.form.get('trestbps')),
-                int(request.form.get('chol')),
-                int(request.form.get('fbs')),
-                int(request.form.get('restecg')),
-                int(request.form.get('thalach')),
-                int(request.form.get('exang')),
-                float(request.form.get('oldpeak')),
-                int(request.form.get('slope')),
-                int(request.form.get('ca')),
-                int(request.form.get('thal'))
-            ]
+            with span('parse_features'):
+                features = parse_features(request.form)
         
         print(f"DEBUG: User selected model: {model_name}")
         print("DEBUG: Features:", features)
         
-        prediction = predict_heart_disease(features, model_name)
+        # Attribution runs with the prediction (in the worker when the pool is on), against the same model version
+        with span('inference'):
+            prediction, model_version, explanation = batched_predict_explained(features, model_name)
         if prediction is not None:
             angle = 160 * (prediction if prediction <= 1 else 1)
             x = 130 + 100 * np.cos(np.radians(200 - angle))
             y = 120 - 100 * np.sin(np.radians(200 - angle))
-            reasoning, recommendations = get_reasoning_and_recommendations(features, prediction)
+            with span('reasoning'):
+                reasoning, recommendations = get_reasoning_and_recommendations(features, prediction)
+            top_features = explanation['top_features']
             
             # Determine risk level
-            if prediction >= 0.7:
-                risk_level = "High"
-            elif prediction >= 0.4:
-                risk_level = "Medium"
-            else:
-                risk_level = "Low"
+            risk_level = get_risk_level(prediction)
             
             # Return JSON response for React frontend
             if request.is_json:
@@ -166,90 +185,123 @@ def predict():
                     'confidence': prediction * 100,
                     'risk_level': risk_level,
                     'reasoning': reasoning,
-                    'recommendations': '. '.join(recommendations) if isinstance(recommendations, list) else recommendations
+                    'recommendations': '. '.join(recommendations) if isinstance(recommendations, list) else recommendations,
+                    'top_features': top_features,
+                    'model_version': model_version
                 })
         
         if 'user_id' in session:
-            save_record(session['user_id'], features, prediction)
+            with span('save_record'):
+                save_record(session['user_id'], features, prediction, model_version, model_name)
         
         # Return HTML template for traditional web forms
-        return render_template('predict.html', prediction=prediction, x=x, y=y, reasoning=reasoning, recommendations=recommendations, features=features, model_name=model_name, current_page='predict')
-    
-    return render_template('predict.html', prediction=prediction, x=x, y=y, reasoning=reasoning, recommendations=recommendations, features=features, model_name=model_name, current_page='predict')
+        return render_template('predict.html', prediction=prediction, x=x, y=y, reasoning=reasoning, recommendations=recommendations, features=features, top_features=top_features, model_name=model_name, model_version=model_version, current_page='predict')
+    
+    return render_template('predict.html', prediction=prediction, x=x, y=y, reasoning=reasoning, recommendations=recommendations, features=features, top_features=top_features, model_name=model_name, current_page='predict')
+
+@main_blueprint.route('/api/predict/batch', methods=['POST'])
+def api_predict_batch():
+    """Score a list of patients in one call: {"model_name": ..., "patients": [{...}, ...]}"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with "patients"'}), 400
+    model_name = data.get('model_name', 'logistic')
+    if model_name not in MODEL_PATHS:
+        return jsonify({'error': f'Unknown model: {model_name}'}), 400
+    patients = data.get('patients', [])
+    if not isinstance(patients, list) or not all(isinstance(patient, dict) for patient in patients):
+        return jsonify({'error': '"patients" must be a list of objects'}), 400
+    try:
+        rows = [parse_features(patient) for patient in patients]
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid patient data: {e}'}), 400
+    
+    predictions, model_version, explanations = predict_explain_batch_versioned(rows, model_name)
+    reasonings, recommendations = explain_batch(rows, predictions)
+    return jsonify({'model_version': model_version, 'results': [{
+        'prediction': 'High Risk' if p >= 0.5 else 'Low Risk',
+        'confidence': float(p) * 100,
+        'risk_level': get_risk_level(p),
+        'reasoning': reasoning,
+        'recommendations': '. '.join(recs),
+        'top_features': explanation['top_features']
+    } for p, reasoning, recs, explanation in zip(predictions, reasonings, recommendations, explanations)]})
+
+@main_blueprint.route('/api/screening', methods=['POST'])
+def api_screening():
+    """
+    Screen a CSV of patients (a multipart 'file' upload or a text/csv body) and
+    stream back the results as CSV; scored rows are saved to the user's records
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Please log in to screen patients'}), 401
+    model_name = request.args.get('model_name') or request.form.get('model_name') or 'logistic'
+    if model_name not in ('logistic', 'random_forest', 'xgboost'):
+        return jsonify({'error': 'Unknown model: ' + model_name}), 400
+    upload = request.files.get('file')
+    source = request.stream
+    if upload:
+        # The request closes its files when the view returns, before the response
+        # is streamed; keep the spooled upload for the generator to close
+        source, upload.stream = upload.stream, io.BytesIO()
+    try:
+        chunks = screening.read_chunks(source)
+    except screening.ScreeningError as e:
+        source.close()
+        return jsonify({'error': str(e)}), 400
+    user_id = session['user_id']
+    ip = request.remote_addr
+    
+    def predict(rows, model_name):
+        rate_limit.throttle_rows(ip, user_id, len(rows))
+        # A slot per chunk, so a client reading the CSV slowly does not hold one
+        with rate_limit.scoring_slot():
+            return predict_batch_versioned(rows, model_name)
+    
+    def generate():
+        summary = {}
+        try:
+            yield from screening.screen(chunks, predict, model_name, user_id, summary)
+        except Exception as e:
+            # The status is already sent, so a bad chunk, a rate limit, a busy pool or a
+            # model error mid-stream all end the file with the reason it stopped
+            if not isinstance(e, screening.ScreeningError):
+                print(f"DEBUG SCREENING: stopped by {type(e).__name__}: {e}")
+            yield f"# Stopped after row {summary.get('rows', 0)}: {e}\n"
+        finally:
+            source.close()
+        print(f"DEBUG SCREENING: {summary}")
+    
+    return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+        'Content-Disposition': 'attachment; filename=heartcare_screening.csv'
+    })
 
 @main_blueprint.route('/download_report', methods=['POST'])
-def download_report():
+async def download_report():
     import ast
     features = request.form.get('features')
     prediction = request.form.get('prediction')
     reasoning = request.form.get('reasoning')
     recommendations = request.form.get('recommendations')
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
-    elements = []
-    styles = getSampleStyleSheet()
-    # Custom styles
-    title_style = ParagraphStyle('title', parent=styles['Title'], alignment=TA_CENTER, textColor=colors.HexColor('#c0392b'), fontSize=22, spaceAfter=12)
-    section_header = ParagraphStyle('section', parent=styles['Heading2'], textColor=colors.HexColor('#c0392b'), spaceBefore=12, spaceAfter=6)
-    normal_bold = ParagraphStyle('bold', parent=styles['Normal'], fontName='Helvetica-Bold')
-    # Header with logo and title
-    logo_path = os.path.join(os.path.dirname(__file__), '../../web/static/images/doctor.png')
-    if os.path.exists(logo_path):
-        elements.append(Image(logo_path, width=1.1*inch, height=1.1*inch))
-    elements.append(Paragraph('Heart Care+ - Heart Disease Prediction Report', title_style))
-    elements.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#c0392b')))
-    elements.append(Spacer(1, 10))
-    # Prediction section
-    pred_text = f'<b>Prediction:</b> <font color="#c0392b">{"High Risk" if float(prediction) >= 0.5 else "Low Risk"}</font>'
-    elements.append(Paragraph(pred_text, section_header))
-    elements.append(Spacer(1, 6))
-    # Reasoning
-    elements.append(Paragraph('<b>Reasoning:</b>', normal_bold))
-    elements.append(Paragraph(reasoning, styles['Normal']))
-    elements.append(Spacer(1, 8))
-    # Recommendations
-    if recommendations:
-        try:
-            recs = ast.literal_eval(recommendations)
-            elements.append(Paragraph('<b>Recommendations:</b>', normal_bold))
-            for rec in recs:
-                elements.append(Paragraph(f'- {rec}', styles['Normal']))
-            elements.append(Spacer(1, 8))
-        except Exception:
-            elements.append(Paragraph(f'<b>Recommendations:</b> {recommendations}', styles['Normal']))
-    elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#c0392b')))
-    elements.append(Spacer(1, 10))
-    # Features table
     try:
-        features_list = ast.literal_eval(features)
-        feature_names = ['Age', 'Sex', 'CP', 'BP', 'Chol', 'FBS', 'ECG', 'Thalach', 'Exang', 'Oldpeak', 'Slope', 'CA', 'Thal']
-        table_data = [['Feature', 'Value']]
-        for name, value in zip(feature_names, features_list):
-            table_data.append([name, value])
-        t = Table(table_data, hAlign='LEFT', colWidths=[2*inch, 2.5*inch])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#c0392b')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 8),
-            ('BACKGROUND', (0,1), (-1,-1), colors.whitesmoke),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-        ]))
-        elements.append(Paragraph('Input Features', section_header))
-        elements.append(t)
+        top_features = json.loads(request.form.get('top_features') or 'null')
+    except ValueError:
+        top_features = None
+    # Fall back to the raw strings when the hidden fields cannot be parsed
+    try:
+        recommendations = ast.literal_eval(recommendations) if recommendations else recommendations
     except Exception:
-        elements.append(Paragraph(f'<b>Features:</b> {features}', styles['Normal']))
-    # Footer
-    elements.append(Spacer(1, 24))
-    elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#c0392b')))
-    elements.append(Paragraph('<font size=10 color="#888">Generated by Heart Care+ | For informational purposes only</font>', styles['Normal']))
-    doc.build(elements)
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name='heart_care_report.pdf', mimetype='application/pdf')
+        pass
+    try:
+        features = parse_features_text(features)
+    except Exception:
+        pass
+    with span('pdf_render'):
+        pdf_bytes = await run_cpu(build_report_pdf, prediction, reasoning, recommendations, features, top_features)
+    return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name='heart_care_report.pdf', mimetype='application/pdf')
 
 @main_blueprint.route('/send_report_email', methods=['POST'])
-def send_report_email():
+async def send_report_email():
     email = request.form.get('email')
     prediction = request.form.get('prediction')
     reasoning = request.form.get('reasoning')
@@ -266,7 +318,7 @@ Best regards,
 Heart Care+ Team
     """
     
-    result = twilio_service.send_email(email, subject, message_body)
+    result = await run_io(twilio_service.send_email, email, subject, message_body)
     
     if result['success']:
         flash('Report sent to your email successfully!', 'success')
@@ -276,7 +328,7 @@ Heart Care+ Team
     return redirect(url_for('main.predict'))
 
 @main_blueprint.route('/send_report_sms', methods=['POST'])
-def send_report_sms():
+async def send_report_sms():
     if 'user_id' not in session:
         flash('Please log in to send SMS messages.', 'warning')
         return redirect(url_for('main.predict'))
@@ -295,13 +347,15 @@ def send_report_sms():
     report_id = str(uuid.uuid4())
     
     # Save report to database
-    save_report_link(
+    await run_io(
+        save_report_link,
         session['user_id'], 
         report_id, 
         prediction, 
         reasoning, 
         recommendations, 
-        features
+        features,
+        model_version=request.form.get('model_version')
     )
     
     print(f"DEBUG SMS: Saved report with ID: {report_id}")
@@ -316,7 +370,7 @@ def send_report_sms():
     # Create SMS message with download link
     message = f"Heart Care+: Your report is ready! Download: {download_url} (expires in 24h)"
     
-    result = infobip_service.send_sms(phone, message)
+    result = await run_io(infobip_service.send_sms, phone, message)
     
     if result['success']:
         flash('SMS sent successfully with download link via Infobip!', 'success')
@@ -326,10 +380,10 @@ def send_report_sms():
     return redirect(url_for('main.predict'))
 
 @main_blueprint.route('/records')
-def records():
+async def records():
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
-    records = get_records(session['user_id'])
+    records = await run_io(get_records, session['user_id'])
     return render_template('records.html', records=records, current_page='records')
 
 @main_blueprint.route('/about')
@@ -341,8 +395,7 @@ def how_to_use():
     return render_template('how_to_use.html', current_page='how-to-use')
 
 def get_all_messages():
-    DB_PATH = os.path.join(os.path.dirname(__file__), '../users.db')
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(user_model.DB_PATH)
     c = conn.cursor()
     c.execute('SELECT id, name, email, message, created_at FROM messages ORDER BY created_at DESC')
     messages = c.fetchall()
@@ -354,8 +407,7 @@ def contact():
     name = request.form.get('name')
     email = request.form.get('email')
     message = request.form.get('message')
-    DB_PATH = os.path.join(os.path.dirname(__file__), '../users.db')
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(user_model.DB_PATH)
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS messages (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -370,8 +422,30 @@ def contact():
     flash('Your message has been sent! Thank you for contacting us.', 'success')
     return redirect(url_for('main.about'))
 
+def send_whatsapp_report_with_fallback(whatsapp, prediction, reasoning, download_url, risk_level):
+    """WhatsApp report via template, falling back to formatted text if the template is missing"""
+    result = infobip_service.send_whatsapp_report(
+        whatsapp, 
+        prediction, 
+        reasoning, 
+        download_url, 
+        risk_level
+    )
+    
+    # If template fails, try text method as fallback
+    if not result['success'] and '404' in result.get('error', ''):
+        print(f"Template method failed, trying text method: {result['error']}")
+        result = infobip_service.send_whatsapp_formatted_text(
+            whatsapp, 
+            prediction, 
+            reasoning, 
+            download_url, 
+            risk_level
+        )
+    return result
+
 @main_blueprint.route('/send_report_link', methods=['POST'])
-def send_report_link():
+async def send_report_link():
     if 'user_id' not in session:
         flash('Please log in to send report links.', 'warning')
         return redirect(url_for('main.predict'))
@@ -388,13 +462,15 @@ def send_report_link():
     report_id = str(uuid.uuid4())
     
     # Save report to database
-    save_report_link(
+    await run_io(
+        save_report_link,
         session['user_id'], 
         report_id, 
         prediction, 
         reasoning, 
         recommendations, 
-        features
+        features,
+        model_version=request.form.get('model_version')
     )
     
     print(f"DEBUG WHATSAPP: Saved report with ID: {report_id}")
@@ -408,7 +484,8 @@ def send_report_link():
     
     success_count = 0
     
-    # Send email if provided
+    # Send to every provided channel concurrently; flash results in channel order
+    sends = []
     if email:
         subject = 'Your Heart Disease Prediction Report - Download Link'
         message_body = f"""
@@ -425,51 +502,32 @@ This report is for informational purposes only. Please consult with a healthcare
 Best regards,
 Heart Care+ Team
         """
-        
-        result = twilio_service.send_email(email, subject, message_body)
-        if result['success']:
-            success_count += 1
-            flash('Download link sent to your email!', 'success')
-        else:
-            flash(f'Failed to send email: {result["error"]}', 'danger')
+        sends.append(('email', (twilio_service.send_email, email, subject, message_body)))
     
-    # Send SMS if provided
     if phone:
         message = f"Heart Care+: Your report is ready! Download: {download_url} (expires in 24h)"
-        
-        result = infobip_service.send_sms(phone, message)
-        if result['success']:
-            success_count += 1
-            flash('Download link sent to your phone via Infobip SMS!', 'success')
-        else:
-            flash(f'Failed to send SMS: {result["error"]}', 'danger')
+        sends.append(('sms', (infobip_service.send_sms, phone, message)))
     
-    # Send WhatsApp if provided
     if whatsapp:
-        # Use the simple WhatsApp report method
         risk_level = 'High Risk' if float(prediction) >= 0.5 else 'Low Risk'
-        
-        # Try template method first
-        result = infobip_service.send_whatsapp_report(
-            whatsapp, 
-            prediction, 
-            reasoning, 
-            download_url, 
-            risk_level
-        )
-        
-        # If template fails, try text method as fallback
-        if not result['success'] and '404' in result.get('error', ''):
-            print(f"Template method failed, trying text method: {result['error']}")
-            result = infobip_service.send_whatsapp_formatted_text(
-                whatsapp, 
-                prediction, 
-                reasoning, 
-                download_url, 
-                risk_level
-            )
-        
-        if result['success']:
+        sends.append(('whatsapp', (send_whatsapp_report_with_fallback, whatsapp, prediction, reasoning, download_url, risk_level)))
+    
+    results = await gather_io(*(call for _, call in sends))
+    
+    for (channel, _), result in zip(sends, results):
+        if channel == 'email':
+            if result['success']:
+                success_count += 1
+                flash('Download link sent to your email!', 'success')
+            else:
+                flash(f'Failed to send email: {result["error"]}', 'danger')
+        elif channel == 'sms':
+            if result['success']:
+                success_count += 1
+                flash('Download link sent to your phone via Infobip SMS!', 'success')
+            else:
+                flash(f'Failed to send SMS: {result["error"]}', 'danger')
+        elif result['success']:
             success_count += 1
             message_type = result.get('type', 'message')
             flash(f'WhatsApp message sent with download link! ({message_type})', 'success')
@@ -482,7 +540,7 @@ Heart Care+ Team
     return redirect(url_for('main.predict'))
 
 @main_blueprint.route('/send_whatsapp', methods=['POST'])
-def send_whatsapp():
+async def send_whatsapp():
     if 'user_id' not in session:
         flash('Please log in to send WhatsApp messages.', 'warning')
         return redirect(url_for('main.predict'))
@@ -501,13 +559,15 @@ def send_whatsapp():
     report_id = str(uuid.uuid4())
     
     # Save report to database
-    save_report_link(
+    await run_io(
+        save_report_link,
         session['user_id'], 
         report_id, 
         prediction, 
         reasoning, 
         recommendations, 
-        features
+        features,
+        model_version=request.form.get('model_version')
     )
     
     print(f"DEBUG WHATSAPP: Saved report with ID: {report_id}")
@@ -523,12 +583,13 @@ def send_whatsapp():
     simple_message = f"Here is your report download here: {download_url}"
     
     # Try template method first
-    result = infobip_service.send_whatsapp(phone, simple_message)
+    result = await run_io(infobip_service.send_whatsapp, phone, simple_message)
     
     # If template fails, try text method as fallback
     if not result['success'] and '404' in result.get('error', ''):
         print(f"Template method failed, trying text method: {result['error']}")
-        result = infobip_service.send_whatsapp_formatted_text(
+        result = await run_io(
+            infobip_service.send_whatsapp_formatted_text,
             phone, 
             prediction, 
             reasoning, 
@@ -544,7 +605,7 @@ def send_whatsapp():
     return redirect(url_for('main.predict'))
 
 @main_blueprint.route('/send_report_email_link', methods=['POST'])
-def send_report_email_link():
+async def send_report_email_link():
     if 'user_id' not in session:
         flash('Please log in to send email reports.', 'warning')
         return redirect(url_for('main.predict'))
@@ -569,13 +630,15 @@ def send_report_email_link():
     print(f"DEBUG EMAIL: Generated report ID: {report_id}")
     
     # Save report to database (same as WhatsApp method)
-    save_report_link(
+    await run_io(
+        save_report_link,
         session['user_id'], 
         report_id, 
         prediction, 
         reasoning, 
         recommendations, 
-        features
+        features,
+        model_version=request.form.get('model_version')
     )
     print(f"DEBUG EMAIL: Report saved to database")
     
@@ -612,7 +675,7 @@ Heart Care+ Team
     print(f"DEBUG EMAIL: Message preview: {message_body[:200]}...")
     
     # Send email
-    result = twilio_service.send_email(email, subject, message_body)
+    result = await run_io(twilio_service.send_email, email, subject, message_body)
     print(f"DEBUG EMAIL: Send result: {result}")
     
     if result['success']:
@@ -623,19 +686,19 @@ Heart Care+ Team
     return redirect(url_for('main.predict'))
 
 @main_blueprint.route('/download_report/<report_id>')
-def download_report_by_id(report_id):
+async def download_report_by_id(report_id):
     # Clean up expired reports
-    cleanup_expired_reports()
+    await run_io(cleanup_expired_reports)
     
     # Get report from database
-    report = get_report_by_id(report_id)
+    with span('report_lookup'):
+        report = await run_io(get_report_by_id, report_id)
     
     print(f"DEBUG DOWNLOAD: Report ID: {report_id}")
     print(f"DEBUG DOWNLOAD: Report found: {report is not None}")
     if report:
         print(f"DEBUG DOWNLOAD: Prediction: {report['prediction']}")
         print(f"DEBUG DOWNLOAD: Reasoning: {report['reasoning']}")
-        print(f"DEBUG DOWNLOAD: Features: {report['features']}")
         print(f"DEBUG DOWNLOAD: Recommendations: {report['recommendations']}")
     
     if not report:
@@ -645,9 +708,9 @@ def download_report_by_id(report_id):
     # Parse stored data
     import ast
     try:
-        features = ast.literal_eval(report['features']) if report['features'] else []
+        features, model_version = report_features(report)
         recommendations = ast.literal_eval(report['recommendations']) if report['recommendations'] else []
-        print(f"DEBUG DOWNLOAD: Parsed features: {features}")
+        print(f"DEBUG DOWNLOAD: Parsed features: {features} (model version: {model_version})")
         print(f"DEBUG DOWNLOAD: Parsed recommendations: {recommendations}")
     except Exception as e:
         print(f"DEBUG DOWNLOAD: Error parsing data: {e}")
@@ -655,72 +718,10 @@ def download_report_by_id(report_id):
         recommendations = []
     
     # Generate PDF report
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle('title', parent=styles['Title'], alignment=TA_CENTER, textColor=colors.HexColor('#c0392b'), fontSize=22, spaceAfter=12)
-    section_header = ParagraphStyle('section', parent=styles['Heading2'], textColor=colors.HexColor('#c0392b'), spaceBefore=12, spaceAfter=6)
-    normal_bold = ParagraphStyle('bold', parent=styles['Normal'], fontName='Helvetica-Bold')
-    
-    # Header
-    logo_path = os.path.join(os.path.dirname(__file__), '../static/images/doctor.png')
-    if os.path.exists(logo_path):
-        elements.append(Image(logo_path, width=1.1*inch, height=1.1*inch))
-    elements.append(Paragraph('Heart Care+ - Heart Disease Prediction Report', title_style))
-    elements.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#c0392b')))
-    elements.append(Spacer(1, 10))
-    
-    # Prediction section
-    pred_text = f'<b>Prediction:</b> <font color="#c0392b">{"High Risk" if float(report["prediction"]) >= 0.5 else "Low Risk"}</font>'
-    elements.append(Paragraph(pred_text, section_header))
-    elements.append(Spacer(1, 6))
-    
-    # Reasoning
-    elements.append(Paragraph('<b>Reasoning:</b>', normal_bold))
-    elements.append(Paragraph(report['reasoning'], styles['Normal']))
-    elements.append(Spacer(1, 8))
-    
-    # Recommendations
-    if recommendations:
-        elements.append(Paragraph('<b>Recommendations:</b>', normal_bold))
-        for rec in recommendations:
-            elements.append(Paragraph(f'- {rec}', styles['Normal']))
-        elements.append(Spacer(1, 8))
-    
-    elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#c0392b')))
-    elements.append(Spacer(1, 10))
-    
-    # Features table
-    if features:
-        feature_names = ['Age', 'Sex', 'CP', 'BP', 'Chol', 'FBS', 'ECG', 'Thalach', 'Exang', 'Oldpeak', 'Slope', 'CA', 'Thal']
-        table_data = [['Feature', 'Value']]
-        for name, value in zip(feature_names, features):
-            table_data.append([name, value])
-        t = Table(table_data, hAlign='LEFT', colWidths=[2*inch, 2.5*inch])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#c0392b')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 8),
-            ('BACKGROUND', (0,1), (-1,-1), colors.whitesmoke),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-        ]))
-        elements.append(Paragraph('Input Features', section_header))
-        elements.append(t)
-    
-    # Footer
-    elements.append(Spacer(1, 24))
-    elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#c0392b')))
-    elements.append(Paragraph('<font size=10 color="#888">Generated by Heart Care+ | For informational purposes only</font>', styles['Normal']))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return send_file(buffer, as_attachment=True, download_name=f'heart_care_report_{report_id[:8]}.pdf', mimetype='application/pdf')
+    with span('pdf_render'):
+        pdf_bytes = await run_cpu(build_report_pdf, report['prediction'], report['reasoning'], recommendations, features)
+    
+    return send_file(io.BytesIO(pdf_bytes), as_attachment=True, download_name=f'heart_care_report_{report_id[:8]}.pdf', mimetype='application/pdf')
 
 @main_blueprint.route('/test_email_download', methods=['POST'])
 def test_email_download():
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+HeartCare+ command line
+
+    python heartcare.py serve [--workers N] [--threads N] [--bind HOST:PORT]
+    python heartcare.py models publish MODEL_NAME ARTIFACT [--scaler PATH] [--version V]
+    python heartcare.py models list
+    python heartcare.py models activate MODEL_NAME VERSION
+    python heartcare.py train [--data uci|FILE.csv] [--include-records] [--activate]
+    python heartcare.py tune MODEL_NAME [--strategy halving|random] [--trials N] [--export]
+    python heartcare.py calibrate MODEL_NAME [--method isotonic|platt] [--version V]
+    python heartcare.py export OUTPUT_DIR [--format parquet|arrow] [--incremental]
+    python heartcare.py screen PATIENTS.csv [--output RESULTS.csv] [--model NAME] [--user-id ID]
+    python heartcare.py jobs work|list|enqueue KIND [PARAMS_JSON]|cancel ID
+    python heartcare.py create-admin USERNAME [--name NAME] [--email EMAIL]
+
+serve runs the app under gunicorn with preload_app: models are loaded once in
+the master and shared copy-on-write by the forked workers. When a model
+artifact changes on disk the master reloads the models and replaces the
+workers one by one (the same as `kill -HUP <master pid>`), so requests keep
+being served during the swap.
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_workers():
+    # Prediction and PDF rendering are CPU-bound: one worker per core
+    return int(os.environ.get('HEARTCARE_WORKERS', str(os.cpu_count() or 1)))
+
+
+def default_threads():
+    # Extra threads per worker cover requests waiting on SQLite, SMTP and Infobip
+    return int(os.environ.get('HEARTCARE_THREADS', '4'))
+
+
+def _artifact_paths():
+    from models.heart_model import MODEL_PATHS, SCALER_PATH, FLAT_MODEL_DIR
+    from models.model_store import active_pointer_paths
+    from models.calibration import CALIBRATION_DIR
+    # An ACTIVE pointer changes when a version is activated in one worker;
+    # the reload brings every other worker onto it
+    paths = list(MODEL_PATHS.values()) + [SCALER_PATH] + active_pointer_paths(MODEL_PATHS)
+    for directory in (FLAT_MODEL_DIR, CALIBRATION_DIR):
+        for root, _, files in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in files)
+    return paths
+
+
+def _snapshot():
+    state = {}
+    for path in _artifact_paths():
+        try:
+            st = os.stat(path)
+            state[path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+    return state
+
+
+class ArtifactWatcher(threading.Thread):
+    """
+    Polls the model artifacts and sends SIGHUP to the gunicorn master when
+    they change. A change is only acted on once the files have stopped
+    changing for one poll interval, so a copy in progress is not loaded.
+    Flattened trees of replaced artifacts are converted again before the signal.
+    """
+
+    def __init__(self, interval=2.0):
+        super().__init__(name='artifact-watcher', daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        current = _snapshot()
+        while not self._stop_event.wait(self.interval):
+            latest = _snapshot()
+            if latest == current:
+                continue
+            # Wait for the writer to finish
+            while not self._stop_event.wait(self.interval):
+                settled = _snapshot()
+                if settled == latest:
+                    break
+                latest = settled
+            # Flattened trees of a replaced artifact would be ignored; convert them again first
+            convert = subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'convert_artifacts.py'),
+                                      '--stale-only'])
+            if convert.returncode:
+                print("⚠️  Could not convert the new tree artifacts, the workers will load the joblib files")
+            # The conversion's own writes are part of this change
+            current = _snapshot()
+            print("🔄 Model artifacts changed, reloading workers")
+            os.kill(os.getpid(), signal.SIGHUP)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def cmd_serve(args):
+    from gunicorn.app.base import BaseApplication
+    from models.heart_model import preload_models, reload_models
+
+    def when_ready(server):
+        if args.watch_interval > 0:
+            server.artifact_watcher = ArtifactWatcher(args.watch_interval)
+            server.artifact_watcher.start()
+
+    def on_reload(server):
+        # Runs in the master before the new workers are forked
+        try:
+            reload_models()
+        except Exception as e:
+            server.log.error("Model reload failed, keeping the previous models: %s", e)
+
+    def on_exit(server):
+        watcher = getattr(server, 'artifact_watcher', None)
+        if watcher is not None:
+            watcher.stop()
+
+    class HeartCareApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            preload_models()
+            return app
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread' if args.threads > 1 else 'sync',
+        'preload_app': True,
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        'keepalive': 5,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'when_ready': when_ready,
+        'on_reload': on_reload,
+        'on_exit': on_exit,
+    }
+    print(f"🚀 Serving HeartCare+ on {args.bind} with {args.workers} workers x {args.threads} threads")
+    HeartCareApplication(options).run()
+
+
+def cmd_models(args):
+    import json
+    from models import model_store
+    from models.heart_model import MODEL_PATHS
+
+    if args.action == 'publish':
+        manifest = model_store.publish(args.model_name, args.artifact, args.scaler, args.version)
+        print(f"📦 Published {args.model_name} version {manifest['version']}")
+    elif args.action == 'list':
+        for model_name in MODEL_PATHS:
+            active = model_store.active_version(model_name)
+            print(f"{model_name} (active: {active or 'builtin'})")
+            for manifest in model_store.list_versions(model_name):
+                print(f"  {manifest['version']}  {manifest['created_at']}  {json.dumps(manifest['metadata'])}")
+    elif args.action == 'activate':
+        # Verify before pointing servers at it; a running `serve` picks the change up
+        model_store.verify(args.model_name, args.version)
+        model_store.set_active(args.model_name, args.version)
+        print(f"✅ {args.model_name} version {args.version} is now active")
+
+
+def cmd_train(args):
+    from models import model_store, training
+
+    start = time.perf_counter()
+    X, y, columns = training.load_design_matrix(args.data, args.include_records, args.chunk_size, use_cache=not args.no_cache)
+    training.check_columns(columns)
+    print(f"📊 Design matrix: {X.shape[0]:,} rows x {X.shape[1]} columns, {int(y.sum()):,} positive ({time.perf_counter() - start:.1f}s)")
+    if len(set(y.tolist())) < 2:
+        sys.exit("❌ Training data needs both outcomes")
+    results = training.train(X, y, columns, args.models, args.n_jobs)
+    manifests = training.publish(results, columns, args.data, args.version)
+    for model_name, manifest in manifests.items():
+        print(f"📦 Published {model_name} version {manifest['version']}")
+        if args.activate:
+            model_store.set_active(model_name, manifest['version'])
+            print(f"✅ {model_name} version {manifest['version']} is now active")
+
+
+def cmd_tune(args):
+    from models import model_store, training, tuning
+
+    X, y, columns = training.load_design_matrix(args.data, args.include_records, args.chunk_size)
+    training.check_columns(columns)
+    search = tuning.Search(X, y, args.model_name, args.strategy, args.trials, args.eta, args.min_fraction,
+                           args.workers, args.seed, args.study, args.db)
+    print(f"🔄 Study {search.study}: {args.trials} {args.model_name} configs, {args.strategy}, {search.workers} workers")
+    best = search.run()
+    if best is None:
+        sys.exit("❌ No trial finished")
+    print(f"🏆 Best ROC AUC {best['score']:.4f} ± {best['score_std']:.4f}: {best['params']}")
+    if args.export:
+        manifest = tuning.export_best(X, y, columns, best, args.data, args.version)
+        print(f"📦 Published {args.model_name} version {manifest['version']}")
+        if args.activate:
+            model_store.set_active(args.model_name, manifest['version'])
+            print(f"✅ {args.model_name} version {manifest['version']} is now active")
+
+
+def cmd_calibrate(args):
+    from models import calibration, model_store, training
+
+    version = args.version or model_store.active_version(args.model_name) or 'builtin'
+    X, y, columns = training.load_design_matrix(args.data, args.include_records, args.chunk_size)
+    training.check_columns(columns)
+    try:
+        scores, labels = calibration.holdout_scores(args.model_name, version, X, y, columns, args.data)
+        result = calibration.fit(args.model_name, version, scores, labels, args.method, args.data)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+    print(f"📈 {args.model_name} ({version}) {args.method} calibration on {result['rows']:,} held-out rows: "
+          f"ECE {result['ece']['raw']:.4f} -> {result['ece']['calibrated']:.4f} ({result['crossfit_folds']}-fold cross-fitted), "
+          f"Brier {result['brier']['raw']:.4f} -> {result['brier']['calibrated']:.4f}")
+    print(f"✅ Lookup table ({len(result['x'])} knots) written to {os.path.abspath(calibration.table_path(args.model_name, version))}")
+
+
+def cmd_export(args):
+    from models import analytics_export
+
+    start = time.perf_counter()
+    try:
+        partition = analytics_export.export_records(args.db, args.output_dir, args.format, args.incremental,
+                                                    args.chunk_size, args.rows_per_file)
+    except analytics_export.ExportError as e:
+        sys.exit(f"❌ {e}")
+    if partition is None:
+        print("✅ No new records to export")
+        return
+    print(f"📦 Exported {partition['rows']:,} records (ids {partition['first_id']}-{partition['last_id']}) to "
+          f"{os.path.join(args.output_dir, partition['name'])} in {time.perf_counter() - start:.1f}s")
+
+
+def cmd_screen(args):
+    from models import screening
+    from models.heart_model import predict_heart_disease_batch_versioned
+
+    start = time.perf_counter()
+    summary = {}
+    try:
+        chunks = screening.read_chunks(args.input, args.chunk_size)
+        output = args.output or os.path.splitext(args.input)[0] + '_screened.csv'
+        with open(output, 'w', newline='') as out:
+            for text in screening.screen(chunks, predict_heart_disease_batch_versioned, args.model, args.user_id, summary):
+                out.write(text)
+    except (screening.ScreeningError, OSError) as e:
+        sys.exit(f"❌ {e}")
+    print(f"🩺 Screened {summary['rows']:,} rows in {time.perf_counter() - start:.1f}s: {summary['scored']:,} scored "
+          f"({summary['high_risk']:,} high risk), {summary['invalid']:,} invalid")
+    print(f"✅ Results written to {output}")
+
+
+def cmd_jobs(args):
+    import json
+    from services import jobs
+
+    if args.action == 'work':
+        kinds = args.kinds.split(',') if args.kinds else jobs.kinds()
+        workers = jobs.ensure_workers(args.workers, kinds)
+        print(f"🔄 Running {len(workers)} job workers for {', '.join(kinds)} on {os.path.abspath(jobs.JOBS_DB_PATH)} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.stop()
+    elif args.action == 'list':
+        for job in jobs.list_jobs(args.kind, args.limit):
+            progress = f"{job['progress'] * 100:.0f}%" if job['progress'] is not None else '-'
+            print(f"{job['id']:>6}  {job['kind']:<10} {job['state']:<10} {progress:>5}  {job['error'] or job['message'] or ''}")
+    elif args.action == 'enqueue':
+        try:
+            params = json.loads(args.params)
+            if not isinstance(params, dict):
+                raise ValueError('PARAMS_JSON must be a JSON object')
+            job = jobs.enqueue(args.kind, params)
+        except ValueError as e:
+            sys.exit(f"❌ {e}")
+        print(f"✅ Queued job {job['id']} ({job['kind']})")
+    elif args.action == 'cancel':
+        job = jobs.cancel(args.job_id)
+        if job is None:
+            sys.exit(f"❌ No job {args.job_id}")
+        print(f"✅ Job {job['id']} is {job['state']}" + (' (stops at its next progress report)' if job['state'] == 'running' else ''))
+
+
+def cmd_create_admin(args):
+    import getpass
+    import sqlite3
+    from models import user_model
+
+    password = getpass.getpass(f"Password for {args.username}: ")
+    if not password or password != getpass.getpass("Repeat the password: "):
+        sys.exit("❌ The passwords are empty or do not match")
+    user_model.init_db()
+    try:
+        user_model.create_admin(args.username, password, args.name or args.username, args.email)
+    except sqlite3.IntegrityError:
+        sys.exit(f"❌ A user named {args.username} already exists")
+    print(f"✅ Admin {args.username} created in {os.path.abspath(user_model.DB_PATH)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='heartcare', description='HeartCare+ command line')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve = commands.add_parser('serve', help='Run the production server (gunicorn)')
+    serve.add_argument('--bind', default=os.environ.get('HEARTCARE_BIND', '0.0.0.0:5000'))
+    serve.add_argument('--workers', type=int, default=default_workers())
+    serve.add_argument('--threads', type=int, default=default_threads())
+    serve.add_argument('--timeout', type=int, default=30, help='Worker timeout and graceful shutdown time in seconds')
+    serve.add_argument('--max-requests', type=int, default=0, help='Recycle a worker after this many requests (0 = never)')
+    serve.add_argument('--watch-interval', type=float, default=2.0, help='Seconds between model artifact checks (0 disables reload on change)')
+    serve.set_defaults(func=cmd_serve)
+
+    models = commands.add_parser('models', help='Publish, list and activate stored model versions')
+    actions = models.add_subparsers(dest='action')
+    actions.required = True
+    publish = actions.add_parser('publish', help='Copy an artifact into the model store as a new version')
+    publish.add_argument('model_name', choices=['logistic', 'random_forest', 'xgboost'])
+    publish.add_argument('artifact')
+    publish.add_argument('--scaler', help='Scaler artifact (logistic regression only)')
+    publish.add_argument('--version', help='Version name (default: UTC timestamp + artifact hash)')
+    actions.add_parser('list', help='Show stored versions and the active one')
+    activate = actions.add_parser('activate', help='Point the servers at a stored version')
+    activate.add_argument('model_name', choices=['logistic', 'random_forest', 'xgboost'])
+    activate.add_argument('version')
+    models.set_defaults(func=cmd_models)
+
+    train = commands.add_parser('train', help='Train the models and publish them to the model store')
+    train.add_argument('--data', default='uci', help="Labeled CSV (13 feature columns + 'target' or 'num'), or 'uci' to download the UCI data")
+    train.add_argument('--include-records', action='store_true', help='Add records with a clinician-confirmed outcome')
+    train.add_argument('--models', nargs='+', default=['logistic', 'random_forest', 'xgboost'], choices=['logistic', 'random_forest', 'xgboost'])
+    train.add_argument('--n-jobs', type=int, default=-1, help='Threads per tree ensemble (-1 shares the cores)')
+    train.add_argument('--chunk-size', type=int, default=50000, help='Rows read from the CSV / database at a time')
+    train.add_argument('--no-cache', action='store_true', help='Re-encode the data instead of using the cached design matrix')
+    train.add_argument('--version', help='Version name (default: train-<UTC timestamp>)')
+    train.add_argument('--activate', action='store_true', help='Make the new versions active')
+    train.set_defaults(func=cmd_train)
+
+    tune = commands.add_parser('tune', help='Search hyperparameters for one model family')
+    tune.add_argument('model_name', choices=['logistic', 'random_forest', 'xgboost'])
+    tune.add_argument('--strategy', default='halving', choices=['halving', 'random'])
+    tune.add_argument('--trials', type=int, default=27, help='Configurations sampled (all start in the first halving rung)')
+    tune.add_argument('--eta', type=int, default=3, help='Halving rate: the best 1/eta of each rung move up')
+    tune.add_argument('--min-fraction', type=float, default=0.1, help='Smallest share of rows a halving rung trains on')
+    tune.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    tune.add_argument('--seed', type=int, default=0)
+    tune.add_argument('--study', help='Study name (default: derived from the arguments and data, so reruns resume)')
+    tune.add_argument('--db', default=os.environ.get('HEARTCARE_TUNING_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tuning.db')))
+    tune.add_argument('--data', default='uci', help="Labeled CSV or 'uci' (as for train)")
+    tune.add_argument('--include-records', action='store_true')
+    tune.add_argument('--chunk-size', type=int, default=50000)
+    tune.add_argument('--export', action='store_true', help='Refit the best configuration and publish it to the model store')
+    tune.add_argument('--version', help='Version name for --export (default: tuned-<UTC timestamp>)')
+    tune.add_argument('--activate', action='store_true', help='Make the exported version active')
+    tune.set_defaults(func=cmd_tune)
+
+    calibrate = commands.add_parser('calibrate', help='Fit a probability calibration table for a model version')
+    calibrate.add_argument('model_name', choices=['logistic', 'random_forest', 'xgboost'])
+    calibrate.add_argument('--method', default='isotonic', choices=['isotonic', 'platt'])
+    calibrate.add_argument('--version', help="Model version to calibrate (default: the active one, or 'builtin')")
+    calibrate.add_argument('--data', default='uci', help="Labeled CSV or 'uci' (as for train); the held-out 20%% is used, "
+                                                        "or all of a separate CSV for 'builtin'")
+    calibrate.add_argument('--include-records', action='store_true')
+    calibrate.add_argument('--chunk-size', type=int, default=50000)
+    calibrate.set_defaults(func=cmd_calibrate)
+
+    export = commands.add_parser('export', help='Export records (with anonymized user ids) as Parquet or Arrow')
+    export.add_argument('output_dir')
+    export.add_argument('--format', default='parquet', choices=['parquet', 'arrow'])
+    export.add_argument('--incremental', action='store_true', help='Only append records newer than the last export')
+    export.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'users.db'))
+    export.add_argument('--chunk-size', type=int, default=50000, help='Rows fetched and written at a time (one row group each)')
+    export.add_argument('--rows-per-file', type=int, default=1000000)
+    export.set_defaults(func=cmd_export)
+
+    screen = commands.add_parser('screen', help='Score a CSV of patients (13 feature columns) and write the results as CSV')
+    screen.add_argument('input', help='CSV with a header naming the 13 feature columns')
+    screen.add_argument('--output', help='Result CSV (default: <input>_screened.csv)')
+    screen.add_argument('--model', default='logistic', choices=['logistic', 'random_forest', 'xgboost'])
+    screen.add_argument('--user-id', type=int, help='Save the scored rows to records under this user')
+    screen.add_argument('--chunk-size', type=int, default=10000, help='Rows parsed, scored and saved at a time')
+    screen.set_defaults(func=cmd_screen)
+
+    jobs = commands.add_parser('jobs', help='Run, list, queue and cancel background jobs')
+    job_actions = jobs.add_subparsers(dest='action')
+    job_actions.required = True
+    work = job_actions.add_parser('work', help='Run job workers in this process until interrupted')
+    work.add_argument('--workers', type=int, default=1, help='Jobs run at the same time')
+    work.add_argument('--kinds', help='Comma-separated job kinds to run (default all)')
+    job_list = job_actions.add_parser('list', help='Show recent jobs')
+    job_list.add_argument('--kind')
+    job_list.add_argument('--limit', type=int, default=20)
+    enqueue = job_actions.add_parser('enqueue', help='Queue a job for the workers')
+    enqueue.add_argument('kind', choices=['evaluate', 'export', 'retrain', 'notify'])
+    enqueue.add_argument('params', nargs='?', default='{}', help='Job parameters as a JSON object')
+    cancel = job_actions.add_parser('cancel', help='Cancel a queued or running job')
+    cancel.add_argument('job_id', type=int)
+    jobs.set_defaults(func=cmd_jobs)
+
+    create_admin = commands.add_parser('create-admin', help='Create an admin account (prompts for the password)')
+    create_admin.add_argument('username')
+    create_admin.add_argument('--name')
+    create_admin.add_argument('--email')
+    create_admin.set_defaults(func=cmd_create_admin)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
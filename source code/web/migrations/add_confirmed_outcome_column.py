@@ -0,0 +1,27 @@
+import sqlite3
+import os
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../users.db')
+
+def column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(col[1] == column for col in cursor.fetchall())
+
+def add_confirmed_outcome_column():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if not column_exists(c, 'records', 'confirmed_outcome'):
+        c.execute('ALTER TABLE records ADD COLUMN confirmed_outcome INTEGER')
+        print('Added confirmed_outcome column to records table.')
+    else:
+        print('confirmed_outcome column already exists.')
+    if not column_exists(c, 'records', 'confirmed_at'):
+        c.execute('ALTER TABLE records ADD COLUMN confirmed_at REAL')
+        print('Added confirmed_at column to records table.')
+    else:
+        print('confirmed_at column already exists.')
+    conn.commit()
+    conn.close()
+
+if __name__ == '__main__':
+    add_confirmed_outcome_column()
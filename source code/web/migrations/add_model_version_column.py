@@ -0,0 +1,22 @@
+import sqlite3
+import os
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../users.db')
+
+def column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(col[1] == column for col in cursor.fetchall())
+
+def add_model_version_column():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if not column_exists(c, 'records', 'model_version'):
+        c.execute('ALTER TABLE records ADD COLUMN model_version TEXT')
+        print('Added model_version column to records table.')
+    else:
+        print('model_version column already exists.')
+    conn.commit()
+    conn.close()
+
+if __name__ == '__main__':
+    add_model_version_column()
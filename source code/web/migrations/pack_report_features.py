@@ -0,0 +1,51 @@
+import sqlite3
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import feature_codec
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../users.db')
+BATCH_SIZE = 5000
+
+def column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(col[1] == column for col in cursor.fetchall())
+
+def pack_report_features():
+    """Add report_links.features_blob and move the text features of existing links into it"""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if not column_exists(c, 'report_links', 'features_blob'):
+        c.execute('ALTER TABLE report_links ADD COLUMN features_blob BLOB')
+        print('Added features_blob column to report_links table.')
+    packed = skipped = text_bytes = blob_bytes = 0
+    last_id = 0
+    while True:
+        c.execute('''SELECT id, features FROM report_links
+                     WHERE id > ? AND features_blob IS NULL AND features IS NOT NULL
+                     ORDER BY id LIMIT ?''', (last_id, BATCH_SIZE))
+        rows = c.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, text in rows:
+            try:
+                blob = feature_codec.encode(feature_codec.parse_text(text))
+            except (ValueError, TypeError, SyntaxError):
+                # Leave links whose features cannot be parsed as text
+                skipped += 1
+                continue
+            updates.append((sqlite3.Binary(blob), row_id))
+            text_bytes += len(text.encode())
+            blob_bytes += len(blob)
+        c.executemany('UPDATE report_links SET features_blob = ?, features = NULL WHERE id = ?', updates)
+        conn.commit()
+        packed += len(updates)
+    conn.close()
+    print(f'Packed features of {packed} report links ({text_bytes} bytes of text -> {blob_bytes} bytes), {skipped} left as text.')
+
+if __name__ == '__main__':
+    pack_report_features()
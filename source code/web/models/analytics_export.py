@@ -0,0 +1,231 @@
+"""
+Columnar export of the records table for analysis
+Streams records out of SQLite with fetchmany, chunk_size rows at a time, and
+writes each chunk as one record batch (a Parquet row group or an Arrow IPC
+batch), so memory stays bounded however large the table is. User ids are
+replaced by an HMAC-SHA256 of the id under a secret key: the same user gets
+the same key across exports, but ids cannot be recovered without the secret.
+
+Every run writes one hive-style partition, export=<UTC time>/part-NNNNN.*,
+into a staging directory renamed into place when complete. _watermark.json
+records the last exported record id and the partitions; --incremental only
+exports records after it. Read the dataset with pandas.read_parquet(DIR) or
+pyarrow.dataset.dataset(DIR, format='arrow').
+
+Run it through the command line: python heartcare.py export --help
+"""
+
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+
+EXPORT_KEY = os.environ.get('HEARTCARE_EXPORT_KEY', '')
+WATERMARK_NAME = '_watermark.json'
+PARTITION_PREFIX = 'export='
+STAGING_PREFIX = '.staging-'
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+CHUNK_SIZE = 50000
+ROWS_PER_FILE = 1000000
+
+FEATURE_COLUMNS = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+SELECT_SQL = f'''SELECT r.id, r.user_id, {', '.join('r.' + name for name in FEATURE_COLUMNS)}, r.risk, r.model_version, r.confirmed_outcome
+                 FROM records r WHERE r.id > ? AND r.id <= ? ORDER BY r.id'''
+
+
+class ExportError(Exception):
+    """Raised when an export cannot run (no key, or a key that does not match the watermark)"""
+
+
+def _schema():
+    import pyarrow as pa
+    fields = [pa.field('record_id', pa.int64(), nullable=False), pa.field('user_key', pa.string())]
+    fields += [pa.field(name, pa.float64() if name == 'oldpeak' else pa.int32()) for name in FEATURE_COLUMNS]
+    fields += [pa.field('risk', pa.float64()), pa.field('model_version', pa.string()), pa.field('confirmed_outcome', pa.int8())]
+    return pa.schema(fields)
+
+
+def key_id(key):
+    """Fingerprint of the anonymization key, stored in the watermark to catch a key change"""
+    return hashlib.sha256(b'heartcare-export-key:' + key.encode()).hexdigest()[:16]
+
+
+class UserAnonymizer:
+    """HMAC-SHA256 of user ids, memoized (a chunk usually repeats the same users)"""
+
+    def __init__(self, key):
+        self._key = key.encode()
+        self._cache = {}
+
+    def __call__(self, user_id):
+        if user_id is None:
+            return None
+        value = self._cache.get(user_id)
+        if value is None:
+            if len(self._cache) > 100000:
+                self._cache.clear()
+            value = hmac.new(self._key, str(user_id).encode(), hashlib.sha256).hexdigest()[:32]
+            self._cache[user_id] = value
+        return value
+
+
+def read_watermark(output_dir):
+    path = os.path.join(output_dir, WATERMARK_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_watermark(output_dir, watermark):
+    path = os.path.join(output_dir, WATERMARK_NAME)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(watermark, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _remove_unlisted(output_dir, partitions):
+    """Drop staging directories and partitions the watermark does not list (left by a failed run)"""
+    for name in os.listdir(output_dir):
+        if name.startswith(STAGING_PREFIX) or (name.startswith(PARTITION_PREFIX) and name not in partitions):
+            print(f"DEBUG: Removing {name} from {output_dir}")
+            shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+
+
+def _chunk_batch(rows, anonymize, schema):
+    import pyarrow as pa
+    columns = list(zip(*rows))
+    arrays = [list(columns[0]), [anonymize(user_id) for user_id in columns[1]]] + [list(values) for values in columns[2:]]
+    return pa.RecordBatch.from_arrays([pa.array(values, type=field.type) for values, field in zip(arrays, schema)], schema=schema)
+
+
+class _PartFileWriter:
+    """Rolls over to a new part file every rows_per_file rows"""
+
+    def __init__(self, directory, fmt, schema, rows_per_file):
+        self.directory = directory
+        self.fmt = fmt
+        self.schema = schema
+        self.rows_per_file = rows_per_file
+        self.files = []
+        self._writer = None
+        self._sink = None
+        self._rows_in_file = 0
+
+    def _open(self):
+        import pyarrow as pa
+        path = os.path.join(self.directory, f'part-{len(self.files):05d}{EXTENSIONS[self.fmt]}')
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+        self.files.append(os.path.basename(path))
+        self._rows_in_file = 0
+
+    def write(self, batch):
+        import pyarrow as pa
+        while batch.num_rows:
+            if self._writer is None or self._rows_in_file >= self.rows_per_file:
+                self.close()
+                self._open()
+            part = batch.slice(0, self.rows_per_file - self._rows_in_file)
+            if self.fmt == 'parquet':
+                # One row group per chunk
+                self._writer.write_table(pa.Table.from_batches([part]))
+            else:
+                self._writer.write_batch(part)
+            self._rows_in_file += part.num_rows
+            batch = batch.slice(part.num_rows)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+
+def export_records(db_path, output_dir, fmt='parquet', incremental=False, chunk_size=CHUNK_SIZE,
+                   rows_per_file=ROWS_PER_FILE, key=EXPORT_KEY, progress=None):
+    """
+    Export records to output_dir as one new partition; returns the partition
+    written (None when there were no new records).
+    A full export replaces the partitions already there, an incremental one
+    adds the records after the previous watermark.
+    progress(rows_written, rows_total) is called after every chunk; an
+    exception it raises aborts the export and removes the partial partition.
+    """
+    if fmt not in EXTENSIONS:
+        raise ValueError('Unknown export format: ' + fmt)
+    if not key:
+        raise ExportError('Set HEARTCARE_EXPORT_KEY to the secret used to anonymize user ids')
+    os.makedirs(output_dir, exist_ok=True)
+    previous = read_watermark(output_dir)
+    if incremental and previous is not None:
+        if previous['key_id'] != key_id(key):
+            raise ExportError('HEARTCARE_EXPORT_KEY differs from the one the existing export used; run a full export')
+        if previous['format'] != fmt:
+            raise ExportError(f"The existing export is {previous['format']}; run a full export to switch formats")
+        after_id, partitions = previous['last_id'], previous['partitions']
+    else:
+        after_id, partitions = 0, []
+    _remove_unlisted(output_dir, {p['name'] for p in (previous or {}).get('partitions', [])})
+
+    conn = sqlite3.connect(db_path)
+    try:
+        c = conn.cursor()
+        # Export up to the newest id at the start; records saved meanwhile go in the next export
+        last_id = c.execute('SELECT COALESCE(MAX(id), 0) FROM records').fetchone()[0]
+        if last_id <= after_id:
+            print(f"DEBUG: No records after id {after_id}")
+            return None
+        exported_at = datetime.datetime.utcnow()
+        name = PARTITION_PREFIX + exported_at.strftime('%Y%m%dT%H%M%S') + f'{exported_at.microsecond // 1000:03d}Z'
+        staging = os.path.join(output_dir, f'{STAGING_PREFIX}{uuid.uuid4().hex}')
+        os.makedirs(staging)
+        schema = _schema()
+        anonymize = UserAnonymizer(key)
+        writer = _PartFileWriter(staging, fmt, schema, rows_per_file)
+        rows_written = 0
+        try:
+            rows_total = None
+            if progress is not None:
+                rows_total = c.execute('SELECT COUNT(*) FROM records WHERE id > ? AND id <= ?', (after_id, last_id)).fetchone()[0]
+            c.execute(SELECT_SQL, (after_id, last_id))
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.write(_chunk_batch(rows, anonymize, schema))
+                rows_written += len(rows)
+                if progress is not None:
+                    progress(rows_written, rows_total)
+            writer.close()
+            os.rename(staging, os.path.join(output_dir, name))
+        except BaseException:
+            writer.close()
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    finally:
+        conn.close()
+
+    partition = {'name': name, 'first_id': after_id + 1, 'last_id': last_id, 'rows': rows_written, 'files': writer.files}
+    watermark = {
+        'last_id': last_id,
+        'format': fmt,
+        'key_id': key_id(key),
+        'exported_at': exported_at.isoformat(timespec='seconds') + 'Z',
+        'partitions': partitions + [partition],
+    }
+    _write_watermark(output_dir, watermark)
+    if not incremental:
+        _remove_unlisted(output_dir, {name})
+    return partition
@@ -0,0 +1,139 @@
+import threading
+import numpy as np
+
+from models import heart_model
+from models.heart_model import FEATURE_NAMES, _get_template_layout, preprocess_features_batch
+from models.flat_trees import FlatTreeEnsemble
+
+TOP_K = 5
+
+# Per-model attribution tables, rebuilt if the loaded model object changes
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _raw_feature_matrix():
+    # (n_columns, 13) matrix folding one-hot columns back onto their raw feature
+    columns, _, _ = _get_template_layout()
+    fold = np.zeros((len(columns), len(FEATURE_NAMES)))
+    for i, col in enumerate(columns):
+        fold[i, FEATURE_NAMES.index(col.split('_')[0])] = 1.0
+    return fold
+
+
+def _as_flat(model_name, model):
+    if isinstance(model, FlatTreeEnsemble):
+        # heart_model only serves flattened copies of the current artifact, which carry cover
+        if model.kind == 'boosted' and model.cover is None:
+            raise ValueError(f'Flattened {model_name} model has no node cover; re-run models/convert_artifacts.py')
+        return model
+    if hasattr(model, 'estimators_'):
+        return FlatTreeEnsemble.from_sklearn_forest(model)
+    columns, _, _ = _get_template_layout()
+    return FlatTreeEnsemble.from_xgboost(model, list(columns))
+
+
+def _path_table(flat):
+    """
+    Precompute, for every node, the accumulated change in expected value
+    attributed to each feature on the path from the root (path-dependent
+    decomposition). Scoring a row then only needs its leaf in each tree:
+    contributions = sum over trees of table[leaf], and these add up exactly to
+    the model output minus the base value.
+    """
+    value = np.array(flat.value, dtype=np.float64)
+    left = np.asarray(flat.left)
+    right = np.asarray(flat.right)
+    feature = np.asarray(flat.feature)
+    if flat.kind == 'boosted':
+        # Internal nodes only store splits; their expected value is the
+        # cover-weighted mean of their children (children always have larger ids)
+        cover = np.asarray(flat.cover, dtype=np.float64)
+        for node in range(len(value) - 1, -1, -1):
+            if left[node] >= 0:
+                l, r = left[node], right[node]
+                value[node] = (cover[l] * value[l] + cover[r] * value[r]) / max(cover[l] + cover[r], 1e-12)
+    table = np.zeros((len(value), flat.n_features))
+    for node in range(len(value)):
+        if left[node] >= 0:
+            for child in (left[node], right[node]):
+                table[child] = table[node]
+                table[child, feature[node]] += value[child] - value[node]
+    roots = np.asarray(flat.roots)
+    if flat.kind == 'boosted':
+        base_value = float(value[roots].sum() + flat.base_margin)
+    else:
+        base_value = float(value[roots].mean())
+    return table, base_value
+
+
+def _get_table(model_name, model):
+    with _tables_lock:
+        cached = _tables.get(model_name)
+        if cached is None or cached[0] is not model:
+            flat = _as_flat(model_name, model)
+            table, base_value = _path_table(flat)
+            cached = (model, flat, table, base_value)
+            _tables[model_name] = cached
+        return cached
+
+
+def feature_contributions(rows, model_name='logistic', entry=None):
+    """
+    Per-row contributions of each of the 13 raw features, plus the base value
+    Logistic regression: exact coefficient x standardized value (log-odds).
+    Random forest: path-dependent contributions in probability units.
+    XGBoost: path-dependent contributions in log-odds.
+    entry: the LoadedModel to explain (default: the one in service)
+    Returns (contributions (n, 13) array, base_value float)
+    """
+    entry = entry or heart_model._get_loaded(model_name)
+    model = entry.model
+    X = preprocess_features_batch(rows)
+    if model_name == 'logistic':
+        scaler = entry.scaler
+        z = (X.values - scaler.mean_) / scaler.scale_
+        contributions = z * model.coef_[0]
+        base_value = float(model.intercept_[0])
+    else:
+        _, flat, table, base_value = _get_table(model_name, model)
+        nodes = flat.leaf_indices(X.values)
+        contributions = table[nodes].sum(axis=1)
+        if flat.kind == 'forest':
+            contributions /= nodes.shape[1]
+    return contributions @ _raw_feature_matrix(), base_value
+
+
+def explain_predictions(rows, model_name='logistic', top_k=TOP_K, entry=None):
+    """
+    Top contributing features for each row, largest absolute contribution first
+    Returns a list of {'base_value', 'top_features': [{'feature', 'value', 'contribution'}]}
+    """
+    rows = [list(row) for row in rows]
+    if not rows:
+        return []
+    contributions, base_value = feature_contributions(rows, model_name, entry)
+    order = np.argsort(-np.abs(contributions), axis=1)[:, :top_k]
+    explanations = []
+    for row, row_contrib, row_order in zip(rows, contributions, order):
+        explanations.append({
+            'base_value': round(base_value, 4),
+            'top_features': [{
+                'feature': FEATURE_NAMES[j],
+                'value': row[j],
+                'contribution': round(float(row_contrib[j]), 4),
+            } for j in row_order],
+        })
+    return explanations
+
+
+def predict_explain_batch(rows, model_name='logistic', top_k=TOP_K):
+    """
+    Score rows and explain them with the same loaded model, so the
+    attributions describe the version that produced the probabilities
+    Returns (probabilities, model version, explanations)
+    """
+    rows = [list(row) for row in rows]
+    entry = heart_model._get_loaded(model_name)
+    preds, version = heart_model.predict_heart_disease_batch_versioned(rows, model_name, entry)
+    return preds, version, explain_predictions(rows, model_name, top_k, entry)
@@ -0,0 +1,167 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from services import inference_pool
+
+# Micro-batching settings (override through the environment)
+BATCHING_ENABLED = os.environ.get('HEARTCARE_BATCHING', '0') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('HEARTCARE_BATCH_MAX_SIZE', '32'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('HEARTCARE_BATCH_MAX_WAIT_MS', '2'))
+# Longest a request waits for its batch to be scored before giving up with PoolBusyError
+BATCH_TIMEOUT = float(os.environ.get('HEARTCARE_BATCH_TIMEOUT', '30'))
+
+
+class PredictionBatcher:
+    """
+    Collects concurrent single-row predictions and scores them as one batch per model.
+    A request waits at most max_wait_ms for company, and a batch never exceeds
+    max_batch_size rows. When traffic is light (recent batches hold a single row)
+    the wait is skipped entirely so an idle server adds no latency.
+    predict_batch(rows, model_name) returns (probabilities, model version),
+    or (probabilities, model version, explanations) to resolve each request to
+    (probability, model version, explanation).
+    """
+
+    def __init__(self, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, predict_batch=inference_pool.predict_batch_versioned):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._predict_batch = predict_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Exponential moving average of recent batch sizes drives the adaptive wait
+        self._avg_batch_size = 1.0
+        self.batches = 0
+        self.rows = 0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                    self._thread.start()
+
+    def submit(self, features, model_name='logistic'):
+        """Queue one row for scoring and return a Future resolving to (probability, model version)"""
+        if not isinstance(features, (list, tuple)) or len(features) != 13:
+            raise ValueError(f'Expected 13 features in the order: [age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal], but got {len(features)}: {features}')
+        future = Future()
+        self._ensure_started()
+        self._queue.put((list(features), model_name, future))
+        return future
+
+    def predict(self, features, model_name='logistic', timeout=BATCH_TIMEOUT):
+        return self.predict_versioned(features, model_name, timeout)[0]
+
+    def predict_versioned(self, features, model_name='logistic', timeout=BATCH_TIMEOUT):
+        return self.result(self.submit(features, model_name), timeout)
+
+    @staticmethod
+    def result(future, timeout=BATCH_TIMEOUT):
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise inference_pool.PoolBusyError(f'Prediction batch was not scored within {timeout:g}s')
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Take whatever is already waiting without blocking
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Only hold the batch open if concurrent traffic has been seen recently
+        if self._avg_batch_size > 1.5 or len(batch) > 1:
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        self._avg_batch_size = 0.8 * self._avg_batch_size + 0.2 * len(batch)
+        return batch
+
+    def _score(self, batch):
+        by_model = {}
+        for features, model_name, future in batch:
+            if future.set_running_or_notify_cancel():
+                by_model.setdefault(model_name, []).append((features, future))
+        for model_name, items in by_model.items():
+            try:
+                result = self._predict_batch([features for features, _ in items], model_name)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            preds, version = result[0], result[1]
+            # A predict_batch that also explains returns one explanation per row as a third item
+            explanations = result[2] if len(result) > 2 else None
+            if len(preds) != len(items) or (explanations is not None and len(explanations) != len(items)):
+                raise ValueError(f'{model_name} batch of {len(items)} rows returned {len(preds)} predictions')
+            for i, ((_, future), pred) in enumerate(zip(items, preds)):
+                future.set_result((float(pred), version) if explanations is None else (float(pred), version, explanations[i]))
+        self.batches += 1
+        self.rows += len(batch)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._score(batch)
+            except Exception as e:
+                print(f"DEBUG: Batcher failed to score batch: {e}")
+                # Whatever the batch did not resolve fails now rather than waiting forever
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+_batcher = None
+_explain_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = PredictionBatcher()
+    return _batcher
+
+def get_explain_batcher():
+    """A batcher whose requests resolve to (probability, model version, explanation)"""
+    global _explain_batcher
+    if _explain_batcher is None:
+        with _batcher_lock:
+            if _explain_batcher is None:
+                _explain_batcher = PredictionBatcher(predict_batch=inference_pool.predict_explain_batch_versioned)
+    return _explain_batcher
+
+def batched_predict(features, model_name='logistic'):
+    """
+    Drop-in replacement for predict_heart_disease that goes through the
+    micro-batcher when HEARTCARE_BATCHING=1, and scores directly otherwise.
+    Either way the scoring runs in the worker pool when that is enabled.
+    """
+    return batched_predict_versioned(features, model_name)[0]
+
+def batched_predict_versioned(features, model_name='logistic'):
+    """batched_predict returning (probability, model version)"""
+    if not BATCHING_ENABLED:
+        return inference_pool.predict_versioned(features, model_name)
+    return get_batcher().predict_versioned(features, model_name)
+
+def batched_predict_explained(features, model_name='logistic'):
+    """batched_predict returning (probability, model version, explanation), scored and explained in one call"""
+    if not BATCHING_ENABLED:
+        preds, version, explanations = inference_pool.predict_explain_batch_versioned([features], model_name)
+        return float(preds[0]), version, explanations[0]
+    return PredictionBatcher.result(get_explain_batcher().submit(features, model_name))
@@ -0,0 +1,245 @@
+"""
+Probability calibration for the serving models
+Tree ensembles in particular return scores that are not well calibrated, and
+the risk cutoffs (0.5 High/Low, 0.7/0.4 for the risk level) assume they are.
+A calibrator (isotonic regression or Platt scaling) is fitted offline per
+model version on held-out data and stored as a monotone lookup table; serving
+maps each raw probability through it with np.interp (a binary search over the
+knots). The reliability curves before and after calibration are stored with
+the table for the admin dashboard. The calibrated curve, ECE and Brier score
+are cross-fitted: each held-out row is calibrated by a table fitted on the
+other CROSSFIT_FOLDS - 1 folds, so they measure rows the calibrator did not
+see. The stored table is fitted on all rows.
+
+The built-in models were fitted in the notebook on a split of the UCI data
+that training cannot reproduce, so they are only calibrated on a separate
+labeled file. Their tables are named after the artifact's hash
+(builtin-<12 hex>), so replacing an artifact leaves it uncalibrated until it
+is calibrated again.
+
+Fit one with: python heartcare.py calibrate MODEL_NAME [--method isotonic|platt]
+"""
+
+import datetime
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+from models.model_store import file_sha256
+
+CALIBRATION_DIR = os.environ.get('HEARTCARE_CALIBRATION_DIR', os.path.join(os.path.dirname(__file__), '../calibration'))
+CALIBRATION_ENABLED = os.environ.get('HEARTCARE_CALIBRATION', '1') == '1'
+# Knots of the Platt lookup table (the isotonic table keeps its own steps)
+PLATT_KNOTS = 201
+RELIABILITY_BINS = 10
+CROSSFIT_FOLDS = 5
+
+# (model_name, version) -> (x knots, y knots) or None when there is no table
+_tables = {}
+_tables_lock = threading.Lock()
+# (model_name, version, table mtime) -> PNG bytes of the reliability plot
+_plots = {}
+# (artifact path, mtime_ns, size) -> hash prefix naming a built-in model's table
+_artifact_hashes = {}
+
+
+def table_version(model_name, version):
+    """Name of a version's table: a built-in model's is tied to its artifact's hash"""
+    from models import heart_model
+    if version != heart_model.BUILTIN_VERSION:
+        return version
+    path = heart_model.MODEL_PATHS[model_name]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return version
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _artifact_hashes:
+        _artifact_hashes[key] = file_sha256(path)[:12]
+    return f'{version}-{_artifact_hashes[key]}'
+
+
+def table_path(model_name, version):
+    return os.path.join(CALIBRATION_DIR, model_name, f'{table_version(model_name, version)}.json')
+
+
+def load(model_name, version):
+    """The stored calibration for a model version, or None"""
+    path = table_path(model_name, version)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def summary(model_name, version):
+    """A stored calibration without its lookup table (method, fit data, reliability, ECE/Brier), or None"""
+    calibration = load(model_name, version)
+    if calibration is None:
+        return None
+    calibration['knots'] = len(calibration.pop('x'))
+    calibration.pop('y')
+    calibration['enabled'] = CALIBRATION_ENABLED
+    return calibration
+
+
+def _get_table(model_name, version):
+    key = (model_name, table_version(model_name, version))
+    if key not in _tables:
+        with _tables_lock:
+            if key not in _tables:
+                calibration = load(model_name, version)
+                _tables[key] = None if calibration is None else (np.array(calibration['x']), np.array(calibration['y']))
+                if calibration is not None:
+                    print(f"DEBUG: Loaded {calibration['method']} calibration for {model_name} ({version})")
+    return _tables[key]
+
+
+def apply(model_name, version, probs):
+    """Calibrated probabilities (unchanged when the version has no calibration table)"""
+    if not CALIBRATION_ENABLED:
+        return probs
+    table = _get_table(model_name, version)
+    if table is None:
+        return probs
+    return np.interp(probs, table[0], table[1])
+
+
+def clear_cache():
+    with _tables_lock:
+        _tables.clear()
+        _plots.clear()
+
+
+def _isotonic_table(scores, labels):
+    from sklearn.isotonic import IsotonicRegression
+    iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(scores, labels)
+    x, y = iso.X_thresholds_, iso.y_thresholds_
+    # np.interp needs increasing knots; the ends pin the table to [0, 1]
+    x, index = np.unique(x, return_index=True)
+    x, y = np.concatenate([[0.0], x, [1.0]]), np.concatenate([[y[index][0]], y[index], [y[index][-1]]])
+    return x, y
+
+
+def _platt_table(scores, labels):
+    from sklearn.linear_model import LogisticRegression
+    eps = 1e-6
+    logit = lambda p: np.log(np.clip(p, eps, 1 - eps) / (1 - np.clip(p, eps, 1 - eps)))
+    platt = LogisticRegression(C=1e6).fit(logit(scores).reshape(-1, 1), labels)
+    x = np.linspace(0.0, 1.0, PLATT_KNOTS)
+    return x, platt.predict_proba(logit(x).reshape(-1, 1))[:, 1]
+
+
+def reliability_curve(probs, labels, bins=RELIABILITY_BINS):
+    """Per probability bin: mean predicted probability, observed positive rate and count"""
+    index = np.minimum((np.asarray(probs) * bins).astype(int), bins - 1)
+    curve = []
+    for b in range(bins):
+        mask = index == b
+        if mask.any():
+            curve.append({'bin': b, 'predicted': float(np.mean(probs[mask])), 'observed': float(np.mean(labels[mask])), 'count': int(mask.sum())})
+    return curve
+
+
+def expected_calibration_error(curve):
+    total = sum(point['count'] for point in curve)
+    return float(sum(point['count'] * abs(point['predicted'] - point['observed']) for point in curve) / total)
+
+
+def _crossfit(scores, labels, fit_table):
+    """(calibrated scores, folds): each row calibrated by a table fitted on the other folds"""
+    from sklearn.model_selection import StratifiedKFold
+    from models.estimators import RANDOM_STATE
+    folds = min(CROSSFIT_FOLDS, int(min(np.sum(labels == 0), np.sum(labels == 1))))
+    if folds < 2:
+        raise ValueError('Calibration needs at least 2 held-out rows of each outcome')
+    calibrated = np.empty_like(scores)
+    for fit_idx, eval_idx in StratifiedKFold(folds, shuffle=True, random_state=RANDOM_STATE).split(scores, labels):
+        x, y = fit_table(scores[fit_idx], labels[fit_idx])
+        calibrated[eval_idx] = np.interp(scores[eval_idx], x, y)
+    return calibrated, folds
+
+
+def fit(model_name, version, scores, labels, method='isotonic', source=None):
+    """Fit a calibrator on held-out (raw probability, outcome) pairs and store its lookup table"""
+    scores, labels = np.asarray(scores, dtype=float), np.asarray(labels, dtype=float)
+    fit_table = _isotonic_table if method == 'isotonic' else _platt_table
+    calibrated, folds = _crossfit(scores, labels, fit_table)
+    x, y = fit_table(scores, labels)
+    before, after = reliability_curve(scores, labels), reliability_curve(calibrated, labels)
+    calibration = {
+        'model_name': model_name,
+        'version': table_version(model_name, version),
+        'method': method,
+        'source': source,
+        'rows': int(len(scores)),
+        'crossfit_folds': folds,
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'x': x.tolist(),
+        'y': y.tolist(),
+        'reliability': {'raw': before, 'calibrated': after},
+        'ece': {'raw': expected_calibration_error(before), 'calibrated': expected_calibration_error(after)},
+        'brier': {'raw': float(np.mean((scores - labels) ** 2)), 'calibrated': float(np.mean((calibrated - labels) ** 2))},
+    }
+    path = table_path(model_name, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(calibration, f)
+    os.replace(tmp, path)
+    with _tables_lock:
+        _tables.pop((model_name, table_version(model_name, version)), None)
+    return calibration
+
+
+def holdout_scores(model_name, version, X, y, columns, source='uci', test_size=0.2):
+    """
+    Raw probabilities of a model version on rows it was not fitted on: the 20%
+    split training.train holds out (same seed and stratification) for a model
+    store version, every row of source for a built-in model. A built-in model
+    was fitted on the UCI data, so source has to be a separate labeled file.
+    """
+    import pandas as pd
+    from models import heart_model
+    from models.estimators import holdout_split
+    if version == heart_model.BUILTIN_VERSION:
+        if source == 'uci':
+            raise ValueError(f"The built-in {model_name} model was fitted on the UCI data; "
+                             "calibrate it with --data pointing at a separate labeled CSV")
+        entry = heart_model._load_builtin(model_name)
+        X_test, y_test = X, y
+    else:
+        _, X_test, _, y_test = holdout_split(X, y, test_size)
+        entry = heart_model._load_version(model_name, version)
+    return heart_model._predict_proba(entry, model_name, pd.DataFrame(X_test, columns=columns)), y_test
+
+
+def reliability_png(model_name, version):
+    """Reliability plot of a stored calibration as PNG bytes, rendered once per table file"""
+    path = table_path(model_name, version)
+    if not os.path.exists(path):
+        return None
+    key = (model_name, table_version(model_name, version), os.path.getmtime(path))
+    if key not in _plots:
+        import matplotlib.pyplot as plt
+        calibration = load(model_name, version)
+        fig, ax = plt.subplots(figsize=(4, 4))
+        ax.plot([0, 1], [0, 1], color='gray', lw=1, linestyle='--')
+        for name, color in (('raw', '#c0392b'), ('calibrated', '#27ae60')):
+            curve = calibration['reliability'][name]
+            ax.plot([p['predicted'] for p in curve], [p['observed'] for p in curve], marker='o', color=color,
+                    label=f"{name} (ECE {calibration['ece'][name]:.3f})")
+        ax.set_xlim([0.0, 1.0])
+        ax.set_ylim([0.0, 1.0])
+        ax.set_xlabel('Predicted probability')
+        ax.set_ylabel('Observed frequency')
+        ax.set_title(f"Reliability ({calibration['method']})")
+        ax.legend(loc='upper left')
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight')
+        plt.close(fig)
+        _plots[key] = buf.getvalue()
+    return _plots[key]
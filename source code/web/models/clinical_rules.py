@@ -0,0 +1,96 @@
+import operator
+import numpy as np
+
+from models.heart_model import FEATURE_NAMES
+
+# Each rule: (feature, operator, threshold, message, applies_when)
+# applies_when is 'high' (prediction >= 0.5), 'low' or 'any'.
+# operator 'always' ignores feature/threshold. Order within a table is output order.
+REASONING_RULES = [
+    ('age', '>', 50, 'Age above 50 is a risk factor.', 'any'),
+    ('chol', '>', 240, 'High cholesterol level.', 'any'),
+    ('trestbps', '>', 130, 'Elevated blood pressure.', 'any'),
+    ('exang', '==', 1, 'Exercise induced angina present.', 'any'),
+    ('oldpeak', '>', 2, 'Significant ST depression (oldpeak).', 'any'),
+]
+NO_REASONS_MESSAGE = 'No major risk factors detected.'
+
+RECOMMENDATION_RULES = [
+    (None, 'always', None, 'Consult a cardiologist for further evaluation.', 'high'),
+    ('chol', '>', 240, 'Consider dietary changes to lower cholesterol.', 'high'),
+    ('trestbps', '>', 130, 'Monitor and manage your blood pressure.', 'high'),
+    ('oldpeak', '>', 2, 'Discuss ST depression findings with your doctor.', 'high'),
+    (None, 'always', None, 'Maintain regular physical activity and a healthy diet.', 'high'),
+    (None, 'always', None, 'Continue a healthy lifestyle to maintain low risk.', 'low'),
+    ('chol', '>', 200, 'Watch your cholesterol and consider regular checkups.', 'low'),
+    ('trestbps', '>', 120, 'Monitor your blood pressure periodically.', 'low'),
+]
+
+HIGH_RISK_THRESHOLD = 0.5
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def evaluate_rules(rules, X, high):
+    """
+    Evaluate a rule table over a batch
+    X: (n, 13) float array of raw features, high: (n,) bool array
+    Returns an (n, len(rules)) bool matrix of which rules fire for each row
+    """
+    fired = np.zeros((X.shape[0], len(rules)), dtype=bool)
+    for j, (feature, op, threshold, _, applies_when) in enumerate(rules):
+        if op == 'always':
+            hit = np.ones(X.shape[0], dtype=bool)
+        else:
+            hit = OPERATORS[op](X[:, FEATURE_NAMES.index(feature)], threshold)
+        if applies_when == 'high':
+            hit &= high
+        elif applies_when == 'low':
+            hit &= ~high
+        fired[:, j] = hit
+    return fired
+
+
+def _render(fired, high, render_one):
+    # Rows that fire the same rules at the same risk level share one rendered
+    # output, so text is built once per distinct pattern rather than once per row
+    bits = 1 << np.arange(fired.shape[1], dtype=np.int64)
+    codes = fired.astype(np.int64) @ bits + (high.astype(np.int64) << fired.shape[1])
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    first_row = np.zeros(len(unique_codes), dtype=np.int64)
+    first_row[inverse[::-1]] = np.arange(len(codes))[::-1]
+    rendered = [render_one(fired[i], bool(high[i])) for i in first_row]
+    return [rendered[k] for k in inverse]
+
+
+def _reasoning_text(row_fired, is_high):
+    reasons = [rule[3] for rule, hit in zip(REASONING_RULES, row_fired) if hit] or [NO_REASONS_MESSAGE]
+    if is_high:
+        return 'High risk due to: ' + ', '.join(reasons)
+    return 'Low risk. ' + ' '.join(reasons)
+
+
+def _recommendation_list(row_fired, is_high):
+    return [rule[3] for rule, hit in zip(RECOMMENDATION_RULES, row_fired) if hit]
+
+
+def explain_batch(features, predictions):
+    """
+    Reasoning strings and recommendation lists for many patients at once
+    features: (n, 13) array-like of raw features, predictions: (n,) probabilities
+    Returns (reasonings, recommendations) lists aligned with the input rows
+    """
+    X = np.asarray(features, dtype=float).reshape(-1, len(FEATURE_NAMES))
+    high = np.asarray(predictions, dtype=float).reshape(-1) >= HIGH_RISK_THRESHOLD
+    if X.shape[0] == 0:
+        return [], []
+    reasonings = _render(evaluate_rules(REASONING_RULES, X, high), high, _reasoning_text)
+    recommendations = _render(evaluate_rules(RECOMMENDATION_RULES, X, high), high, _recommendation_list)
+    return reasonings, [list(recs) for recs in recommendations]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Build step: convert the tree model pickles into flattened NumPy arrays
+Writes mmap_models/<model_name>/*.npy next to the web app. heart_model then loads
+them with mmap_mode='r', so every worker process shares one copy through the page
+cache instead of unpickling its own. Each conversion is checked against the
+original model on random inputs and skipped if the probabilities disagree.
+The sha256 of the source artifact is recorded with the arrays; heart_model
+ignores a flattened copy whose artifact has since been replaced, and
+heartcare.py serve re-runs this script (--stale-only) before reloading.
+
+Usage: python models/convert_artifacts.py [--probe-rows 2000] [--stale-only]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+import numpy as np
+from models.heart_model import MODEL_PATHS, FLAT_MODEL_DIR, _get_template_layout, preprocess_features_batch
+from models.flat_trees import FlatTreeEnsemble, file_sha256, is_flat_model_dir
+
+TOLERANCE = 1e-6
+
+
+def probe_inputs(n_rows, seed=0):
+    rng = np.random.RandomState(seed)
+    rows = np.column_stack([
+        rng.randint(29, 78, n_rows), rng.randint(0, 2, n_rows), rng.randint(1, 5, n_rows),
+        rng.randint(94, 201, n_rows), rng.randint(126, 565, n_rows), rng.randint(0, 2, n_rows),
+        rng.randint(0, 3, n_rows), rng.randint(71, 203, n_rows), rng.randint(0, 2, n_rows),
+        np.round(rng.uniform(0, 6.2, n_rows), 1), rng.randint(1, 4, n_rows),
+        rng.randint(0, 4, n_rows).astype(float), rng.choice([3.0, 6.0, 7.0], n_rows),
+    ]).tolist()
+    return preprocess_features_batch(rows)
+
+
+def convert(model_name, X_probe):
+    source_sha256 = file_sha256(MODEL_PATHS[model_name])
+    model = joblib.load(MODEL_PATHS[model_name])
+    if model_name == 'random_forest':
+        flat = FlatTreeEnsemble.from_sklearn_forest(model)
+    else:
+        flat = FlatTreeEnsemble.from_xgboost(model, list(X_probe.columns))
+    flat.source_sha256 = source_sha256
+
+    expected = model.predict_proba(X_probe)[:, 1]
+    actual = flat.predict_proba(X_probe)[:, 1]
+    max_diff = float(np.max(np.abs(expected - actual)))
+    target = os.path.join(FLAT_MODEL_DIR, model_name)
+    if max_diff > TOLERANCE:
+        print(f"❌ {model_name}: flattened model disagrees with original (max diff {max_diff:.2e}), not written")
+        return False
+
+    shutil.rmtree(target, ignore_errors=True)
+    flat.save(target)
+    size = sum(os.path.getsize(os.path.join(target, f)) for f in os.listdir(target))
+    print(f"✅ {model_name}: {len(flat.roots)} trees, {len(flat.left)} nodes, {size / 1024:.0f} KiB -> {target} (max diff {max_diff:.1e})")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flatten tree models into memory-mappable NumPy arrays')
+    parser.add_argument('--probe-rows', type=int, default=2000)
+    parser.add_argument('--stale-only', action='store_true', help='Only reconvert flattened models whose artifact changed since')
+    args = parser.parse_args()
+
+    model_names = ['random_forest', 'xgboost']
+    if args.stale_only:
+        model_names = [name for name in model_names if is_flat_model_dir(os.path.join(FLAT_MODEL_DIR, name))
+                       and not is_flat_model_dir(os.path.join(FLAT_MODEL_DIR, name), MODEL_PATHS[name])]
+        if not model_names:
+            print("✅ Flattened models are up to date")
+            return
+    _get_template_layout()
+    X_probe = probe_inputs(args.probe_rows)
+    ok = [convert(model_name, X_probe) for model_name in model_names]
+    sys.exit(0 if all(ok) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Drift monitoring of incoming features and predictions
+save_record bumps one histogram bin per feature (and one for the predicted
+probability) in the drift_counts table, inside the same transaction as the
+record: a fixed 14-row upsert per request, never a scan of records.
+Predictions are counted per model (prediction:<model_name>), since each
+model has its own output distribution. /api/admin/drift compares those
+counts with a stored training baseline (PSI and KS per feature, and per
+model for the predictions).
+
+Build the baseline from the UCI training data (downloads it), or from the
+embedded UCI marginals of models/synthetic_data.py when offline:
+
+Usage: python models/drift.py --source uci
+       python models/drift.py --source synthetic --rows 100000
+"""
+
+import argparse
+import bisect
+import datetime
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+BASELINE_PATH = os.environ.get('HEARTCARE_DRIFT_BASELINE', os.path.join(os.path.dirname(__file__), '../drift_baseline.json'))
+PREDICTION = 'prediction'
+MODEL_NAMES = ['logistic', 'random_forest', 'xgboost']
+# Same order as heart_model.FEATURE_NAMES; kept here so user_model does not
+# import the models to save a record
+FEATURE_NAMES = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+
+# Continuous features are bucketed on fixed edges (bin 0 is below the first
+# edge, bin len(edges) at or above the last); categorical features use their
+# integer code as the bin
+BIN_EDGES = {
+    'age': list(range(30, 80, 5)),
+    'trestbps': list(range(100, 200, 10)),
+    'chol': list(range(150, 400, 25)),
+    'thalach': list(range(80, 200, 10)),
+    'oldpeak': [0.1, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0],
+    PREDICTION: [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9],
+}
+# PSI bands commonly used for population stability
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+EPSILON = 1e-4
+
+UPSERT_SQL = '''INSERT INTO drift_counts (feature, bin, count) VALUES (?, ?, 1)
+                ON CONFLICT(feature, bin) DO UPDATE SET count = count + 1'''
+UPSERT_MANY_SQL = '''INSERT INTO drift_counts (feature, bin, count) VALUES (?, ?, ?)
+                     ON CONFLICT(feature, bin) DO UPDATE SET count = count + excluded.count'''
+
+
+def prediction_key(model_name=None):
+    """Histogram name of a model's predictions (plain 'prediction' when the model is unknown)"""
+    return f'{PREDICTION}:{model_name}' if model_name else PREDICTION
+
+
+def _edges(feature):
+    # prediction:<model_name> histograms share the prediction edges
+    return BIN_EDGES.get(feature.split(':', 1)[0])
+
+
+def bin_of(feature, value):
+    edges = _edges(feature)
+    if edges is None:
+        return int(value)
+    return bisect.bisect_right(edges, float(value))
+
+
+def record_bins(features, prediction, model_name=None):
+    """(feature, bin) pairs for one saved record"""
+    pairs = [(name, bin_of(name, value)) for name, value in zip(FEATURE_NAMES, features)]
+    key = prediction_key(model_name)
+    pairs.append((key, bin_of(key, prediction)))
+    return pairs
+
+
+def update_counts(cursor, features, prediction, model_name=None):
+    """Add one record to the running histograms (call in the record's transaction)"""
+    cursor.executemany(UPSERT_SQL, record_bins(features, prediction, model_name))
+
+
+def update_counts_many(cursor, rows, predictions, model_name=None):
+    """update_counts for many records: binned with NumPy, one upsert per (feature, bin)"""
+    rows = np.asarray(rows, dtype=float)
+    if not len(rows):
+        return
+    histograms = {name: histogram(rows[:, j], name) for j, name in enumerate(FEATURE_NAMES)}
+    histograms[prediction_key(model_name)] = histogram(predictions, PREDICTION)
+    cursor.executemany(UPSERT_MANY_SQL, [(feature, bin_, count) for feature, bins in histograms.items()
+                                         for bin_, count in bins.items()])
+
+
+def read_counts(cursor):
+    """{feature: {bin: count}} from the drift_counts table"""
+    cursor.execute('SELECT feature, bin, count FROM drift_counts')
+    counts = {}
+    for feature, bin_, count in cursor.fetchall():
+        counts.setdefault(feature, {})[int(bin_)] = int(count)
+    return counts
+
+
+def histogram(values, feature):
+    values = np.asarray(values, dtype=float)
+    edges = _edges(feature)
+    bins = values.astype(int) if edges is None else np.searchsorted(edges, values, side='right')
+    bins, freq = np.unique(bins, return_counts=True)
+    return {int(b): int(c) for b, c in zip(bins, freq)}
+
+
+def _aligned(observed, expected):
+    bins = sorted(set(observed) | set(expected))
+    obs = np.array([observed.get(b, 0) for b in bins], dtype=float)
+    exp = np.array([expected.get(b, 0) for b in bins], dtype=float)
+    return bins, obs, exp
+
+
+def psi(observed, expected):
+    """Population stability index of two {bin: count} histograms"""
+    _, obs, exp = _aligned(observed, expected)
+    p = np.clip(obs / obs.sum(), EPSILON, None)
+    q = np.clip(exp / exp.sum(), EPSILON, None)
+    return float(np.sum((p - q) * np.log(p / q)))
+
+
+def ks(observed, expected):
+    """Kolmogorov-Smirnov statistic on the binned cumulative distributions"""
+    _, obs, exp = _aligned(observed, expected)
+    return float(np.max(np.abs(np.cumsum(obs) / obs.sum() - np.cumsum(exp) / exp.sum())))
+
+
+def compare(counts, baseline):
+    """PSI, KS and a stable/moderate/significant label per feature with observations"""
+    report = {}
+    for feature, expected in baseline['histograms'].items():
+        expected = {int(b): c for b, c in expected.items()}
+        observed = counts.get(feature)
+        if not observed:
+            continue
+        value = psi(observed, expected)
+        report[feature] = {
+            'count': sum(observed.values()),
+            'psi': value,
+            'ks': ks(observed, expected),
+            'status': 'significant' if value >= PSI_SIGNIFICANT else 'moderate' if value >= PSI_MODERATE else 'stable',
+        }
+    return report
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_baseline(rows, predictions, source):
+    """predictions: {model_name: probabilities of rows}; each model gets its own prediction histogram"""
+    rows = np.asarray(rows, dtype=float)
+    histograms = {name: histogram(rows[:, j], name) for j, name in enumerate(FEATURE_NAMES)}
+    for model_name, probabilities in predictions.items():
+        histograms[prediction_key(model_name)] = histogram(probabilities, PREDICTION)
+    return {
+        'source': source,
+        'models': sorted(predictions),
+        'rows': int(len(rows)),
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'bin_edges': BIN_EDGES,
+        'histograms': histograms,
+    }
+
+
+def main():
+    from models.heart_model import predict_heart_disease_batch
+
+    parser = argparse.ArgumentParser(description='Build the drift baseline from the training data')
+    parser.add_argument('--source', default='uci', choices=['uci', 'synthetic'])
+    parser.add_argument('--rows', type=int, default=100000, help='Rows to sample with --source synthetic')
+    parser.add_argument('--model', action='append', choices=MODEL_NAMES,
+                        help='Model whose predictions get a baseline (repeatable; default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    if args.source == 'uci':
+        from ucimlrepo import fetch_ucirepo
+        rows = fetch_ucirepo(id=45).data.features[FEATURE_NAMES].dropna().values
+    else:
+        from models.synthetic_data import PatientSampler
+        rows = PatientSampler().sample(args.rows, np.random.default_rng(args.seed))
+    # Score the same way save_record sees them: integer codes, oldpeak as float
+    rows = [[float(v) if name == 'oldpeak' else int(v) for name, v in zip(FEATURE_NAMES, row)] for row in rows]
+    predictions = {model_name: predict_heart_disease_batch(rows, model_name) for model_name in args.model or MODEL_NAMES}
+
+    baseline = build_baseline(rows, predictions, args.source)
+    with open(args.output, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    print(f"✅ Drift baseline from {len(rows):,} {args.source} rows written to {os.path.abspath(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Estimator construction shared by training and tuning
+Kept free of the serving imports so tuning worker processes stay light.
+"""
+
+import pandas as pd
+
+RANDOM_STATE = 42
+# Share of rows held out to score the trained models
+TEST_SIZE = 0.2
+
+
+def holdout_split(X, y, test_size=TEST_SIZE):
+    """(X_train, X_test, y_train, y_test): the stratified split training scores its models on"""
+    from sklearn.model_selection import train_test_split
+    return train_test_split(X, y, test_size=test_size, random_state=RANDOM_STATE, stratify=y)
+
+
+def make_estimator(model_name, params=None, n_jobs=1):
+    """Unfitted estimator with the notebook's settings, overridden by params"""
+    params = dict(params or {})
+    if model_name == 'logistic':
+        from sklearn.linear_model import LogisticRegression
+        return LogisticRegression(**dict({'max_iter': 1000, 'random_state': RANDOM_STATE}, **params))
+    if model_name == 'random_forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(**dict({'n_estimators': 100, 'random_state': RANDOM_STATE, 'n_jobs': n_jobs}, **params))
+    from xgboost import XGBClassifier
+    return XGBClassifier(**dict({'eval_metric': 'logloss', 'random_state': RANDOM_STATE, 'n_jobs': n_jobs}, **params))
+
+
+def fit_model(model_name, X_train, y_train, params=None, n_jobs=1, columns=None):
+    """Returns (model, scaler or None); logistic regression is fitted on standardized features"""
+    from sklearn.preprocessing import StandardScaler
+    model = make_estimator(model_name, params, n_jobs)
+    if model_name != 'logistic':
+        return model.fit(X_train, y_train), None
+    # Fitted on named columns like the notebook's scaler, since serving passes a DataFrame
+    X_frame = pd.DataFrame(X_train, columns=columns) if columns is not None else X_train
+    scaler = StandardScaler().fit(X_frame)
+    return model.fit(scaler.transform(X_frame), y_train), scaler
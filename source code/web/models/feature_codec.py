@@ -0,0 +1,145 @@
+"""
+Compact binary encoding of a report's features
+report_links used to keep the features as the repr of a Python list, parsed
+back with ast.literal_eval on every download. They are now stored in the
+features_blob column as one little-endian record: a format byte, the 13
+features in FEATURE_NAMES order (u8 codes, u16 for trestbps, chol and
+thalach, oldpeak as u8 tenths), then the model version that scored them as
+a u8 length and that many bytes. A model store version (UTC timestamp and
+8 hex digits of the model file's hash, see models/model_store.py) is packed
+instead into 8 bytes, a u32 epoch second and the 4 hash bytes, behind the
+length STORE_VERSION. That is 26 bytes for a model store version and 18 plus
+the text for any other (25 for 'builtin').
+
+Features that do not fit (oldpeak with more than one decimal or above 25.5,
+negative values) raise ValueError, and the caller keeps the text.
+
+decode unpacks one record with struct; decode_many reads the fixed part of
+any number of them with a single np.frombuffer, and encode_many writes them
+from one structured array.
+"""
+
+import ast
+import calendar
+import functools
+import json
+import re
+import struct
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 2
+# (feature, struct code), in FEATURE_NAMES order
+FIELDS = [
+    ('age', 'B'), ('sex', 'B'), ('cp', 'B'), ('trestbps', 'H'), ('chol', 'H'), ('fbs', 'B'), ('restecg', 'B'),
+    ('thalach', 'H'), ('exang', 'B'), ('oldpeak', 'B'), ('slope', 'B'), ('ca', 'B'), ('thal', 'B'),
+]
+N_FEATURES = len(FIELDS)
+OLDPEAK_INDEX = 9
+# Fixed part: format, the 13 features, the length of the model version that follows
+HEAD = struct.Struct('<B' + ''.join(code for _, code in FIELDS) + 'B')
+# A version length of STORE_VERSION means a packed model store version follows
+STORE_VERSION = 255
+MAX_VERSION_BYTES = STORE_VERSION - 1
+STORE_VERSION_PATTERN = re.compile(r'^(\d{14})-([0-9a-f]{8})$')
+STORE_VERSION_RECORD = struct.Struct('<I4s')
+DTYPE_CODES = {'B': 'u1', 'H': '<u2'}
+HEAD_DTYPE = np.dtype([('format', 'u1')] + [(name, DTYPE_CODES[code]) for name, code in FIELDS] + [('version_length', 'u1')])
+
+
+def encode(features, model_version=None):
+    """Pack 13 features (in FEATURE_NAMES order) and the model version that scored them"""
+    if len(features) != N_FEATURES:
+        raise ValueError(f'Expected {N_FEATURES} features, got {len(features)}: {features}')
+    version, version_length = _encode_version(model_version)
+    values = [int(v) for i, v in enumerate(features) if i != OLDPEAK_INDEX]
+    tenths = round(float(features[OLDPEAK_INDEX]) * 10)
+    if abs(tenths - float(features[OLDPEAK_INDEX]) * 10) > 1e-6:
+        raise ValueError(f'oldpeak {features[OLDPEAK_INDEX]} has more than one decimal')
+    values.insert(OLDPEAK_INDEX, tenths)
+    try:
+        return HEAD.pack(FORMAT_VERSION, *values, version_length) + version
+    except struct.error as e:
+        raise ValueError(f'Features out of range: {features} ({e})')
+
+
+def encode_many(features, model_version=None):
+    """encode for each row of an N x 13 array (FEATURE_NAMES order), all scored by the same model version"""
+    features = np.asarray(features, dtype=float)
+    if features.ndim != 2 or features.shape[1] != N_FEATURES:
+        raise ValueError(f'Expected an N x {N_FEATURES} array, got shape {features.shape}')
+    version, version_length = _encode_version(model_version)
+    values = np.trunc(features)
+    values[:, OLDPEAK_INDEX] = np.round(features[:, OLDPEAK_INDEX] * 10)
+    if np.any(np.abs(values[:, OLDPEAK_INDEX] - features[:, OLDPEAK_INDEX] * 10) > 1e-6):
+        raise ValueError('oldpeak has more than one decimal')
+    records = np.empty(len(features), dtype=HEAD_DTYPE)
+    records['format'] = FORMAT_VERSION
+    records['version_length'] = version_length
+    for j, (name, code) in enumerate(FIELDS):
+        if np.any((values[:, j] < 0) | (values[:, j] > np.iinfo(records[name].dtype).max)):
+            raise ValueError(f'{name} out of range')
+        records[name] = values[:, j]
+    data = records.tobytes()
+    return [data[i:i + HEAD.size] + version for i in range(0, len(data), HEAD.size)]
+
+
+@functools.lru_cache(maxsize=256)
+def _encode_version(model_version):
+    """(bytes, length field) of a model version; there are only a few, so they are cached"""
+    match = STORE_VERSION_PATTERN.match(model_version or '')
+    if match:
+        try:
+            seconds = calendar.timegm(time.strptime(match.group(1), '%Y%m%d%H%M%S'))
+            return STORE_VERSION_RECORD.pack(seconds, bytes.fromhex(match.group(2))), STORE_VERSION
+        except (ValueError, struct.error):
+            pass
+    version = (model_version or '').encode()
+    if len(version) > MAX_VERSION_BYTES:
+        raise ValueError(f'Model version {model_version!r} is longer than {MAX_VERSION_BYTES} bytes')
+    return version, len(version)
+
+
+def _decode_version(blob, length):
+    if length == STORE_VERSION:
+        return _store_version(blob[HEAD.size:HEAD.size + STORE_VERSION_RECORD.size])
+    return blob[HEAD.size:HEAD.size + length].decode() or None
+
+
+@functools.lru_cache(maxsize=256)
+def _store_version(packed):
+    seconds, digest = STORE_VERSION_RECORD.unpack(packed)
+    return time.strftime('%Y%m%d%H%M%S', time.gmtime(seconds)) + '-' + digest.hex()
+
+
+def decode(blob):
+    """(features, model_version) of one record; model_version is None when it was not recorded"""
+    blob = bytes(blob)
+    if blob[:1] != bytes([FORMAT_VERSION]):
+        raise ValueError(f'Unknown features format {blob[:1]!r}')
+    values = HEAD.unpack_from(blob)
+    features = list(values[1:-1])
+    features[OLDPEAK_INDEX] = features[OLDPEAK_INDEX] / 10
+    return features, _decode_version(blob, values[-1])
+
+
+def decode_many(blobs):
+    """(N x 13 float array, list of model versions) for many records at once"""
+    blobs = [bytes(blob) for blob in blobs]
+    records = np.frombuffer(b''.join(blob[:HEAD.size] for blob in blobs), dtype=HEAD_DTYPE)
+    if np.any(records['format'] != FORMAT_VERSION):
+        raise ValueError('Unknown features format')
+    features = np.column_stack([records[name] for name, _ in FIELDS]).astype(float)
+    features[:, OLDPEAK_INDEX] /= 10
+    versions = [_decode_version(blob, length) for blob, length in zip(blobs, records['version_length'].tolist())]
+    return features, versions
+
+
+def parse_text(text):
+    """Features from the legacy text form (the repr of a list, as posted by predict.html)"""
+    try:
+        # The repr of a list of ints and floats is valid JSON, which parses much faster
+        return json.loads(text)
+    except ValueError:
+        return ast.literal_eval(text)
@@ -0,0 +1,146 @@
+import json
+import os
+import numpy as np
+
+from models.model_store import file_sha256
+
+ARRAY_NAMES = ['left', 'right', 'feature', 'threshold', 'value', 'roots']
+# Optional arrays: older conversions may not have them
+OPTIONAL_ARRAY_NAMES = ['cover']
+
+
+class FlatTreeEnsemble:
+    """
+    Tree ensemble stored as flat NumPy node arrays so it can be loaded with
+    np.load(mmap_mode='r') and shared between worker processes through the page cache.
+    kind='forest' averages leaf probabilities (sklearn RandomForestClassifier, x <= threshold goes left);
+    kind='boosted' sums leaf margins plus a base margin and applies a sigmoid (XGBoost binary:logistic, x < split goes left).
+    Only exposes predict_proba, which is all the serving path uses.
+    """
+
+    def __init__(self, kind, left, right, feature, threshold, value, roots, base_margin=0.0, n_features=None, cover=None,
+                 source_sha256=None):
+        self.kind = kind
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        # Training weight reaching each node (sample count or hessian sum)
+        self.cover = cover
+        self.base_margin = float(base_margin)
+        self.n_features = n_features
+        # sha256 of the joblib artifact this was converted from
+        self.source_sha256 = source_sha256
+
+    @classmethod
+    def from_sklearn_forest(cls, forest):
+        left, right, feature, threshold, value, roots, cover = [], [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left < 0
+            counts = tree.value[:, 0, :]
+            roots.append(offset)
+            left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            # Probability of the positive class at every node
+            value.append(counts[:, 1] / counts.sum(axis=1))
+            cover.append(tree.weighted_n_node_samples)
+            offset += tree.node_count
+        return cls('forest',
+                   np.concatenate(left).astype(np.int64), np.concatenate(right).astype(np.int64),
+                   np.concatenate(feature).astype(np.int64), np.concatenate(threshold).astype(np.float64),
+                   np.concatenate(value).astype(np.float64), np.array(roots, dtype=np.int64),
+                   n_features=forest.n_features_in_, cover=np.concatenate(cover).astype(np.float64))
+
+    @classmethod
+    def from_xgboost(cls, model, feature_names):
+        booster = model.get_booster()
+        df = booster.trees_to_dataframe()
+        df['node_index'] = np.arange(len(df))
+        index_of = dict(zip(df['ID'], df['node_index']))
+        is_leaf = (df['Feature'] == 'Leaf').values
+        column_of = {name: i for i, name in enumerate(feature_names)}
+        column_of.update({f'f{i}': i for i in range(len(feature_names))})
+        feature = np.array([0 if leaf else column_of[name] for leaf, name in zip(is_leaf, df['Feature'])], dtype=np.int64)
+        left = np.array([-1 if leaf else index_of[node] for leaf, node in zip(is_leaf, df['Yes'])], dtype=np.int64)
+        right = np.array([-1 if leaf else index_of[node] for leaf, node in zip(is_leaf, df['No'])], dtype=np.int64)
+        threshold = np.where(is_leaf, 0.0, df['Split'].fillna(0.0).values).astype(np.float32)
+        value = np.where(is_leaf, df['Gain'].values, 0.0).astype(np.float64)
+        roots = df.loc[df['Node'] == 0, 'node_index'].values.astype(np.int64)
+
+        config = json.loads(booster.save_config())
+        # Newer XGBoost releases store base_score as a one-element vector, e.g. '[4.5E-1]'
+        base_score = float(str(config['learner']['learner_model_param']['base_score']).strip('[]'))
+        base_margin = np.log(base_score / (1.0 - base_score))
+        return cls('boosted', left, right, feature, threshold, value, roots,
+                   base_margin=base_margin, n_features=len(feature_names), cover=df['Cover'].values.astype(np.float64))
+
+    def leaf_indices(self, X):
+        """(n_rows, n_trees) array of the leaf node each row reaches in each tree"""
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        rows = np.arange(X.shape[0])[:, None]
+        # Advance every (row, tree) pair one level per iteration until all sit on leaves
+        while True:
+            left = self.left[nodes]
+            active = left >= 0
+            if not active.any():
+                break
+            x = X[rows, self.feature[nodes]]
+            if self.kind == 'boosted':
+                go_left = x < self.threshold[nodes]
+            else:
+                go_left = x <= self.threshold[nodes]
+            nodes = np.where(active, np.where(go_left, left, self.right[nodes]), nodes)
+        return nodes
+
+    def predict_proba(self, X):
+        leaf_values = self.value[self.leaf_indices(X)]
+        if self.kind == 'boosted':
+            p = 1.0 / (1.0 + np.exp(-(leaf_values.sum(axis=1) + self.base_margin)))
+        else:
+            p = leaf_values.mean(axis=1)
+        return np.column_stack([1.0 - p, p])
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+            if getattr(self, name) is None:
+                continue
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'kind': self.kind, 'base_margin': self.base_margin, 'n_features': self.n_features,
+                       'source_sha256': self.source_sha256}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+        for name in OPTIONAL_ARRAY_NAMES:
+            path = os.path.join(directory, f'{name}.npy')
+            if os.path.exists(path):
+                arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        return cls(meta['kind'], base_margin=meta['base_margin'], n_features=meta['n_features'],
+                   source_sha256=meta.get('source_sha256'), **arrays)
+
+
+def is_flat_model_dir(directory, source_path=None):
+    """
+    Whether directory holds a flattened model; with source_path, only one
+    converted from that artifact as it is now (a copy left over from a
+    replaced artifact, or converted before the hash was recorded, is stale)
+    """
+    meta_path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    if source_path is None:
+        return True
+    with open(meta_path) as f:
+        source_sha256 = json.load(f).get('source_sha256')
+    return source_sha256 is not None and os.path.exists(source_path) and source_sha256 == file_sha256(source_path)
@@ -1,4 +1,5 @@
 import os
+import time
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -8,7 +9,13 @@ from sklearn.metrics import confusion_matrix, accuracy_score, roc_curve, auc
 import sqlite3
 import joblib
 import pandas as pd
+from collections import namedtuple
 from ucimlrepo import fetch_ucirepo
+from models import model_store
+from models.flat_trees import FlatTreeEnsemble, is_flat_model_dir
+from services.metrics import span
+from services import shadow
+from models import calibration
 
 # Model paths
 MODEL_PATHS = {
@@ -18,9 +25,18 @@ MODEL_PATHS = {
 }
 SCALER_PATH = os.path.join(os.path.dirname(__file__), '../../notebook/models/scaler.joblib')
 SAMPLE_INPUT_PATH = os.path.join(os.path.dirname(__file__), '../../notebook/models/sample_input.json')
+# Flattened tree arrays written by models/convert_artifacts.py; used instead of the
+# joblib pickles when present so worker processes share one mmap'd copy
+FLAT_MODEL_DIR = os.path.join(os.path.dirname(__file__), '../mmap_models')
+FLAT_MODELS_ENABLED = os.environ.get('HEARTCARE_FLAT_MODELS', '1') == '1'
 
-# Lazy load models
+# Lazy load models: model_name -> LoadedModel. An entry is replaced as a whole,
+# so a request that picked one up keeps a consistent model/scaler/version.
+LoadedModel = namedtuple('LoadedModel', ['model', 'scaler', 'version'])
+BUILTIN_VERSION = 'builtin'
 _models = {}
+# Passed to joblib.load; 'r' memory-maps the numpy arrays inside uncompressed artifacts
+MODEL_MMAP_MODE = os.environ.get('HEARTCARE_MODEL_MMAP_MODE') or None
 _scaler = None
 
 # Load sample input template for column order
@@ -31,24 +47,124 @@ def _get_sample_input_df():
         _sample_input_df = pd.read_json(SAMPLE_INPUT_PATH, typ='series').to_frame().T
     return _sample_input_df.copy()
 
+def _load_builtin(model_name):
+    if model_name == 'logistic':
+        print(f"DEBUG: Loading logistic model from {MODEL_PATHS['logistic']}")
+        model = joblib.load(MODEL_PATHS['logistic'], mmap_mode=MODEL_MMAP_MODE)
+        return LoadedModel(model, _builtin_scaler(), BUILTIN_VERSION)
+    flat_dir = os.path.join(FLAT_MODEL_DIR, model_name)
+    if FLAT_MODELS_ENABLED and is_flat_model_dir(flat_dir):
+        if is_flat_model_dir(flat_dir, MODEL_PATHS[model_name]):
+            print(f"DEBUG: Memory-mapping flattened {model_name} model from {flat_dir}")
+            return LoadedModel(FlatTreeEnsemble.load(flat_dir, mmap_mode='r'), None, BUILTIN_VERSION)
+        print(f"DEBUG: Flattened {model_name} model in {flat_dir} is not from the current artifact, ignoring it")
+    print(f"DEBUG: Loading {model_name} model from {MODEL_PATHS[model_name]}")
+    return LoadedModel(joblib.load(MODEL_PATHS[model_name], mmap_mode=MODEL_MMAP_MODE), None, BUILTIN_VERSION)
+
+def _builtin_scaler():
+    global _scaler
+    if _scaler is None:
+        print(f"DEBUG: Loading scaler from {SCALER_PATH}")
+        _scaler = joblib.load(SCALER_PATH, mmap_mode=MODEL_MMAP_MODE)
+    return _scaler
+
+def _load_version(model_name, version):
+    print(f"DEBUG: Loading {model_name} version {version} from the model store")
+    model, scaler = model_store.load_version(model_name, version, mmap_mode=MODEL_MMAP_MODE)
+    if model_name == 'logistic' and scaler is None:
+        scaler = _builtin_scaler()
+    return LoadedModel(model, scaler, version)
+
+def _get_loaded(model_name):
+    """LoadedModel for model_name: the active model-store version, else the built-in artifact"""
+    entry = _models.get(model_name)
+    if entry is None:
+        if model_name not in MODEL_PATHS:
+            raise ValueError('Unknown model: ' + model_name)
+        version = model_store.active_version(model_name)
+        entry = None
+        if version:
+            try:
+                entry = _load_version(model_name, version)
+            except Exception as e:
+                print(f"DEBUG: Could not load {model_name} version {version}, using the built-in model: {e}")
+        if entry is None:
+            entry = _load_builtin(model_name)
+        _models[model_name] = entry
+    return entry
+
 def _load_model(model_name):
+    return _get_loaded(model_name).model
+
+def _predict_proba(entry, model_name, X_input):
+    if model_name == 'logistic':
+        return entry.model.predict_proba(entry.scaler.transform(X_input))[:, 1]
+    return entry.model.predict_proba(X_input)[:, 1]
+
+# Rows scored by a new version before it is swapped in
+WARMUP_ROWS = [
+    [63, 1, 3, 145, 233, 1, 0, 150, 0, 2.3, 1, 0, 1],
+    [37, 1, 2, 130, 250, 0, 1, 187, 0, 3.5, 3, 0, 3],
+    [57, 0, 4, 120, 354, 0, 2, 163, 1, 0.6, 2, 2, 7],
+    [67, 1, 4, 160, 286, 0, 2, 108, 1, 1.5, 2, 3, 6],
+]
+
+def activate_model_version(model_name, version):
+    """
+    Load a stored version, warm it up and swap it in atomically.
+    The version is verified against its manifest hashes and must return
+    valid probabilities for WARMUP_ROWS; otherwise the current model stays.
+    Requests already running finish on the model they started with.
+    """
+    if model_name not in MODEL_PATHS:
+        raise ValueError('Unknown model: ' + model_name)
+    entry = _load_version(model_name, version)
+    probs = _predict_proba(entry, model_name, preprocess_features_batch(WARMUP_ROWS))
+    if not np.all(np.isfinite(probs)) or probs.min() < 0 or probs.max() > 1:
+        raise ValueError(f'{model_name} version {version} returned invalid probabilities: {probs}')
+    _models[model_name] = entry
+    model_store.set_active(model_name, version)
+    print(f"DEBUG: Activated {model_name} version {version}")
+    return entry
+
+def model_versions():
+    """Version in service for every model (loading them if needed)"""
+    return {model_name: _get_loaded(model_name).version for model_name in MODEL_PATHS}
+
+def preload_models():
+    """
+    Load every model, the scaler and the column template up front.
+    Call in a server master process before forking workers so they share the
+    loaded pages copy-on-write; gc.freeze keeps the collector from touching
+    (and so un-sharing) those objects in the children.
+    """
+    import gc
+    for model_name in MODEL_PATHS:
+        calibration._get_table(model_name, _get_loaded(model_name).version)
+    _get_template_layout()
+    if hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+def reload_models():
+    """
+    Drop the cached models and scaler and load them again from disk.
+    If any artifact fails to load the previous objects are kept and the error
+    is raised, so a half-written artifact never replaces a working model.
+    """
     global _models, _scaler
-    if model_name not in _models:
-        if model_name == 'logistic':
-            print(f"DEBUG: Loading logistic model from {MODEL_PATHS['logistic']}")
-            _models[model_name] = joblib.load(MODEL_PATHS['logistic'])
-            if _scaler is None:
-                print(f"DEBUG: Loading scaler from {SCALER_PATH}")
-                _scaler = joblib.load(SCALER_PATH)
-        elif model_name == 'random_forest':
-            print(f"DEBUG: Loading random forest model from {MODEL_PATHS['random_forest']}")
-            _models[model_name] = joblib.load(MODEL_PATHS['random_forest'])
-        elif model_name == 'xgboost':
-            print(f"DEBUG: Loading xgboost model from {MODEL_PATHS['xgboost']}")
-            _models[model_name] = joblib.load(MODEL_PATHS['xgboost'])
-        else:
-            raise ValueError('Unknown model: ' + model_name)
-    return _models[model_name]
+    import gc
+    old_models, old_scaler = _models, _scaler
+    if hasattr(gc, 'unfreeze'):
+        gc.unfreeze()
+    _models, _scaler = {}, None
+    calibration.clear_cache()
+    try:
+        preload_models()
+    except Exception:
+        _models, _scaler = old_models, old_scaler
+        raise
+    print(f"DEBUG: Reloaded models: {sorted(_models)}")
 
 def preprocess_features(features):
     """
@@ -171,32 +287,149 @@ def preprocess_features_robust(features):
     
     return result_df
 
+FEATURE_NAMES = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg',
+                 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+CONTINUOUS_FEATURES = ['age', 'trestbps', 'chol', 'thalach', 'oldpeak']
+CATEGORICAL_FEATURES = ['sex', 'cp', 'fbs', 'restecg', 'exang', 'slope', 'ca', 'thal']
+
+# Column layout derived from the template, built once for batch preprocessing
+_template_layout = None
+def _get_template_layout():
+    global _template_layout
+    if _template_layout is None:
+        columns = _get_sample_input_df().columns
+        col_index = {col: i for i, col in enumerate(columns)}
+        dummies = {feat: [col for col in columns if col.startswith(f"{feat}_")] for feat in CATEGORICAL_FEATURES}
+        _template_layout = (columns, col_index, dummies)
+    return _template_layout
+
+def preprocess_features_batch(rows):
+    """
+    Vectorized counterpart of preprocess_features_robust for many rows at once
+    rows: sequence of 13-value feature lists in the expected order
+    Returns a DataFrame with one row per input and columns matching the template.
+    Dummy columns are matched on the same '<feature>_<value>' names that
+    pd.get_dummies produces, so each row encodes exactly as it would alone.
+    """
+    columns, col_index, dummies = _get_template_layout()
+    arr = np.empty((len(rows), len(FEATURE_NAMES)), dtype=object)
+    arr[:] = rows if isinstance(rows, np.ndarray) else [list(row) for row in rows]
+    result = np.zeros((len(rows), len(columns)), dtype=float)
+    
+    for feat in CONTINUOUS_FEATURES:
+        if feat in col_index:
+            result[:, col_index[feat]] = arr[:, FEATURE_NAMES.index(feat)].astype(float)
+    
+    for feat in CATEGORICAL_FEATURES:
+        column = arr[:, FEATURE_NAMES.index(feat)]
+        for col, match in zip(dummies[feat], _dummy_matches(column, f"{feat}_", dummies[feat])):
+            result[:, col_index[col]] = match
+    
+    return pd.DataFrame(result, columns=columns)
+
+def _dummy_matches(column, prefix, dummy_cols):
+    """
+    Boolean mask per dummy column: does f"{prefix}{value}" equal the column name?
+    When the whole column holds one numeric type (the usual case) this compares
+    numbers instead of formatting a string per row; str(kind(suffix)) == suffix
+    keeps the string semantics (int 1 matches 'ca_1', float 1.0 matches 'ca_1.0').
+    """
+    kinds = set(map(type, column))
+    if len(kinds) == 1 and kinds <= {int, float}:
+        kind = kinds.pop()
+        try:
+            values = column.astype(np.int64 if kind is int else float)
+        except OverflowError:
+            values = None
+        if values is not None:
+            masks = []
+            for col in dummy_cols:
+                suffix = col[len(prefix):]
+                try:
+                    target = kind(suffix)
+                except ValueError:
+                    target = None
+                masks.append(values == target if target is not None and str(target) == suffix else np.zeros(len(column), dtype=bool))
+            return masks
+    keys = np.array([f"{prefix}{value}" for value in column])
+    return [keys == col for col in dummy_cols]
+
+def predict_heart_disease_batch(rows, model_name='logistic'):
+    """
+    Score many patients with a single predict_proba call
+    rows: sequence of 13-value feature lists in the same order as predict_heart_disease
+    Returns a float NumPy array of disease probabilities, one per row
+    """
+    return predict_heart_disease_batch_versioned(rows, model_name)[0]
+
+def predict_heart_disease_batch_versioned(rows, model_name='logistic', entry=None):
+    """
+    predict_heart_disease_batch, also returning the model version that scored the rows
+    entry: the LoadedModel to score with (default: the one in service)
+    """
+    rows = list(rows)
+    for features in rows:
+        if not isinstance(features, (list, tuple)) or len(features) != 13:
+            raise ValueError(f'Expected 13 features in the order: [age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal], but got {len(features)}: {features}')
+    entry = entry or _get_loaded(model_name)
+    if not rows:
+        return np.empty(0, dtype=float), entry.version
+    
+    with span('preprocess_batch'):
+        X_input = preprocess_features_batch(rows)
+    
+    with span('predict_proba'):
+        start = time.perf_counter()
+        preds = _predict_proba(entry, model_name, X_input)
+        elapsed = time.perf_counter() - start
+    # Score the configured candidate on the same encoded rows in the background
+    shadow.observe(model_name, entry.version, X_input, preds, elapsed)
+    # Map onto the version's calibration table (if one was fitted) before the risk thresholds
+    preds = calibration.apply(model_name, entry.version, preds)
+    
+    print(f"DEBUG: Batch scored {len(rows)} rows with {model_name} ({entry.version})")
+    return preds.astype(float), entry.version
+
 def predict_heart_disease(features, model_name='logistic'):
     # Expected feature order:
     # ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+    if not isinstance(features, (list, tuple)) or len(features) != 13:
+        raise ValueError(f'Expected 13 features in the order: [age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal], but got {len(features)}: {features}')
+    return predict_heart_disease_versioned(features, model_name)[0]
+
+def predict_heart_disease_versioned(features, model_name='logistic'):
+    """predict_heart_disease, also returning the model version that produced the probability"""
     if not isinstance(features, (list, tuple)) or len(features) != 13:
         raise ValueError(f'Expected 13 features in the order: [age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal], but got {len(features)}: {features}')
     
-    model = _load_model(model_name)
+    entry = _get_loaded(model_name)
     
     # Use the robust preprocessing function
-    X_input = preprocess_features_robust(features)
+    with span('preprocess_features_robust'):
+        X_input = preprocess_features_robust(features)
     
     print("DEBUG: Raw features:", features)
     print("DEBUG: Preprocessed input columns:", list(X_input.columns))
     print("DEBUG: Preprocessed input values:", X_input.values)
     
+    with span('predict_proba'):
+        start = time.perf_counter()
+        if model_name == 'logistic':
+            arr_scaled = entry.scaler.transform(X_input)
+            pred = entry.model.predict_proba(arr_scaled)[0][1]
+        else:
+            pred = entry.model.predict_proba(X_input)[0][1]
+        elapsed = time.perf_counter() - start
     if model_name == 'logistic':
-        arr_scaled = _scaler.transform(X_input)
         print("DEBUG: Scaled input:", arr_scaled)
-        pred = model.predict_proba(arr_scaled)[0][1]
-    else:
-        pred = model.predict_proba(X_input)[0][1]
+    shadow.observe(model_name, entry.version, X_input, [pred], elapsed)
+    pred = calibration.apply(model_name, entry.version, pred)
     
-    print("DEBUG: Predicted probability:", pred)
-    return float(pred)
+    print(f"DEBUG: Predicted probability ({entry.version}):", pred)
+    return float(pred), entry.version
 
-def get_model_performance(model_name='logistic'):
+def get_model_performance(model_name='logistic', entry=None):
+    """Accuracy, confusion matrix and charts of entry (default: the model in service) on the UCI data"""
     # Load UCI Heart Disease dataset using ucimlrepo
     heart_disease = fetch_ucirepo(id=45)
     X = heart_disease.data.features
@@ -214,14 +447,13 @@ def get_model_performance(model_name='logistic'):
     template = _get_sample_input_df()
     X = X.reindex(columns=template.columns, fill_value=0)
     
+    entry = entry or _get_loaded(model_name)
     if model_name == 'logistic':
-        scaler = _scaler if _scaler is not None else joblib.load(SCALER_PATH)
-        X_proc = scaler.transform(X)
+        X_proc = entry.scaler.transform(X)
     else:
         X_proc = X.values
     
-    model = _load_model(model_name)
-    y_score = model.predict_proba(X_proc)[:,1]
+    y_score = entry.model.predict_proba(X_proc)[:,1]
     y_pred = (y_score >= 0.5).astype(int)
     
     acc = accuracy_score(y_true, y_pred)
@@ -286,7 +518,7 @@ def get_model_performance(model_name='logistic'):
     }
 
 def get_total_reports():
-    DB_PATH = os.path.join(os.path.dirname(__file__), '../../web/users.db')
+    from models.user_model import DB_PATH
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute('SELECT COUNT(*) FROM records')
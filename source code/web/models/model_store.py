@@ -0,0 +1,144 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import joblib
+
+# One directory per model, one subdirectory per version:
+#   model_store/<model_name>/<version>/{model.joblib, scaler.joblib?, manifest.json}
+#   model_store/<model_name>/ACTIVE   (name of the version in service)
+MODEL_STORE_DIR = os.environ.get('HEARTCARE_MODEL_STORE', os.path.join(os.path.dirname(__file__), '../model_store'))
+MANIFEST_NAME = 'manifest.json'
+ACTIVE_NAME = 'ACTIVE'
+MODEL_FILE = 'model.joblib'
+SCALER_FILE = 'scaler.joblib'
+
+
+class ModelStoreError(Exception):
+    """Raised for missing versions and artifacts that fail their hash check"""
+
+
+def _model_dir(model_name):
+    return os.path.join(MODEL_STORE_DIR, model_name)
+
+
+def _version_dir(model_name, version):
+    if not version or os.sep in version or version.startswith('.'):
+        raise ModelStoreError(f'Invalid version: {version!r}')
+    return os.path.join(_model_dir(model_name), version)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def publish(model_name, model_path, scaler_path=None, version=None, metadata=None):
+    """
+    Copy an artifact (and optionally its scaler) into the store as a new version
+    The version directory is written under a temporary name and renamed into
+    place, so readers never see a partial version. Returns the manifest.
+    """
+    files = {MODEL_FILE: model_path}
+    if scaler_path:
+        files[SCALER_FILE] = scaler_path
+    hashes = {name: file_sha256(path) for name, path in files.items()}
+    if version is None:
+        version = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S') + '-' + hashes[MODEL_FILE][:8]
+    target = _version_dir(model_name, version)
+    if os.path.exists(target):
+        raise ModelStoreError(f'{model_name} version {version} already exists')
+
+    staging = os.path.join(_model_dir(model_name), f'.staging-{uuid.uuid4().hex}')
+    os.makedirs(staging)
+    try:
+        for name, path in files.items():
+            shutil.copyfile(path, os.path.join(staging, name))
+        manifest = {
+            'model_name': model_name,
+            'version': version,
+            'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'files': hashes,
+            'metadata': metadata or {},
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    print(f"DEBUG: Published {model_name} version {version}")
+    return manifest
+
+
+def read_manifest(model_name, version):
+    path = os.path.join(_version_dir(model_name, version), MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise ModelStoreError(f'{model_name} version {version} not found')
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_versions(model_name):
+    """Manifests of every stored version, oldest first"""
+    model_dir = _model_dir(model_name)
+    if not os.path.isdir(model_dir):
+        return []
+    manifests = []
+    for version in os.listdir(model_dir):
+        if os.path.exists(os.path.join(model_dir, version, MANIFEST_NAME)):
+            manifests.append(read_manifest(model_name, version))
+    return sorted(manifests, key=lambda m: m['created_at'])
+
+
+def verify(model_name, version):
+    """Recompute the artifact hashes; returns the manifest or raises ModelStoreError"""
+    manifest = read_manifest(model_name, version)
+    version_dir = _version_dir(model_name, version)
+    for name, expected in manifest['files'].items():
+        path = os.path.join(version_dir, name)
+        if not os.path.exists(path) or file_sha256(path) != expected:
+            raise ModelStoreError(f'{model_name} version {version}: {name} does not match its manifest hash')
+    return manifest
+
+
+def load_version(model_name, version, mmap_mode=None):
+    """Verify and load a stored version; returns (model, scaler or None)"""
+    manifest = verify(model_name, version)
+    version_dir = _version_dir(model_name, version)
+    model = joblib.load(os.path.join(version_dir, MODEL_FILE), mmap_mode=mmap_mode)
+    scaler = None
+    if SCALER_FILE in manifest['files']:
+        scaler = joblib.load(os.path.join(version_dir, SCALER_FILE), mmap_mode=mmap_mode)
+    return model, scaler
+
+
+def active_version(model_name):
+    """Version recorded as in service, or None to use the built-in artifact"""
+    try:
+        with open(os.path.join(_model_dir(model_name), ACTIVE_NAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_active(model_name, version):
+    """Atomically record the version in service (read by new workers and the reload watcher)"""
+    if version is not None:
+        read_manifest(model_name, version)
+    os.makedirs(_model_dir(model_name), exist_ok=True)
+    pointer = os.path.join(_model_dir(model_name), ACTIVE_NAME)
+    tmp = f'{pointer}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(version or '')
+    os.replace(tmp, pointer)
+
+
+def active_pointer_paths(model_names):
+    return [os.path.join(_model_dir(name), ACTIVE_NAME) for name in model_names]
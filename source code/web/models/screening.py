@@ -0,0 +1,149 @@
+"""
+Bulk screening of a CSV of patients
+The file is parsed CHUNK_SIZE rows at a time. Each chunk is validated with
+column-wise checks (the same codes and ranges as the predict form), its valid
+rows are scored with one batch prediction and saved with one executemany
+transaction, and a result CSV for the chunk is yielded before the next chunk
+is read. Memory therefore depends on the chunk size, not the file size.
+
+Input: a header row naming the 13 feature columns (any order; other columns
+are ignored). Output: row (1-based data row of the input), the 13 features,
+probability, prediction, risk_level, model_version and error (set for rows
+that were not scored). Rows that were not scored echo their input cells; a
+cell a spreadsheet would run as a formula (starting with = + - @, tab or
+carriage return) is prefixed with a single quote.
+
+Used by POST /api/screening and python heartcare.py screen.
+"""
+
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+from models import user_model
+
+CHUNK_SIZE = 10000
+FEATURE_NAMES = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+# Allowed codes of the categorical features and (min, max) of the numeric ones, as in predict.html
+CATEGORIES = {
+    'sex': [0, 1], 'cp': [1, 2, 3, 4], 'fbs': [0, 1], 'restecg': [0, 1, 2], 'exang': [0, 1],
+    'slope': [1, 2, 3], 'ca': [0, 1, 2, 3, 4], 'thal': [3, 6, 7],
+}
+RANGES = {'age': (18, 100), 'trestbps': (80, 200), 'chol': (100, 600), 'thalach': (60, 220), 'oldpeak': (0, 10)}
+OUTPUT_COLUMNS = ['row'] + FEATURE_NAMES + ['probability', 'prediction', 'risk_level', 'model_version', 'error']
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ScreeningError(ValueError):
+    """Raised for a file that cannot be screened at all (e.g. missing feature columns)"""
+
+
+def risk_level(probs):
+    """Vectorized get_risk_level: High >= 0.7, Medium >= 0.4, Low otherwise"""
+    return np.where(probs >= 0.7, 'High', np.where(probs >= 0.4, 'Medium', 'Low'))
+
+
+def read_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over DataFrame chunks of the feature columns (as strings).
+    The header is checked before the first chunk is returned, so a bad file
+    fails before anything is written.
+    """
+    try:
+        reader = pd.read_csv(source, chunksize=chunk_size, dtype=str, skipinitialspace=True, keep_default_na=False)
+        first = next(iter(reader), None)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise ScreeningError(f'Could not read the CSV: {e}')
+    if first is None:
+        raise ScreeningError('The CSV has a header but no rows')
+    first.columns = [str(col).strip().lower() for col in first.columns]
+    missing = [name for name in FEATURE_NAMES if name not in first.columns]
+    if missing:
+        raise ScreeningError(f'Missing columns: {", ".join(missing)} (expected {", ".join(FEATURE_NAMES)})')
+
+    def chunks():
+        yield first[FEATURE_NAMES]
+        try:
+            for chunk in reader:
+                chunk.columns = first.columns
+                yield chunk[FEATURE_NAMES]
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
+            raise ScreeningError(f'Could not read the CSV: {e}')
+    return chunks()
+
+
+def validate(chunk):
+    """(values, errors): the chunk as an N x 13 float array and an error message per row ('' when valid)"""
+    values = chunk.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    bad = np.isnan(values)
+    for j, name in enumerate(FEATURE_NAMES):
+        column = values[:, j]
+        with np.errstate(invalid='ignore'):
+            if name in CATEGORIES:
+                bad[:, j] |= ~np.isin(column, CATEGORIES[name])
+            else:
+                low, high = RANGES[name]
+                bad[:, j] |= (column < low) | (column > high)
+                if name != 'oldpeak':
+                    bad[:, j] |= column != np.floor(column)
+    errors = np.full(len(chunk), '', dtype=object)
+    for i in np.flatnonzero(bad.any(axis=1)):
+        errors[i] = 'Invalid ' + ', '.join(name for name, is_bad in zip(FEATURE_NAMES, bad[i]) if is_bad)
+    return values, errors
+
+
+def _escape_cell(value):
+    """An input cell made inert for spreadsheets (CSV formula injection)"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _typed_rows(values):
+    """Rows typed like parse_features: integer codes, oldpeak as float"""
+    columns = [values[:, j].tolist() if name == 'oldpeak' else values[:, j].astype(int).tolist() for j, name in enumerate(FEATURE_NAMES)]
+    return [list(row) for row in zip(*columns)]
+
+
+def screen(chunks, predict, model_name='logistic', user_id=None, summary=None):
+    """
+    Yield the result CSV text chunk by chunk.
+    predict(rows, model_name) -> (probabilities, model_version) scores the
+    valid rows of a chunk; when user_id is given they are saved to records.
+    summary (a dict) is updated with row counts as the chunks go through.
+    """
+    summary = summary if summary is not None else {}
+    summary.update(rows=0, scored=0, invalid=0, high_risk=0, model_version=None)
+    yield ','.join(OUTPUT_COLUMNS) + '\n'
+    offset = 0
+    for chunk in chunks:
+        values, errors = validate(chunk)
+        valid = errors == ''
+        scored = iter(())
+        if valid.any():
+            rows = _typed_rows(values[valid])
+            probs, model_version = predict(rows, model_name)
+            probs = np.asarray(probs, dtype=float)
+            if user_id is not None:
+                user_model.save_records(user_id, rows, probs.tolist(), model_version, model_name)
+            labels = np.where(probs >= 0.5, 'High Risk', 'Low Risk')
+            scored = zip(rows, np.round(probs, 6).tolist(), labels.tolist(), risk_level(probs).tolist())
+            summary['scored'] += len(rows)
+            summary['high_risk'] += int((probs >= 0.5).sum())
+            summary['model_version'] = model_version
+
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        raw = chunk.to_numpy(dtype=object)
+        for i, is_valid in enumerate(valid.tolist()):
+            if is_valid:
+                features, prob, label, level = next(scored)
+                writer.writerow([offset + i + 1, *features, prob, label, level, model_version, ''])
+            else:
+                writer.writerow([offset + i + 1, *map(_escape_cell, raw[i]), '', '', '', '', errors[i]])
+        offset += len(chunk)
+        summary['rows'] = offset
+        summary['invalid'] = offset - summary['scored']
+        yield buf.getvalue()
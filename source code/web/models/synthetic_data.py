@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Synthetic patient data for scale testing
+Samples the 13 model features from the UCI heart disease marginals with a
+Gaussian copula for their correlations, scores them in batch through the real
+models and bulk-loads users, records and report_links into a SQLite database.
+Output is identical for the same --seed and --chunk-size into the same
+database, apart from the salt
+of the one password hash all synthetic users share and the expiry of live
+report links. Report links are created over the --days before --end (a fixed
+date by default, not today). A --live-fraction share of them (chosen by the
+seed) expires LINK_HOURS after the generation time, so they can be downloaded
+right after generating; the others expired LINK_HOURS after their creation,
+as they would in production.
+
+By default the marginals/correlations embedded below (summarised from the
+Cleveland data that get_model_performance fetches) are used; --from-uci
+re-derives them from the downloaded dataset instead.
+
+Usage: python models/synthetic_data.py --users 100000 --records 2000000 --reports 500000
+       python models/synthetic_data.py --db users.db --records 10000 --from-uci
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+from werkzeug.security import generate_password_hash
+
+from models import feature_codec, user_model
+from models.heart_model import FEATURE_NAMES, CONTINUOUS_FEATURES, predict_heart_disease_batch
+from models.clinical_rules import explain_batch
+from services.passwords import PASSWORD_METHOD
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), '../users_synthetic.db')
+DEFAULT_END = '2025-01-01'
+# Lifetime of a report link, as in user_model.save_report_link
+LINK_HOURS = 24
+SYNTHETIC_PASSWORD = 'synthetic'
+
+# Continuous features: quantile function knots (probability, value) and decimals kept
+QUANTILE_PROBS = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+CONTINUOUS_MARGINALS = {
+    'age': ([29, 42, 48, 56, 61, 66, 77], 0),
+    'trestbps': ([94, 110, 120, 130, 140, 152, 200], 0),
+    'chol': ([126, 188, 211, 241, 275, 309, 564], 0),
+    'thalach': ([71, 116, 133, 153, 166, 177, 202], 0),
+    'oldpeak': ([0.0, 0.0, 0.0, 0.8, 1.6, 2.8, 6.2], 1),
+}
+# Categorical features: value -> probability
+CATEGORICAL_MARGINALS = {
+    'sex': {0: 0.32, 1: 0.68},
+    'cp': {1: 0.076, 2: 0.165, 3: 0.284, 4: 0.475},
+    'fbs': {0: 0.851, 1: 0.149},
+    'restecg': {0: 0.498, 1: 0.013, 2: 0.489},
+    'exang': {0: 0.673, 1: 0.327},
+    'slope': {1: 0.469, 2: 0.462, 3: 0.069},
+    'ca': {0: 0.587, 1: 0.215, 2: 0.127, 3: 0.071},
+    'thal': {3: 0.552, 6: 0.060, 7: 0.388},
+}
+# Pairwise correlations between the features (unlisted pairs are ~0)
+CORRELATIONS = {
+    ('age', 'sex'): -0.10, ('age', 'cp'): 0.10, ('age', 'trestbps'): 0.28, ('age', 'chol'): 0.21,
+    ('age', 'fbs'): 0.12, ('age', 'restecg'): 0.15, ('age', 'thalach'): -0.39, ('age', 'exang'): 0.09,
+    ('age', 'oldpeak'): 0.21, ('age', 'slope'): 0.16, ('age', 'ca'): 0.36, ('age', 'thal'): 0.13,
+    ('sex', 'chol'): -0.20, ('sex', 'ca'): 0.09, ('sex', 'thal'): 0.38,
+    ('cp', 'thalach'): -0.33, ('cp', 'exang'): 0.38, ('cp', 'oldpeak'): 0.20, ('cp', 'slope'): 0.15,
+    ('cp', 'ca'): 0.23, ('cp', 'thal'): 0.27,
+    ('trestbps', 'chol'): 0.13, ('trestbps', 'fbs'): 0.18, ('trestbps', 'restecg'): 0.15, ('trestbps', 'oldpeak'): 0.19,
+    ('chol', 'restecg'): 0.17,
+    ('thalach', 'exang'): -0.38, ('thalach', 'oldpeak'): -0.34, ('thalach', 'slope'): -0.39,
+    ('thalach', 'ca'): -0.26, ('thalach', 'thal'): -0.26,
+    ('exang', 'oldpeak'): 0.29, ('exang', 'slope'): 0.26, ('exang', 'ca'): 0.15, ('exang', 'thal'): 0.33,
+    ('oldpeak', 'slope'): 0.58, ('oldpeak', 'ca'): 0.30, ('oldpeak', 'thal'): 0.34,
+    ('slope', 'ca'): 0.11, ('slope', 'thal'): 0.29,
+    ('ca', 'thal'): 0.26,
+}
+
+
+def _nearest_correlation(matrix):
+    # Clip negative eigenvalues so the matrix is positive definite, then rescale to unit diagonal
+    values, vectors = np.linalg.eigh(matrix)
+    fixed = vectors @ np.diag(np.clip(values, 1e-6, None)) @ vectors.T
+    scale = np.sqrt(np.diag(fixed))
+    return fixed / np.outer(scale, scale)
+
+
+class PatientSampler:
+    """
+    Gaussian copula over the 13 features: draw correlated standard normals,
+    map them to uniforms and push each through its feature's inverse CDF.
+    Continuous features use a piecewise-linear quantile function, categorical
+    ones a cumulative probability table.
+    """
+
+    def __init__(self, continuous=CONTINUOUS_MARGINALS, categorical=CATEGORICAL_MARGINALS, correlation=None, quantile_probs=QUANTILE_PROBS):
+        self.continuous = continuous
+        self.categorical = categorical
+        self.quantile_probs = np.asarray(quantile_probs, dtype=float)
+        if correlation is None:
+            correlation = np.eye(len(FEATURE_NAMES))
+            for (a, b), rho in CORRELATIONS.items():
+                i, j = FEATURE_NAMES.index(a), FEATURE_NAMES.index(b)
+                correlation[i, j] = correlation[j, i] = rho
+        self.cholesky = np.linalg.cholesky(_nearest_correlation(np.asarray(correlation, dtype=float)))
+
+    @classmethod
+    def from_uci(cls):
+        """Derive marginals and normal-score correlations from the UCI dataset (downloads it)"""
+        from ucimlrepo import fetch_ucirepo
+        data = fetch_ucirepo(id=45).data.features[FEATURE_NAMES].dropna()
+        probs = np.linspace(0, 1, 101)
+        continuous = {feat: (np.quantile(data[feat], probs).tolist(), 1 if feat == 'oldpeak' else 0) for feat in CONTINUOUS_FEATURES}
+        categorical = {}
+        for feat in FEATURE_NAMES:
+            if feat not in CONTINUOUS_FEATURES:
+                counts = data[feat].astype(int).value_counts(normalize=True).sort_index()
+                categorical[feat] = dict(zip(counts.index.tolist(), counts.values.tolist()))
+        # Correlation of normal scores (van der Waerden), the copula's own parameter
+        ranks = data.rank(method='average').values
+        scores = ndtri(ranks / (len(data) + 1))
+        return cls(continuous, categorical, np.corrcoef(scores, rowvar=False), probs)
+
+    def sample(self, n_rows, rng):
+        """(n_rows, 13) float array of raw features in FEATURE_NAMES order"""
+        z = rng.standard_normal((n_rows, len(FEATURE_NAMES))) @ self.cholesky.T
+        u = ndtr(z)
+        X = np.empty_like(u)
+        for j, feat in enumerate(FEATURE_NAMES):
+            if feat in self.continuous:
+                knots, decimals = self.continuous[feat]
+                X[:, j] = np.round(np.interp(u[:, j], self.quantile_probs, knots), decimals)
+            else:
+                values = np.array(list(self.categorical[feat].keys()), dtype=float)
+                cumulative = np.cumsum(list(self.categorical[feat].values()))
+                index = np.searchsorted(cumulative / cumulative[-1], u[:, j], side='right')
+                X[:, j] = values[np.minimum(index, len(values) - 1)]
+        return X
+
+
+def _connect(db_path):
+    user_model.DB_PATH = db_path
+    user_model.init_db()
+    conn = sqlite3.connect(db_path)
+    # Bulk-load settings: this is a throwaway scale-testing database, so trade
+    # crash safety for speed
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')
+    return conn
+
+
+def _chunks(total, chunk_size):
+    for index, start in enumerate(range(0, total, chunk_size)):
+        yield index, min(chunk_size, total - start)
+
+
+def generate_users(conn, n_users, seed, chunk_size):
+    """
+    Insert n_users users sharing one password hash; returns their id range
+    Usernames carry the id the user gets, so generating again into the same
+    database (with the same seed) adds new users instead of colliding.
+    """
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD, PASSWORD_METHOD)
+    first_id = (conn.execute('SELECT MAX(id) FROM users').fetchone()[0] or 0) + 1
+    with conn:
+        for index, size in _chunks(n_users, chunk_size):
+            offset = first_id + index * chunk_size
+            conn.executemany('INSERT INTO users (username, password, name, email) VALUES (?, ?, ?, ?)', (
+                (f'synth_{seed}_{i}', password_hash, f'Synthetic Patient {i}', f'synth_{seed}_{i}@example.com')
+                for i in range(offset, offset + size)))
+    last_id = conn.execute('SELECT MAX(id) FROM users').fetchone()[0]
+    return first_id, last_id
+
+
+def _scored_chunk(sampler, model_name, seed, stream, start, index, size, user_ids):
+    """
+    Sample and score one chunk; each (seed, stream, rows already in the table,
+    chunk) gets its own generator, so a rerun into the same database adds new
+    rows (and report ids) rather than repeating the first run's
+    Feature columns are returned as Python ints (oldpeak as float), the types the
+    web form produces, so the model sees exactly what it sees when serving.
+    The sampled array itself is returned too, for feature_codec.encode_many.
+    """
+    rng = np.random.default_rng([seed, stream, start, index])
+    X = sampler.sample(size, rng)
+    columns = [X[:, j].tolist() if feat == 'oldpeak' else X[:, j].astype(int).tolist() for j, feat in enumerate(FEATURE_NAMES)]
+    rows = list(zip(*columns))
+    predictions = predict_heart_disease_batch(rows, model_name)
+    owners = rng.integers(user_ids[0], user_ids[1] + 1, size)
+    return rng, X, rows, columns, predictions, owners
+
+
+def generate_records(conn, sampler, n_records, user_ids, model_name, seed, chunk_size):
+    columns = ', '.join(['user_id'] + FEATURE_NAMES + ['risk'])
+    sql = f'INSERT INTO records ({columns}) VALUES ({", ".join("?" * (len(FEATURE_NAMES) + 2))})'
+    start = conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+    with conn:
+        for index, size in _chunks(n_records, chunk_size):
+            _, _, _, features, predictions, owners = _scored_chunk(sampler, model_name, seed, 1, start, index, size, user_ids)
+            conn.executemany(sql, zip(owners.tolist(), *features, predictions.tolist()))
+
+
+def _timestamps(seconds):
+    # 'YYYY-MM-DD HH:MM:SS' strings (UTC, like SQLite's datetime('now'))
+    return np.char.replace(np.datetime_as_string(seconds.astype('datetime64[s]')), 'T', ' ').tolist()
+
+
+def _uuid4_strings(id_bytes):
+    # str(uuid.UUID(bytes=b, version=4)) for each 16 bytes, without building UUID objects
+    ids = np.frombuffer(id_bytes, dtype=np.uint8).reshape(-1, 16).copy()
+    ids[:, 6] = ids[:, 6] & 0x0f | 0x40
+    ids[:, 8] = ids[:, 8] & 0x3f | 0x80
+    hexes = ids.tobytes().hex()
+    return [f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}' for h in (hexes[i:i + 32] for i in range(0, len(hexes), 32))]
+
+
+def generate_report_links(conn, sampler, n_reports, user_ids, model_name, seed, chunk_size, end, days, live_fraction, generated_at):
+    sql = '''INSERT INTO report_links (user_id, report_id, prediction, reasoning, recommendations, features_blob, created_at, expires_at)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+    end_ts = (end - datetime.datetime(1970, 1, 1)).total_seconds()
+    live_expiry = int(generated_at) + LINK_HOURS * 3600
+    start = conn.execute('SELECT COUNT(*) FROM report_links').fetchone()[0]
+    with conn:
+        for index, size in _chunks(n_reports, chunk_size):
+            rng, X, rows, _, predictions, owners = _scored_chunk(sampler, model_name, seed, 2, start, index, size, user_ids)
+            reasonings, recommendations = explain_batch(rows, predictions)
+            created = np.floor(end_ts - rng.uniform(0, days * 86400, size)).astype(np.int64)
+            report_ids = _uuid4_strings(rng.bytes(16 * size))
+            expires = np.where(rng.uniform(0, 1, size) < live_fraction, live_expiry, created + LINK_HOURS * 3600)
+            conn.executemany(sql, zip(
+                owners.tolist(), report_ids, predictions.tolist(), reasonings, map(str, recommendations),
+                feature_codec.encode_many(X), _timestamps(created), _timestamps(expires)))
+
+
+def _timed_step(label, n_rows, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {label}: {n_rows:,} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic users, records and report links')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='SQLite database to fill (created if missing)')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--reports', type=int, default=20000)
+    parser.add_argument('--model', default='logistic', choices=['logistic', 'random_forest', 'xgboost'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--days', type=float, default=30, help='Spread report creation times over this many days')
+    parser.add_argument('--end', default=DEFAULT_END, help='Newest report creation date (YYYY-MM-DD, at least a day ago)')
+    parser.add_argument('--live-fraction', type=float, default=0.5, help='Share of report links still valid after generating')
+    parser.add_argument('--from-uci', action='store_true', help='Derive marginals/correlations from the UCI download')
+    args = parser.parse_args()
+
+    sampler = PatientSampler.from_uci() if args.from_uci else PatientSampler()
+    end = datetime.datetime.strptime(args.end, '%Y-%m-%d')
+    generated_at = time.time()
+    if (end - datetime.datetime(1970, 1, 1)).total_seconds() > generated_at - LINK_HOURS * 3600:
+        sys.exit(f"❌ --end must be at least {LINK_HOURS} hours ago, so links that should have expired have")
+    if not 0 <= args.live_fraction <= 1:
+        sys.exit("❌ --live-fraction must be between 0 and 1")
+    conn = _connect(args.db)
+    print(f"🔄 Generating into {os.path.abspath(args.db)} (seed {args.seed}, model {args.model})")
+    try:
+        if args.users > 0:
+            user_ids = _timed_step('users', args.users, generate_users, conn, args.users, args.seed, args.chunk_size)
+        else:
+            user_ids = conn.execute('SELECT MIN(id), MAX(id) FROM users').fetchone()
+            if user_ids[0] is None:
+                sys.exit("❌ No users in the database; generate some with --users")
+        _timed_step('records', args.records, generate_records, conn, sampler, args.records, user_ids, args.model, args.seed, args.chunk_size)
+        _timed_step('report_links', args.reports, generate_report_links, conn, sampler, args.reports, user_ids, args.model, args.seed, args.chunk_size, end, args.days,
+                    args.live_fraction, generated_at)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
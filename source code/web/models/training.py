@@ -0,0 +1,182 @@
+"""
+Training pipeline for the three serving models
+The steps of notebook/Regression Heart.ipynb (binary target, 80/20 stratified
+split, StandardScaler + LogisticRegression, RandomForest, XGBoost) as a
+reproducible module. Rows are streamed from a CSV file (or the UCI download)
+and, optionally, from records with a clinician-confirmed outcome, encoded with
+preprocess_features_batch so the design matrix has exactly the columns and
+values serving produces, and cached as .npz between runs. The three models are
+fitted concurrently and published to the model store as one version.
+
+Run it through the command line: python heartcare.py train --help
+"""
+
+import datetime
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from models import model_store, user_model
+from models.estimators import TEST_SIZE, fit_model, holdout_split
+from models.heart_model import FEATURE_NAMES, preprocess_features_batch, _get_template_layout
+
+TRAINING_CACHE_DIR = os.environ.get('HEARTCARE_TRAINING_CACHE', os.path.join(os.path.dirname(__file__), '../training_cache'))
+# Target column names accepted in CSV files: 'target' (0/1) or UCI's 'num' (0-4)
+TARGET_COLUMNS = ['target', 'num']
+MODEL_NAMES = ['logistic', 'random_forest', 'xgboost']
+CHUNK_SIZE = 50000
+
+
+def _typed_rows(frame):
+    """Feature rows typed like parse_features: integer codes, oldpeak as float"""
+    frame = frame[FEATURE_NAMES].dropna()
+    rows = [frame[name].astype(int if name != 'oldpeak' else float).tolist() for name in FEATURE_NAMES]
+    return [list(row) for row in zip(*rows)], frame.index
+
+
+def iter_csv(path, chunk_size=CHUNK_SIZE):
+    """Yield (rows, labels) chunks from a CSV with the 13 feature columns and a target column"""
+    header = pd.read_csv(path, nrows=0).columns
+    target = next((col for col in TARGET_COLUMNS if col in header), None)
+    if target is None:
+        raise ValueError(f'{path} needs a target column (one of {TARGET_COLUMNS})')
+    for chunk in pd.read_csv(path, usecols=FEATURE_NAMES + [target], chunksize=chunk_size):
+        chunk = chunk.dropna(subset=[target])
+        rows, index = _typed_rows(chunk)
+        yield rows, (chunk.loc[index, target].values > 0).astype(np.int8)
+
+
+def iter_uci():
+    """The UCI heart disease data the shipped models were trained on (downloads it)"""
+    from ucimlrepo import fetch_ucirepo
+    data = fetch_ucirepo(id=45).data
+    targets = data.targets.iloc[:, 0] if isinstance(data.targets, pd.DataFrame) else data.targets
+    rows, index = _typed_rows(data.features)
+    yield rows, (targets.loc[index].values > 0).astype(np.int8)
+
+
+def iter_confirmed_records(chunk_size=CHUNK_SIZE):
+    """Yield (rows, labels) chunks of records a clinician has confirmed an outcome for"""
+    for chunk in user_model.iter_confirmed_records(chunk_size):
+        rows, labels = [], []
+        for record in chunk:
+            rows.append([float(record[name]) if name == 'oldpeak' else int(record[name]) for name in FEATURE_NAMES])
+            labels.append(int(record['confirmed_outcome'] > 0))
+        yield rows, np.array(labels, dtype=np.int8)
+
+
+def _cache_key(source, include_records):
+    columns = list(_get_template_layout()[0])
+    digest = hashlib.sha256(('|'.join(columns) + '|' + source).encode())
+    if source != 'uci':
+        digest.update(model_store.file_sha256(source).encode())
+    if include_records:
+        digest.update(repr(user_model.confirmed_records_state()).encode())
+    return digest.hexdigest()[:16]
+
+
+def load_design_matrix(source='uci', include_records=False, chunk_size=CHUNK_SIZE, cache_dir=TRAINING_CACHE_DIR, use_cache=True):
+    """
+    Encoded (X, y, columns) for training. Cached under cache_dir keyed by the
+    CSV contents, the confirmed-records state and the template columns, so a
+    rerun on unchanged data skips reading and encoding.
+    """
+    path = os.path.join(cache_dir, f'design_{_cache_key(source, include_records)}.npz')
+    if use_cache and os.path.exists(path):
+        with np.load(path, allow_pickle=False) as cached:
+            print(f"DEBUG: Loaded cached design matrix {path}")
+            return cached['X'], cached['y'], cached['columns'].tolist()
+
+    chunks = iter_uci() if source == 'uci' else iter_csv(source, chunk_size)
+    X_parts, y_parts = [], []
+    for rows, labels in chunks:
+        X_parts.append(preprocess_features_batch(rows).values)
+        y_parts.append(labels)
+    if include_records:
+        for rows, labels in iter_confirmed_records(chunk_size):
+            X_parts.append(preprocess_features_batch(rows).values)
+            y_parts.append(labels)
+    columns = list(_get_template_layout()[0])
+    X = np.concatenate(X_parts) if X_parts else np.empty((0, len(columns)))
+    y = np.concatenate(y_parts) if y_parts else np.empty(0, dtype=np.int8)
+
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, X=X, y=y, columns=np.array(columns, dtype=str))
+        os.replace(tmp, path)
+    return X, y, columns
+
+
+def _fit(model_name, X_train, y_train, n_jobs, columns, params=None):
+    start = time.perf_counter()
+    model, scaler = fit_model(model_name, X_train, y_train, params, n_jobs, columns)
+    return model, scaler, time.perf_counter() - start
+
+
+def _evaluate(model, scaler, X_test, y_test, columns):
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    if scaler is not None:
+        X_test = scaler.transform(pd.DataFrame(X_test, columns=columns))
+    scores = model.predict_proba(X_test)[:, 1]
+    metrics = {'accuracy': float(accuracy_score(y_test, scores >= 0.5))}
+    if len(set(y_test.tolist())) == 2:
+        metrics['roc_auc'] = float(roc_auc_score(y_test, scores))
+    return metrics
+
+
+def train(X, y, columns, model_names=MODEL_NAMES, n_jobs=-1, test_size=TEST_SIZE, params=None):
+    """
+    Fit the models concurrently on one stratified split.
+    Trees get the unscaled design matrix and logistic regression its own
+    scaler, matching how heart_model feeds each model at serving time.
+    params optionally maps a model name to hyperparameters (see models/tuning.py).
+    Returns {model_name: (model, scaler, metrics)}.
+    """
+    params = params or {}
+    X_train, X_test, y_train, y_test = holdout_split(X, y, test_size)
+    # The model fits release the GIL, so threads keep every core busy;
+    # the cores are shared between the tree ensembles
+    cores = os.cpu_count() or 1
+    per_model = n_jobs if n_jobs > 0 else max(1, cores // max(1, len(model_names) - 1))
+    with ThreadPoolExecutor(max_workers=len(model_names)) as pool:
+        futures = {name: pool.submit(_fit, name, X_train, y_train, per_model, columns, params.get(name)) for name in model_names}
+        results = {}
+        for name, future in futures.items():
+            model, scaler, seconds = future.result()
+            metrics = _evaluate(model, scaler, X_test, y_test, columns)
+            metrics.update(fit_seconds=round(seconds, 3), train_rows=int(len(y_train)), test_rows=int(len(y_test)))
+            print(f"✅ {name}: accuracy {metrics['accuracy']:.3f}" + (f", ROC AUC {metrics['roc_auc']:.3f}" if 'roc_auc' in metrics else '') + f" ({seconds:.1f}s)")
+            results[name] = (model, scaler, metrics)
+    return results
+
+
+def publish(results, columns, source, version=None, metadata=None):
+    """Dump each model (uncompressed, so serving can mmap it) and publish it to the model store"""
+    if version is None:
+        version = 'train-' + datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    manifests = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for model_name, (model, scaler, metrics) in results.items():
+            model_path = os.path.join(tmp, f'{model_name}.joblib')
+            joblib.dump(model, model_path)
+            scaler_path = None
+            if scaler is not None:
+                scaler_path = os.path.join(tmp, f'{model_name}_scaler.joblib')
+                joblib.dump(scaler, scaler_path)
+            manifest_metadata = dict({'source': source, 'columns': columns, 'metrics': metrics}, **(metadata or {}).get(model_name, {}))
+            manifests[model_name] = model_store.publish(model_name, model_path, scaler_path, version, manifest_metadata)
+    return manifests
+
+
+def check_columns(columns):
+    """The design matrix must line up with notebook/models/sample_input.json"""
+    expected = list(_get_template_layout()[0])
+    if list(columns) != expected:
+        raise ValueError(f'Design matrix columns {list(columns)} do not match the serving template {expected}')
@@ -0,0 +1,283 @@
+"""
+Hyperparameter search for the three model families
+Random search or successive halving over the search spaces below, scored by
+stratified k-fold ROC AUC on the training part of the design matrix: the
+rows training.train holds out to score the published model (the same
+holdout_split) are never seen by the search.
+
+- The encoded matrix is written once to a .npy file in shared memory
+  (/dev/shm when available) and memory-mapped read-only by every worker
+  process, so the pool does not copy the data per trial.
+- Candidate configurations come from a seeded generator, so a study always
+  proposes the same trials. Every finished trial is stored in a SQLite
+  results database; rerunning an interrupted study skips the trials it
+  already has.
+- Successive halving uses the fraction of training rows as the budget: all
+  candidates start on a small sample and the best 1/eta of each rung move up
+  until the survivors are scored on all rows.
+- The best configuration is refitted with training.train and published to
+  the model store. Workers only import models.estimators, not the serving
+  models.
+
+Run it through the command line: python heartcare.py tune --help
+"""
+
+import datetime
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from models.estimators import fit_model, holdout_split
+
+TUNING_DB_PATH = os.environ.get('HEARTCARE_TUNING_DB', os.path.join(os.path.dirname(__file__), '../tuning.db'))
+SHARED_MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+CV_FOLDS = 3
+
+# name -> ('log', low, high) | ('int', low, high) | ('uniform', low, high) | ('choice', [values])
+SEARCH_SPACES = {
+    'logistic': {
+        'C': ('log', 1e-3, 1e2),
+        'class_weight': ('choice', [None, 'balanced']),
+    },
+    'random_forest': {
+        'n_estimators': ('int', 50, 400),
+        'max_depth': ('choice', [None, 4, 6, 8, 12, 16]),
+        'min_samples_leaf': ('int', 1, 20),
+        'max_features': ('choice', ['sqrt', 'log2', 0.5, 1.0]),
+    },
+    'xgboost': {
+        'n_estimators': ('int', 50, 400),
+        'max_depth': ('int', 2, 8),
+        'learning_rate': ('log', 0.01, 0.3),
+        'subsample': ('uniform', 0.5, 1.0),
+        'colsample_bytree': ('uniform', 0.5, 1.0),
+        'min_child_weight': ('log', 0.5, 20.0),
+    },
+}
+
+
+def sample_params(model_name, rng):
+    params = {}
+    for name, spec in SEARCH_SPACES[model_name].items():
+        kind = spec[0]
+        if kind == 'log':
+            params[name] = float(math.exp(rng.uniform(math.log(spec[1]), math.log(spec[2]))))
+        elif kind == 'int':
+            params[name] = int(rng.integers(spec[1], spec[2] + 1))
+        elif kind == 'uniform':
+            params[name] = float(rng.uniform(spec[1], spec[2]))
+        else:
+            params[name] = spec[1][int(rng.integers(len(spec[1])))]
+    return params
+
+
+def candidates(model_name, n_trials, seed):
+    rng = np.random.default_rng(seed)
+    return [sample_params(model_name, rng) for _ in range(n_trials)]
+
+
+def halving_schedule(n_trials, eta, min_fraction):
+    """[(n_configs, fraction of rows), ...] per rung, ending on all rows"""
+    # Enough rungs to get down to one survivor, as long as the first rung keeps min_fraction
+    rungs = 1 + min(int(math.log(n_trials, eta) + 1e-9), int(math.log(1 / min_fraction, eta) + 1e-9))
+    return [(max(1, n_trials // eta ** rung), 1.0 / eta ** (rungs - 1 - rung)) for rung in range(rungs)]
+
+
+# Results store
+
+def connect(path=TUNING_DB_PATH):
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS trials (
+        study TEXT NOT NULL,
+        trial_key TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        params TEXT NOT NULL,
+        fraction REAL NOT NULL,
+        rung INTEGER NOT NULL,
+        score REAL,
+        score_std REAL,
+        seconds REAL,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (study, trial_key)
+    )''')
+    return conn
+
+
+def trial_key(model_name, params, fraction):
+    payload = json.dumps([model_name, params, round(fraction, 6)], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:20]
+
+
+def finished_trials(conn, study):
+    # Failed trials are not stored as finished, so a rerun retries them
+    rows = conn.execute('SELECT trial_key, score FROM trials WHERE study = ? AND score IS NOT NULL', (study,)).fetchall()
+    return dict(rows)
+
+
+def best_trial(conn, study):
+    """Best scored trial on the largest budget of the study"""
+    row = conn.execute('''SELECT model_name, params, fraction, score, score_std FROM trials
+                          WHERE study = ? AND score IS NOT NULL
+                          ORDER BY fraction DESC, score DESC LIMIT 1''', (study,)).fetchone()
+    if row is None:
+        return None
+    return {'model_name': row[0], 'params': json.loads(row[1]), 'fraction': row[2], 'score': row[3], 'score_std': row[4]}
+
+
+# Worker processes
+
+_shared = {}
+
+
+def _init_worker(x_path, y_path):
+    # Read-only views of the shared matrix; pages are shared with the other workers
+    _shared['X'] = np.load(x_path, mmap_mode='r')
+    _shared['y'] = np.load(y_path, mmap_mode='r')
+
+
+def _folds(y, fraction, seed):
+    """Stratified k-fold (train, test) indices; the training side subsampled to fraction"""
+    from sklearn.model_selection import StratifiedKFold
+    rng = np.random.default_rng(seed)
+    folds = []
+    for train_idx, test_idx in StratifiedKFold(CV_FOLDS, shuffle=True, random_state=seed).split(np.zeros(len(y)), y):
+        if fraction < 1:
+            train_idx = np.sort(rng.permutation(train_idx)[:max(CV_FOLDS * 2, int(len(train_idx) * fraction))])
+        folds.append((train_idx, test_idx))
+    return folds
+
+
+def run_trial(model_name, params, fraction, seed):
+    """Mean and std of the fold ROC AUCs for one configuration (runs in a worker)"""
+    from sklearn.metrics import roc_auc_score
+    X, y = _shared['X'], _shared['y']
+    start = time.perf_counter()
+    scores = []
+    for train_idx, test_idx in _folds(y, fraction, seed):
+        model, scaler = fit_model(model_name, X[train_idx], y[train_idx], params)
+        X_test = X[test_idx] if scaler is None else scaler.transform(X[test_idx])
+        scores.append(roc_auc_score(y[test_idx], model.predict_proba(X_test)[:, 1]))
+    return float(np.mean(scores)), float(np.std(scores)), time.perf_counter() - start
+
+
+class SharedDesignMatrix:
+    """The design matrix as .npy files in shared memory for the lifetime of a search"""
+
+    def __init__(self, X, y):
+        self.dir = tempfile.mkdtemp(prefix='heartcare-tuning-', dir=SHARED_MEMORY_DIR)
+        self.x_path = os.path.join(self.dir, 'X.npy')
+        self.y_path = os.path.join(self.dir, 'y.npy')
+        np.lib.format.open_memmap(self.x_path, mode='w+', dtype=np.float64, shape=X.shape)[:] = X
+        np.lib.format.open_memmap(self.y_path, mode='w+', dtype=np.int8, shape=y.shape)[:] = y
+
+    def close(self):
+        for path in (self.x_path, self.y_path):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(self.dir)
+
+
+class Search:
+    """
+    One study: model family, strategy and seed define the trials, so the same
+    arguments resume the same study from the results database. X and y are
+    the whole design matrix; only its training split is searched.
+    """
+
+    def __init__(self, X, y, model_name, strategy='halving', n_trials=27, eta=3, min_fraction=0.1,
+                 workers=None, seed=0, study=None, db_path=TUNING_DB_PATH):
+        self.X, _, self.y, _ = holdout_split(X, y)
+        self.model_name = model_name
+        self.strategy = strategy
+        self.n_trials = n_trials
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        data_key = hashlib.sha256(np.ascontiguousarray(self.X).tobytes() + np.ascontiguousarray(self.y).tobytes()).hexdigest()[:8]
+        self.study = study or f'{model_name}-{strategy}-{n_trials}-s{seed}-{data_key}'
+        self.db_path = db_path
+
+    def _run_rung(self, pool, conn, configs, fraction, rung):
+        done = finished_trials(conn, self.study)
+        scores = {}
+        pending = {}
+        for index, params in enumerate(configs):
+            key = trial_key(self.model_name, params, fraction)
+            if key in done:
+                scores[index] = done[key]
+                continue
+            future = pool.submit(run_trial, self.model_name, params, fraction, self.seed)
+            pending[future] = (index, key, params)
+        if len(configs) > len(pending):
+            print(f"DEBUG: Rung {rung}: reusing {len(configs) - len(pending)} stored trials")
+        try:
+            for future in as_completed(pending):
+                index, key, params = pending[future]
+                score = score_std = seconds = error = None
+                try:
+                    score, score_std, seconds = future.result()
+                except Exception as e:
+                    error = str(e)
+                    print(f"DEBUG: Trial {params} failed: {e}")
+                conn.execute('INSERT OR REPLACE INTO trials (study, trial_key, model_name, params, fraction, rung, score, score_std, seconds, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (self.study, key, self.model_name, json.dumps(params), fraction, rung, score, score_std, seconds, error))
+                conn.commit()
+                scores[index] = score
+        except BaseException:
+            # Interrupted: drop the queued trials instead of waiting for them at pool shutdown
+            for future in pending:
+                future.cancel()
+            raise
+        return scores
+
+    def run(self):
+        """Run (or resume) the study; returns the best trial"""
+        configs = candidates(self.model_name, self.n_trials, self.seed)
+        if self.strategy == 'random':
+            schedule = [(self.n_trials, 1.0)]
+        else:
+            schedule = halving_schedule(self.n_trials, self.eta, self.min_fraction)
+        shared = SharedDesignMatrix(self.X, self.y)
+        conn = connect(self.db_path)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if 'forkserver' in methods:
+            context.set_forkserver_preload(['models.tuning'])
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(shared.x_path, shared.y_path)) as pool:
+                survivors = list(range(len(configs)))
+                for rung, (n_keep, fraction) in enumerate(schedule):
+                    survivors = survivors[:n_keep]
+                    start = time.perf_counter()
+                    scores = self._run_rung(pool, conn, [configs[i] for i in survivors], fraction, rung)
+                    ranked = sorted(range(len(survivors)), key=lambda i: -1 if scores[i] is None else scores[i], reverse=True)
+                    survivors = [survivors[i] for i in ranked]
+                    best = scores[ranked[0]]
+                    print(f"🔎 Rung {rung}: {len(ranked)} configs on {fraction:.0%} of rows, best ROC AUC "
+                          f"{'n/a' if best is None else f'{best:.4f}'} ({time.perf_counter() - start:.1f}s)")
+            return best_trial(conn, self.study)
+        finally:
+            conn.close()
+            shared.close()
+
+
+def export_best(X, y, columns, best, source, version=None):
+    """Refit the best configuration on the training split and publish it to the model store"""
+    from models import training
+    model_name = best['model_name']
+    results = training.train(X, y, columns, [model_name], params={model_name: best['params']})
+    if version is None:
+        version = 'tuned-' + datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    metadata = {model_name: {'params': best['params'], 'cv_roc_auc': best['score'], 'cv_roc_auc_std': best['score_std']}}
+    return training.publish(results, columns, source, version, metadata)[model_name]
@@ -1,14 +1,23 @@
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import time
+from models import drift, feature_codec
+from services.passwords import hash_password, verify_password
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../../web/users.db')
+# Optional first admin account, created by init_db when no user has this username
+BOOTSTRAP_ADMIN_USERNAME = os.environ.get('HEARTCARE_ADMIN_USERNAME')
+BOOTSTRAP_ADMIN_PASSWORD = os.environ.get('HEARTCARE_ADMIN_PASSWORD')
 
 def get_db():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+def column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(col[1] == column for col in cursor.fetchall())
+
 def init_db():
     conn = get_db()
     c = conn.cursor()
@@ -24,8 +33,26 @@ def init_db():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
         age INTEGER, sex INTEGER, cp INTEGER, trestbps INTEGER, chol INTEGER, fbs INTEGER, restecg INTEGER, thalach INTEGER, exang INTEGER, oldpeak REAL, slope INTEGER, ca INTEGER, thal INTEGER, risk INTEGER,
+        model_version TEXT,
+        confirmed_outcome INTEGER,
+        confirmed_at REAL,
         FOREIGN KEY(user_id) REFERENCES users(id)
     )''')
+    if not column_exists(c, 'records', 'model_version'):
+        c.execute('ALTER TABLE records ADD COLUMN model_version TEXT')
+    # Diagnosis confirmed by a clinician (0/1); labels records for retraining
+    if not column_exists(c, 'records', 'confirmed_outcome'):
+        c.execute('ALTER TABLE records ADD COLUMN confirmed_outcome INTEGER')
+    # When confirmed_outcome was last set; marks changes for the training cache
+    if not column_exists(c, 'records', 'confirmed_at'):
+        c.execute('ALTER TABLE records ADD COLUMN confirmed_at REAL')
+    # Running histograms for drift monitoring (see models/drift.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS drift_counts (
+        feature TEXT NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (feature, bin)
+    )''')
     c.execute('''CREATE TABLE IF NOT EXISTS report_links (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
@@ -34,38 +61,80 @@ def init_db():
         reasoning TEXT,
         recommendations TEXT,
         features TEXT,
+        features_blob BLOB,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         expires_at TIMESTAMP,
         FOREIGN KEY(user_id) REFERENCES users(id)
     )''')
+    # Packed features (see models/feature_codec.py); features keeps the text of older links
+    if not column_exists(c, 'report_links', 'features_blob'):
+        c.execute('ALTER TABLE report_links ADD COLUMN features_blob BLOB')
+    if BOOTSTRAP_ADMIN_USERNAME and BOOTSTRAP_ADMIN_PASSWORD:
+        c.execute('SELECT 1 FROM users WHERE username = ?', (BOOTSTRAP_ADMIN_USERNAME,))
+        if c.fetchone() is None:
+            c.execute('INSERT INTO users (username, password, name, email, is_admin) VALUES (?, ?, ?, ?, 1)',
+                      (BOOTSTRAP_ADMIN_USERNAME, hash_password(BOOTSTRAP_ADMIN_PASSWORD), 'Administrator', None))
+            print(f"DEBUG: Created bootstrap admin {BOOTSTRAP_ADMIN_USERNAME}")
     conn.commit()
     conn.close()
 
 def create_user(username, password, name, email):
     conn = get_db()
     c = conn.cursor()
-    c.execute('INSERT INTO users (username, password, name, email) VALUES (?, ?, ?, ?)', (username, generate_password_hash(password), name, email))
+    c.execute('INSERT INTO users (username, password, name, email) VALUES (?, ?, ?, ?)', (username, hash_password(password), name, email))
     conn.commit()
     conn.close()
 
+def _verify_login(user, password):
+    """The user's id if the password matches; an outdated hash is replaced (see services/passwords.py)"""
+    if not user:
+        return None
+    matches, new_hash = verify_password(user['password'], password)
+    if not matches:
+        return None
+    if new_hash:
+        conn = get_db()
+        conn.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?', (new_hash, user['id'], user['password']))
+        conn.commit()
+        conn.close()
+        print(f"DEBUG: Rehashed the password of user {user['id']}")
+    return user['id']
+
 def check_user(username, password):
     conn = get_db()
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE username = ?', (username,))
     user = c.fetchone()
     conn.close()
-    if user and check_password_hash(user['password'], password):
-        return user['id']
-    return None
+    return _verify_login(user, password)
 
-def save_record(user_id, features, risk):
+def save_record(user_id, features, risk, model_version=None, model_name=None):
     conn = get_db()
     c = conn.cursor()
-    c.execute('''INSERT INTO records (user_id, age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal, risk)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (user_id, *features, risk))
+    c.execute('''INSERT INTO records (user_id, age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal, risk, model_version)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (user_id, *features, risk, model_version))
+    drift.update_counts(c, features, risk, model_name)
     conn.commit()
     conn.close()
 
+def save_records(user_id, rows, risks, model_version=None, model_name=None):
+    """save_record for many rows in one transaction (bulk screening)"""
+    conn = get_db()
+    c = conn.cursor()
+    c.executemany('''INSERT INTO records (user_id, age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal, risk, model_version)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  [(user_id, *features, risk, model_version) for features, risk in zip(rows, risks)])
+    drift.update_counts_many(c, rows, risks, model_name)
+    conn.commit()
+    conn.close()
+
+def get_drift_counts():
+    conn = get_db()
+    c = conn.cursor()
+    counts = drift.read_counts(c)
+    conn.close()
+    return counts
+
 def get_records(user_id):
     conn = get_db()
     c = conn.cursor()
@@ -74,6 +143,38 @@ def get_records(user_id):
     conn.close()
     return records
 
+def set_confirmed_outcome(record_id, outcome):
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('UPDATE records SET confirmed_outcome = ?, confirmed_at = ? WHERE id = ?', (outcome, time.time(), record_id))
+    updated = c.rowcount
+    conn.commit()
+    conn.close()
+    return updated > 0
+
+def iter_confirmed_records(chunk_size=10000):
+    """Yield lists of records with a confirmed outcome, chunk_size at a time"""
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('SELECT * FROM records WHERE confirmed_outcome IS NOT NULL ORDER BY id')
+        while True:
+            chunk = c.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        conn.close()
+
+def confirmed_records_state():
+    """Cheap fingerprint of the confirmed outcomes: their count and the last time one was set"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), MAX(confirmed_at) FROM records WHERE confirmed_outcome IS NOT NULL')
+    state = tuple(c.fetchone())
+    conn.close()
+    return state
+
 def get_user_info(user_id):
     conn = get_db()
     c = conn.cursor()
@@ -85,7 +186,7 @@ def get_user_info(user_id):
 def create_admin(username, password, name, email):
     conn = get_db()
     c = conn.cursor()
-    c.execute('INSERT INTO users (username, password, name, email, is_admin) VALUES (?, ?, ?, ?, 1)', (username, generate_password_hash(password), name, email))
+    c.execute('INSERT INTO users (username, password, name, email, is_admin) VALUES (?, ?, ?, ?, 1)', (username, hash_password(password), name, email))
     conn.commit()
     conn.close()
 
@@ -95,9 +196,7 @@ def check_admin(username, password):
     c.execute('SELECT * FROM users WHERE username = ? AND is_admin = 1', (username,))
     user = c.fetchone()
     conn.close()
-    if user and check_password_hash(user['password'], password):
-        return user['id']
-    return None
+    return _verify_login(user, password)
 
 def get_all_users():
     conn = get_db()
@@ -114,13 +213,29 @@ def delete_user(user_id):
     conn.commit()
     conn.close()
 
-def save_report_link(user_id, report_id, prediction, reasoning, recommendations, features, expires_in_hours=24):
+def pack_report_features(features, model_version=None):
+    """(features text, features blob) to store for a report: the blob when the features can be packed, else the text"""
+    try:
+        if isinstance(features, str):
+            features = feature_codec.parse_text(features)
+        return None, sqlite3.Binary(feature_codec.encode(features, model_version))
+    except (ValueError, TypeError, SyntaxError):
+        return (None if features is None else str(features)), None
+
+def report_features(report):
+    """(features, model_version) of a report_links row, packed or legacy text"""
+    if report['features_blob'] is not None:
+        return feature_codec.decode(report['features_blob'])
+    return (feature_codec.parse_text(report['features']) if report['features'] else []), None
+
+def save_report_link(user_id, report_id, prediction, reasoning, recommendations, features, expires_in_hours=24, model_version=None):
     conn = get_db()
     c = conn.cursor()
     import datetime
     expires_at = datetime.datetime.now() + datetime.timedelta(hours=expires_in_hours)
-    c.execute('''INSERT INTO report_links (user_id, report_id, prediction, reasoning, recommendations, features, expires_at)
-                 VALUES (?, ?, ?, ?, ?, ?, ?)''', (user_id, report_id, prediction, reasoning, recommendations, features, expires_at))
+    features_text, features_blob = pack_report_features(features, model_version)
+    c.execute('''INSERT INTO report_links (user_id, report_id, prediction, reasoning, recommendations, features, features_blob, expires_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (user_id, report_id, prediction, reasoning, recommendations, features_text, features_blob, expires_at))
     conn.commit()
     conn.close()
 
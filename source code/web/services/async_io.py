@@ -0,0 +1,55 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services.inference_pool import get_pool, pool_enabled
+
+# Threads for blocking I/O (SQLite, SMTP, Infobip HTTPS) awaited from async views
+IO_THREADS = int(os.environ.get('HEARTCARE_IO_THREADS', '32'))
+# Threads for CPU work (prediction, PDF rendering) when the process pool is disabled
+CPU_THREADS = int(os.environ.get('HEARTCARE_CPU_THREADS', str(os.cpu_count() or 1)))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(kind):
+    executor = _executors.get(kind)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(kind)
+            if executor is None:
+                size = IO_THREADS if kind == 'io' else CPU_THREADS
+                executor = _executors[kind] = ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f'heartcare-{kind}')
+    return executor
+
+
+async def run_io(fn, *args, **kwargs):
+    """Await a blocking I/O call on the I/O thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor('io'), functools.partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn, *args):
+    """
+    Await CPU-bound work: in a worker process when the inference pool is
+    enabled, otherwise on the CPU thread pool. fn and args must be picklable.
+    """
+    if pool_enabled():
+        return await get_pool().call_async(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor('cpu'), functools.partial(fn, *args))
+
+
+async def gather_io(*calls):
+    """Run several (fn, args...) blocking calls concurrently; results in call order"""
+    return await asyncio.gather(*(run_io(*call) for call in calls))
+
+
+def shutdown():
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=True)
+        _executors.clear()
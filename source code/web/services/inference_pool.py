@@ -0,0 +1,197 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from models import heart_model
+from models.heart_model import predict_heart_disease, predict_heart_disease_batch, MODEL_PATHS
+from models.heart_model import predict_heart_disease_versioned, predict_heart_disease_batch_versioned
+from models.attribution import predict_explain_batch
+from services.report_service import build_report_pdf
+
+# Process pool settings (HEARTCARE_WORKER_PROCESSES=0 keeps everything in-process)
+WORKER_PROCESSES = int(os.environ.get('HEARTCARE_WORKER_PROCESSES', '0'))
+WORKER_MAX_PENDING = int(os.environ.get('HEARTCARE_WORKER_MAX_PENDING', str(max(WORKER_PROCESSES, 1) * 4)))
+WORKER_TIMEOUT = float(os.environ.get('HEARTCARE_WORKER_TIMEOUT', '30'))
+WORKER_QUEUE_TIMEOUT = float(os.environ.get('HEARTCARE_WORKER_QUEUE_TIMEOUT', '2'))
+
+
+class PoolBusyError(RuntimeError):
+    """Raised when the worker pool already has the maximum number of pending tasks"""
+
+
+def _init_worker():
+    # Each worker loads every artifact once; numpy arrays inside the
+    # uncompressed joblib files are memory-mapped so workers share page cache
+    heart_model.MODEL_MMAP_MODE = 'r'
+    for model_name in MODEL_PATHS:
+        heart_model._load_model(model_name)
+
+
+def _ping():
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    Process pool for CPU-bound prediction and PDF rendering.
+    Submissions beyond max_pending wait up to queue_timeout for a slot and then
+    raise PoolBusyError, so a burst cannot queue unbounded work. A call whose
+    result takes longer than timeout raises PoolBusyError too (its task is
+    cancelled if it has not started). A broken pool (a worker died) is
+    recreated and the call retried once.
+    """
+
+    def __init__(self, processes=WORKER_PROCESSES, max_pending=WORKER_MAX_PENDING, timeout=WORKER_TIMEOUT, queue_timeout=WORKER_QUEUE_TIMEOUT):
+        self.processes = max(1, int(processes))
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                if 'forkserver' in methods:
+                    # The fork server imports the heavy modules once; workers fork from it
+                    context.set_forkserver_preload(['models.heart_model', 'models.attribution', 'services.report_service'])
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context, initializer=_init_worker)
+            return self._executor
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                print("DEBUG: Inference pool broken, restarting workers")
+                broken.shutdown(wait=False)
+                self._executor = None
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PoolBusyError('Inference workers are saturated')
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PoolBusyError(f'Inference worker did not answer within {self.timeout:g}s')
+
+    def call(self, fn, *args):
+        executor = self._get_executor()
+        try:
+            return self._result(self.submit(fn, *args))
+        except BrokenProcessPool:
+            self._restart(executor)
+            return self._result(self.submit(fn, *args))
+
+    async def call_async(self, fn, *args):
+        """call() for coroutines: waiting for a slot happens off the event loop and the result is awaited"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            future = await loop.run_in_executor(None, self.submit, fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                # wait_for has cancelled the wrapped future, and with it a task that had not started
+                raise PoolBusyError(f'Inference worker did not answer within {self.timeout:g}s')
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                self._restart(executor)
+
+    def health_check(self):
+        """Ping the workers; recreate the pool if it is broken"""
+        executor = self._get_executor()
+        try:
+            pids = set(f.result(timeout=self.timeout) for f in [executor.submit(_ping) for _ in range(self.processes)])
+            return {'healthy': True, 'processes': self.processes, 'worker_pids': sorted(pids)}
+        except BrokenProcessPool as e:
+            self._restart(executor)
+            return {'healthy': False, 'processes': self.processes, 'error': str(e) or 'broken process pool'}
+        except Exception as e:
+            return {'healthy': False, 'processes': self.processes, 'error': str(e)}
+
+    def recycle(self):
+        """
+        Replace the workers so they load the currently active model versions.
+        New submissions go to a fresh executor; tasks already running on the
+        old one finish there.
+        """
+        with self._lock:
+            old, self._executor = self._executor, None
+        if old is not None:
+            print("DEBUG: Recycling inference workers")
+            old.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool()
+    return _pool
+
+def pool_enabled():
+    return WORKER_PROCESSES > 0
+
+def predict(features, model_name='logistic'):
+    """predict_heart_disease, run in a worker process when the pool is enabled"""
+    if pool_enabled():
+        return get_pool().call(predict_heart_disease, list(features), model_name)
+    return predict_heart_disease(features, model_name)
+
+def predict_batch(rows, model_name='logistic'):
+    """predict_heart_disease_batch, run in a worker process when the pool is enabled"""
+    if pool_enabled():
+        return get_pool().call(predict_heart_disease_batch, [list(row) for row in rows], model_name)
+    return predict_heart_disease_batch(rows, model_name)
+
+def predict_versioned(features, model_name='logistic'):
+    """predict() returning (probability, model version)"""
+    if pool_enabled():
+        return get_pool().call(predict_heart_disease_versioned, list(features), model_name)
+    return predict_heart_disease_versioned(features, model_name)
+
+def predict_batch_versioned(rows, model_name='logistic'):
+    """predict_batch() returning (probabilities, model version)"""
+    if pool_enabled():
+        return get_pool().call(predict_heart_disease_batch_versioned, [list(row) for row in rows], model_name)
+    return predict_heart_disease_batch_versioned(rows, model_name)
+
+def predict_explain_batch_versioned(rows, model_name='logistic'):
+    """
+    predict_batch_versioned() plus feature attributions, computed in the same
+    call (and worker) as the probabilities: (probabilities, model version, explanations)
+    """
+    if pool_enabled():
+        return get_pool().call(predict_explain_batch, [list(row) for row in rows], model_name)
+    return predict_explain_batch(rows, model_name)
+
+def render_report(prediction, reasoning, recommendations, features, top_features=None):
+    """build_report_pdf, run in a worker process when the pool is enabled"""
+    if pool_enabled():
+        return get_pool().call(build_report_pdf, prediction, reasoning, recommendations, features, top_features)
+    return build_report_pdf(prediction, reasoning, recommendations, features, top_features)
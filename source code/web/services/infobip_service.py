@@ -2,6 +2,7 @@ import http.client
 import json
 import re
 from config import INFOBIP_API_KEY, INFOBIP_BASE_URL, INFOBIP_WHATSAPP_NUMBER
+from services.metrics import timed
 
 class InfobipService:
     def __init__(self):
@@ -30,6 +31,7 @@ class InfobipService:
             clean_message = clean_message[:997] + "..."
         return clean_message
     
+    @timed('infobip.send_whatsapp')
     def send_whatsapp(self, to_number, message):
         """
         Send WhatsApp message using Infobip template
@@ -86,6 +88,7 @@ class InfobipService:
                 'error': str(e)
             }
     
+    @timed('infobip.send_whatsapp_template')
     def send_whatsapp_template(self, to_number, template_name, language_code="en", variables=None):
         """
         Send WhatsApp template message using Infobip
@@ -143,6 +146,7 @@ class InfobipService:
                 'error': str(e)
             }
 
+    @timed('infobip.send_whatsapp_interactive_report')
     def send_whatsapp_interactive_report(self, to_number, prediction, reasoning, download_url, risk_level):
         """
         Send interactive WhatsApp message with clickable download button
@@ -214,6 +218,7 @@ class InfobipService:
                 'error': str(e)
             }
 
+    @timed('infobip.send_whatsapp_report')
     def send_whatsapp_report(self, to_number, prediction, reasoning, download_url, risk_level):
         """
         Send simple WhatsApp message with report download link
@@ -274,6 +279,7 @@ class InfobipService:
                 'error': str(e)
             }
 
+    @timed('infobip.send_whatsapp_formatted_text')
     def send_whatsapp_formatted_text(self, to_number, prediction, reasoning, download_url, risk_level):
         """
         Send simple WhatsApp message as text (fallback method)
@@ -326,6 +332,7 @@ class InfobipService:
                 'error': str(e)
             }
 
+    @timed('infobip.send_sms')
     def send_sms(self, to_number, message):
         """
         Send SMS using Infobip SMS API
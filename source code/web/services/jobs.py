@@ -0,0 +1,409 @@
+"""
+Background jobs for long-running admin tasks
+Model evaluation, analytics exports, retraining and bulk e-mail used to run
+inside the HTTP request. They are now rows in a SQLite jobs table: a request
+enqueues one and returns at once, worker threads claim queued jobs in order
+and record their progress, result or error, and the admin UI polls the row.
+
+- Any process can enqueue and any process running workers can claim, so a
+  job queued by one gunicorn worker may run in another. A claim is a single
+  UPDATE inside BEGIN IMMEDIATE, so a job runs exactly once.
+- A running job reports progress through job.progress(); that is also where
+  a cancellation requested through cancel() takes effect (JobCancelled is
+  raised inside the job). A queued job is cancelled straight away.
+- The worker updates a running job's heartbeat every HEARTBEAT_INTERVAL
+  seconds. A job whose heartbeat is older than HEARTBEAT_TIMEOUT (its
+  process died) is marked failed rather than run again; the handlers are not
+  all safe to repeat (bulk e-mail).
+
+A web process starts HEARTCARE_JOB_WORKERS worker threads (default 1) the
+first time it enqueues a job or serves the job API. They only claim the
+light kinds in HEARTCARE_WEB_JOB_KINDS (default evaluate and notify), so a
+retrain or export, which use every core for minutes, never runs inside a
+process serving requests: those wait for a dedicated worker process
+(python heartcare.py jobs work), which claims every kind.
+"""
+
+import inspect
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+JOBS_DB_PATH = os.environ.get('HEARTCARE_JOBS_DB', os.path.join(os.path.dirname(__file__), '../jobs.db'))
+JOB_WORKERS = int(os.environ.get('HEARTCARE_JOB_WORKERS', '1'))
+WEB_JOB_KINDS = [kind.strip() for kind in os.environ.get('HEARTCARE_WEB_JOB_KINDS', 'evaluate,notify').split(',') if kind.strip()]
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15
+HEARTBEAT_TIMEOUT = 120
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+CREATE_SQL = '''CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    progress REAL,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+)'''
+INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id)'
+COLUMNS = ['id', 'kind', 'params', 'state', 'progress', 'message', 'result', 'error', 'cancel_requested',
+           'worker', 'created_at', 'started_at', 'finished_at', 'heartbeat_at']
+
+# kind -> function(job, **params) returning a JSON-serializable result
+_handlers = {}
+_initialized = set()
+_init_lock = threading.Lock()
+_workers = []
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+
+class UnknownJobError(ValueError):
+    """Raised when enqueuing a job kind that has no handler"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job by progress() once it has been cancelled"""
+
+
+def handler(kind):
+    """Register the function that runs jobs of this kind"""
+    def register(function):
+        _handlers[kind] = function
+        return function
+    return register
+
+
+def kinds():
+    return sorted(_handlers)
+
+
+def _connect(db_path=None):
+    db_path = db_path or JOBS_DB_PATH
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if db_path not in _initialized:
+        with _init_lock:
+            # WAL lets the UI read job status while a worker writes progress
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(CREATE_SQL)
+            conn.execute(INDEX_SQL)
+            conn.commit()
+            _initialized.add(db_path)
+    return conn
+
+
+def _as_dict(row):
+    if row is None:
+        return None
+    job = {name: row[name] for name in COLUMNS}
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
+
+
+def _params_text(params):
+    # Sorted keys, so the same parameters always match in latest() and unique enqueues
+    return json.dumps(params or {}, sort_keys=True)
+
+
+def enqueue(kind, params=None, unique=False, db_path=None):
+    """
+    Queue a job and return it. With unique=True an identical job that is
+    still queued or running is returned instead of adding another.
+    """
+    if kind not in _handlers:
+        raise UnknownJobError(f'Unknown job kind: {kind} (expected one of {", ".join(kinds())})')
+    try:
+        inspect.signature(_handlers[kind]).bind(None, **(params or {}))
+    except TypeError as e:
+        raise ValueError(f'Bad parameters for {kind} job: {e}')
+    params_text = _params_text(params)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = None
+            if unique:
+                row = conn.execute("SELECT * FROM jobs WHERE kind = ? AND params = ? AND state IN ('queued', 'running') ORDER BY id LIMIT 1",
+                                   (kind, params_text)).fetchone()
+            if row is None:
+                job_id = conn.execute('INSERT INTO jobs (kind, params, created_at) VALUES (?, ?, ?)',
+                                      (kind, params_text, time.time())).lastrowid
+                row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                print(f"DEBUG: Queued job {job_id} ({kind})")
+    finally:
+        conn.close()
+    return _as_dict(row)
+
+
+def get(job_id, db_path=None):
+    conn = _connect(db_path)
+    try:
+        return _as_dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def list_jobs(kind=None, limit=50, db_path=None):
+    """Most recent jobs first"""
+    conn = _connect(db_path)
+    try:
+        if kind:
+            rows = conn.execute('SELECT * FROM jobs WHERE kind = ? ORDER BY id DESC LIMIT ?', (kind, limit)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [_as_dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def latest(kind, params=None, db_path=None):
+    """The most recent succeeded job with exactly these parameters, or None"""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE kind = ? AND params = ? AND state = 'succeeded' ORDER BY id DESC LIMIT 1",
+                           (kind, _params_text(params))).fetchone()
+        return _as_dict(row)
+    finally:
+        conn.close()
+
+
+def cancel(job_id, db_path=None):
+    """
+    Cancel a job: a queued one at once, a running one at its next progress
+    report. Returns the job (None if there is no such job).
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ? AND state = 'queued'", (time.time(), job_id))
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (job_id,))
+        return _as_dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+class Job:
+    """A claimed job, passed to its handler"""
+
+    def __init__(self, row, db_path):
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = json.loads(row['params'])
+        self.db_path = db_path
+
+    def progress(self, done, total=None, message=None):
+        """
+        Record progress (done out of total, or just a message) and raise
+        JobCancelled if the job has been cancelled since the last report.
+        """
+        fraction = min(1.0, done / total) if total else None
+        conn = _connect(self.db_path)
+        try:
+            with conn:
+                conn.execute('UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message), heartbeat_at = ? WHERE id = ?',
+                             (fraction, message, time.time(), self.id))
+            cancelled = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.id,)).fetchone()[0]
+        finally:
+            conn.close()
+        if cancelled:
+            raise JobCancelled(f'Job {self.id} was cancelled')
+
+
+def _claim(worker_name, db_path, kinds=None):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            conn.execute("UPDATE jobs SET state = 'failed', error = 'The worker running the job stopped', finished_at = ? "
+                         "WHERE state = 'running' AND heartbeat_at < ?", (now, now - HEARTBEAT_TIMEOUT))
+            if kinds is None:
+                row = conn.execute("SELECT * FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+            else:
+                row = conn.execute(f"SELECT * FROM jobs WHERE state = 'queued' AND kind IN ({', '.join('?' * len(kinds))}) ORDER BY id LIMIT 1",
+                                   list(kinds)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET state = 'running', worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                         (worker_name, now, now, row['id']))
+        return Job(row, db_path)
+    finally:
+        conn.close()
+
+
+def _finish(job, state, result=None, error=None):
+    conn = _connect(job.db_path)
+    try:
+        with conn:
+            conn.execute('UPDATE jobs SET state = ?, result = ?, error = ?, progress = CASE WHEN ? THEN 1.0 ELSE progress END, finished_at = ? WHERE id = ?',
+                         (state, json.dumps(result) if result is not None else None, error, state == 'succeeded', time.time(), job.id))
+    finally:
+        conn.close()
+
+
+def _heartbeat(job, done):
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            conn = _connect(job.db_path)
+            try:
+                with conn:
+                    conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (time.time(), job.id))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"DEBUG: Job {job.id} heartbeat failed: {e}")
+
+
+def run_job(job):
+    start = time.perf_counter()
+    function = _handlers.get(job.kind)
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job, done), name=f'job-heartbeat-{job.id}', daemon=True).start()
+    try:
+        if function is None:
+            raise UnknownJobError(f'No handler for job kind {job.kind} in this process')
+        result = function(job, **job.params)
+    except JobCancelled:
+        print(f"DEBUG: Job {job.id} ({job.kind}) cancelled")
+        _finish(job, 'cancelled')
+    except Exception as e:
+        print(f"DEBUG: Job {job.id} ({job.kind}) failed: {e}")
+        _finish(job, 'failed', error=str(e))
+    else:
+        print(f"DEBUG: Job {job.id} ({job.kind}) finished in {time.perf_counter() - start:.1f}s")
+        _finish(job, 'succeeded', result=result)
+    finally:
+        done.set()
+
+
+class JobWorker(threading.Thread):
+    """Claims and runs queued jobs (of the given kinds, default any) one at a time until stopped"""
+
+    def __init__(self, index, db_path=None, kinds=None):
+        super().__init__(name=f'job-worker-{index}', daemon=True)
+        self.db_path = db_path or JOBS_DB_PATH
+        self.kinds = kinds
+        self.worker_name = f'{socket.gethostname()}:{os.getpid()}:{index}'
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                job = _claim(self.worker_name, self.db_path, self.kinds)
+            except sqlite3.Error as e:
+                print(f"DEBUG: Claiming a job failed: {e}")
+                job = None
+            if job is None:
+                self._stop_event.wait(POLL_INTERVAL)
+                continue
+            run_job(job)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def ensure_workers(count=None, kinds=None):
+    """
+    Start the worker threads of this process (again after a fork); a no-op
+    when they run. The defaults are those of a web process: JOB_WORKERS
+    threads running the WEB_JOB_KINDS only.
+    """
+    global _workers, _workers_pid
+    count = JOB_WORKERS if count is None else count
+    kinds = WEB_JOB_KINDS if kinds is None else list(kinds)
+    with _workers_lock:
+        if _workers_pid == os.getpid() or count <= 0 or not kinds:
+            return _workers
+        _workers = [JobWorker(i, kinds=kinds) for i in range(count)]
+        for worker in _workers:
+            worker.start()
+        _workers_pid = os.getpid()
+        print(f"DEBUG: Started {count} job worker threads ({', '.join(kinds)})")
+        return _workers
+
+
+# Handlers. Imports are local: enqueuing and polling must not load the models.
+
+@handler('evaluate')
+def evaluate(job, model_name='logistic', version=None):
+    """
+    Score the UCI data and render the dashboard charts for a model version
+    (default: the one in service). The version is loaded here rather than taken
+    from this process's cache, which a long-running worker does not refresh
+    when another process changes the active version.
+    """
+    from models import heart_model
+    if version is None:
+        entry = heart_model._get_loaded(model_name)
+    elif version == heart_model.BUILTIN_VERSION:
+        entry = heart_model._load_builtin(model_name)
+    else:
+        entry = heart_model._load_version(model_name, version)
+    job.progress(0, message=f'Evaluating {model_name} ({entry.version}) on the UCI data')
+    performance = heart_model.get_model_performance(model_name, entry)
+    performance['version'] = entry.version
+    return performance
+
+
+@handler('export')
+def export(job, output_dir=None, format='parquet', incremental=False):
+    """Analytics export of records (see models/analytics_export.py)"""
+    from models import analytics_export
+    from models.user_model import DB_PATH
+    output_dir = output_dir or os.path.join(os.path.dirname(__file__), '../exports/records')
+    partition = analytics_export.export_records(
+        DB_PATH, output_dir, format, incremental,
+        progress=lambda done, total: job.progress(done, total, f'{done:,} of {total:,} records'))
+    return {'output_dir': os.path.abspath(output_dir), 'partition': partition}
+
+
+@handler('retrain')
+def retrain(job, data='uci', include_records=False, models=None, activate=False):
+    """Train the models, publish them to the model store and optionally activate them"""
+    from models import training
+    from services import model_swap
+    job.progress(0, 3, 'Loading the training data')
+    X, y, columns = training.load_design_matrix(data, include_records)
+    training.check_columns(columns)
+    if len(set(y.tolist())) < 2:
+        raise ValueError('Training data needs both outcomes')
+    job.progress(1, 3, f'Training on {X.shape[0]:,} rows')
+    results = training.train(X, y, columns, models or training.MODEL_NAMES)
+    job.progress(2, 3, 'Publishing to the model store')
+    manifests = training.publish(results, columns, data)
+    if activate:
+        for model_name, manifest in manifests.items():
+            model_swap.start(model_name, manifest['version'])
+    return {model_name: {'version': manifest['version'], 'metrics': manifest['metadata']['metrics']}
+            for model_name, manifest in manifests.items()}
+
+
+@handler('notify')
+def notify(job, subject, message, user_ids=None):
+    """E-mail every user (or the given user ids) one at a time; cancelling stops before the next e-mail"""
+    from models.user_model import get_all_users
+    from services.twilio_service import twilio_service
+    users = [user for user in get_all_users() if user['email'] and (user_ids is None or user['id'] in user_ids)]
+    sent, failed = 0, []
+    for i, user in enumerate(users):
+        job.progress(i, len(users), f'Sent {sent} of {len(users)} e-mails')
+        result = twilio_service.send_email(user['email'], subject, message)
+        if result['success']:
+            sent += 1
+        else:
+            failed.append({'user_id': user['id'], 'error': result['error']})
+    return {'recipients': len(users), 'sent': sent, 'failed': failed}
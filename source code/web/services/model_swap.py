@@ -0,0 +1,48 @@
+import threading
+import time
+
+from models import heart_model, model_store
+from services.inference_pool import get_pool, pool_enabled
+
+# model_name -> {'version', 'state': loading|active|failed, 'error', 'started_at', 'finished_at'}
+_status = {}
+_status_lock = threading.Lock()
+
+
+class SwapInProgressError(RuntimeError):
+    """Raised when a version is already being loaded for the model"""
+
+
+def _run(model_name, version):
+    try:
+        heart_model.activate_model_version(model_name, version)
+        if pool_enabled():
+            # Worker processes load the new ACTIVE version on their next start
+            get_pool().recycle()
+        state, error = 'active', None
+    except Exception as e:
+        print(f"DEBUG: Activating {model_name} version {version} failed: {e}")
+        state, error = 'failed', str(e)
+    with _status_lock:
+        _status[model_name].update(state=state, error=error, finished_at=time.time())
+
+
+def start(model_name, version):
+    """
+    Load, warm up and swap in a stored version on a background thread.
+    Requests keep using the current version until the swap; poll status().
+    """
+    if model_name not in heart_model.MODEL_PATHS:
+        raise ValueError('Unknown model: ' + model_name)
+    model_store.read_manifest(model_name, version)
+    with _status_lock:
+        current = _status.get(model_name)
+        if current and current['state'] == 'loading':
+            raise SwapInProgressError(f"{model_name} version {current['version']} is still loading")
+        _status[model_name] = {'version': version, 'state': 'loading', 'error': None, 'started_at': time.time(), 'finished_at': None}
+    threading.Thread(target=_run, args=(model_name, version), name=f'model-swap-{model_name}', daemon=True).start()
+
+
+def status(model_name):
+    with _status_lock:
+        return dict(_status[model_name]) if model_name in _status else None
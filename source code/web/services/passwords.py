@@ -0,0 +1,84 @@
+"""
+Password hashing for user and admin accounts
+Hashes use HEARTCARE_PASSWORD_METHOD (any werkzeug method string, default
+scrypt:32768:8:1, about 130 ms per check on one core). A stored hash made
+with other parameters is still accepted; on the next successful login it is
+replaced by a hash with the current ones, so changing the setting migrates
+accounts as their users log in (a login that finds the hasher busy keeps
+the old hash for now).
+
+Hashing is deliberately CPU-heavy, so it runs on its own small thread pool
+(HEARTCARE_HASH_THREADS) instead of the request thread: a login flood can
+use those cores and no more. At most HEARTCARE_HASH_QUEUE hashes wait for a
+thread; beyond that HasherBusyError is raised and the login is refused
+without hashing.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_METHOD = os.environ.get('HEARTCARE_PASSWORD_METHOD', 'scrypt:32768:8:1')
+HASH_THREADS = int(os.environ.get('HEARTCARE_HASH_THREADS', str(max(1, (os.cpu_count() or 1) // 2))))
+HASH_QUEUE = int(os.environ.get('HEARTCARE_HASH_QUEUE', str(HASH_THREADS * 4)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_THREADS + HASH_QUEUE)
+_method_prefix = None
+
+
+class HasherBusyError(RuntimeError):
+    """Raised when too many password hashes are already waiting"""
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, HASH_THREADS), thread_name_prefix='heartcare-hash')
+    return _executor
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HasherBusyError('Too many logins in progress, try again shortly')
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def method_prefix():
+    """The method part of a hash made with the current settings (werkzeug fills in defaults)"""
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = generate_password_hash('', PASSWORD_METHOD).split('$', 1)[0]
+    return _method_prefix
+
+
+def needs_rehash(stored_hash):
+    return stored_hash.split('$', 1)[0] != method_prefix()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, PASSWORD_METHOD)
+
+
+def verify_password(stored_hash, password):
+    """(matches, new_hash): new_hash is set when the password matched an outdated hash"""
+    if not _run(check_password_hash, stored_hash, password):
+        return False, None
+    if needs_rehash(stored_hash):
+        try:
+            return True, hash_password(password)
+        except HasherBusyError:
+            # The password matched; the rehash can wait for a quieter login
+            return True, None
+    return True, None
@@ -0,0 +1,86 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+
+# Only one profile may run at a time; a second request gets ProfilerBusyError
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when another profile is already being collected"""
+
+
+class StackSampler:
+    """
+    Pure-Python sampling profiler.
+    Every interval seconds it snapshots the stacks of all other threads with
+    sys._current_frames() and counts identical stacks. Nothing is installed in
+    the profiled threads, so the overhead is one stack walk per thread per
+    sample and disappears when sampling stops.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = max(0.001, float(interval))
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            self._labels[code] = label
+        return label
+
+    def _sample_once(self, own_ident, thread_names):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(thread_names.get(ident, f'thread-{ident}'))
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        own_ident = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        next_sample = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_sample:
+                # Never sleep past the deadline, however long the interval
+                time.sleep(min(next_sample, deadline) - now)
+                continue
+            thread_names = {t.ident: t.name.replace(';', '_').replace(' ', '_') for t in threading.enumerate()}
+            self._sample_once(own_ident, thread_names)
+            next_sample += self.interval
+        return self
+
+    def collapsed(self):
+        """Brendan Gregg collapsed-stack format: 'frame;frame;frame count' per line"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def profile(seconds, interval=DEFAULT_INTERVAL):
+    """Sample the running process for the given number of seconds and return the sampler"""
+    if not (math.isfinite(seconds) and math.isfinite(interval)):
+        raise ValueError('seconds and interval must be finite numbers')
+    seconds = min(max(float(seconds), 0.1), MAX_PROFILE_SECONDS)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError('A profile is already running')
+    try:
+        return StackSampler(interval).run(seconds)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,254 @@
+"""
+Token-bucket rate limiting and admission control
+Each key (a client IP, a username, a user id) has a bucket of burst tokens
+refilled at rate tokens per second; a request takes a token or is told how
+long to wait. HEARTCARE_RATE_LIMIT_STORE picks where buckets live:
+
+- memory (default): in this process (under gunicorn every worker has its
+  own); only the max_keys most recently used keys are kept.
+- sqlite: a rate_limits table in HEARTCARE_RATE_LIMIT_DB, shared by all the
+  worker processes of a host. Each check is one small write transaction.
+
+Logins are limited per client IP and per username before any password is
+hashed: HEARTCARE_LOGIN_PER_IP and HEARTCARE_LOGIN_PER_USERNAME attempts per
+minute. A successful login gives the username its token back, so only
+failures count against an account.
+
+Predictions are limited per client IP (HEARTCARE_PREDICT_PER_IP) and per
+logged-in user (HEARTCARE_PREDICT_PER_USER) per minute, with bursts of
+HEARTCARE_PREDICT_BURST. Every scored row also draws on a row budget of
+HEARTCARE_PREDICT_ROWS_PER_MINUTE per client IP and per user, so one batch
+of a thousand patients costs a thousand rows, not one request; a single
+batch may hold at most HEARTCARE_MAX_BATCH_ROWS patients (the row burst).
+An admitted prediction also needs one of
+HEARTCARE_MAX_INFLIGHT slots in this process; when none frees up within
+ADMISSION_WAIT seconds it is shed, so a flood cannot queue up behind the
+models and push everyone's latency up. A streamed screening holds a slot only
+while one of its chunks is being scored (scoring_slot), not while its client
+reads the response.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+RATE_LIMIT_STORE = os.environ.get('HEARTCARE_RATE_LIMIT_STORE', 'memory')
+RATE_LIMIT_DB_PATH = os.environ.get('HEARTCARE_RATE_LIMIT_DB', os.path.join(os.path.dirname(__file__), '../rate_limits.db'))
+LOGIN_PER_IP = int(os.environ.get('HEARTCARE_LOGIN_PER_IP', '20'))
+LOGIN_PER_USERNAME = int(os.environ.get('HEARTCARE_LOGIN_PER_USERNAME', '5'))
+PREDICT_PER_IP = int(os.environ.get('HEARTCARE_PREDICT_PER_IP', '120'))
+PREDICT_PER_USER = int(os.environ.get('HEARTCARE_PREDICT_PER_USER', '60'))
+PREDICT_BURST = int(os.environ.get('HEARTCARE_PREDICT_BURST', '20'))
+PREDICT_ROWS_PER_MINUTE = int(os.environ.get('HEARTCARE_PREDICT_ROWS_PER_MINUTE', '60000'))
+MAX_BATCH_ROWS = int(os.environ.get('HEARTCARE_MAX_BATCH_ROWS', '1000'))
+MAX_INFLIGHT = int(os.environ.get('HEARTCARE_MAX_INFLIGHT', str(os.cpu_count() or 1)))
+ADMISSION_WAIT = 0.25
+MAX_KEYS = 100000
+# Idle keys are deleted from the SQLite store on roughly one check in PURGE_EVERY
+PURGE_EVERY = 1000
+
+
+class RateLimitedError(Exception):
+    """Raised when a client has used up its tokens; retry_after is in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limit exceeded, retry in {retry_after:.1f}s')
+        self.retry_after = retry_after
+
+
+class OverloadedError(Exception):
+    """Raised when every in-flight slot stayed busy for ADMISSION_WAIT"""
+
+
+class TokenBuckets:
+    def __init__(self, rate, burst, max_keys=MAX_KEYS):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at), least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key, now):
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def take(self, key, tokens=1):
+        """0.0 when the tokens were taken, otherwise the seconds until they will be available"""
+        now = time.monotonic()
+        with self._lock:
+            available = self._refill(key, now)
+            if available >= tokens:
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = (tokens - available) / self.rate if self.rate > 0 else float('inf')
+            self._buckets[key] = (available, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key, tokens=1):
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[key] = (min(self.burst, self._refill(key, now) + tokens), now)
+
+
+class SqliteTokenBuckets:
+    """TokenBuckets kept in SQLite, so every process on the host draws on the same buckets"""
+
+    _local = threading.local()
+
+    def __init__(self, name, rate, burst, path=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.path = path or RATE_LIMIT_DB_PATH
+        self._checks = 0
+
+    def _connect(self):
+        # One connection per thread and process (connections must not cross a fork)
+        key = (self.path, os.getpid())
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(key)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS rate_limits (
+                name TEXT NOT NULL, key TEXT NOT NULL, tokens REAL NOT NULL, updated_at REAL NOT NULL,
+                PRIMARY KEY (name, key))''')
+            conns[key] = conn
+        return conn
+
+    def _update(self, key, change):
+        # change(available) -> (new_tokens, result), applied in one write transaction
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limits WHERE name = ? AND key = ?', (self.name, key)).fetchone()
+            available = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            new_tokens, result = change(available)
+            conn.execute('INSERT OR REPLACE INTO rate_limits (name, key, tokens, updated_at) VALUES (?, ?, ?, ?)', (self.name, key, new_tokens, now))
+            self._checks += 1
+            if self._checks % PURGE_EVERY == 0 and self.rate > 0:
+                # A key idle long enough to refill completely is the same as no row
+                conn.execute('DELETE FROM rate_limits WHERE name = ? AND updated_at < ?', (self.name, now - self.burst / self.rate))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def take(self, key, tokens=1):
+        def change(available):
+            if available >= tokens:
+                return available - tokens, 0.0
+            return available, (tokens - available) / self.rate if self.rate > 0 else float('inf')
+        return self._update(str(key), change)
+
+    def refund(self, key, tokens=1):
+        self._update(str(key), lambda available: (min(self.burst, available + tokens), None))
+
+
+def buckets(name, per_minute, burst=None):
+    """Buckets of the configured store allowing per_minute requests (bursts of burst, default per_minute)"""
+    burst = per_minute if burst is None else burst
+    if RATE_LIMIT_STORE == 'sqlite':
+        return SqliteTokenBuckets(name, per_minute / 60.0, burst)
+    if RATE_LIMIT_STORE != 'memory':
+        raise ValueError(f'Unknown HEARTCARE_RATE_LIMIT_STORE: {RATE_LIMIT_STORE} (expected memory or sqlite)')
+    return TokenBuckets(per_minute / 60.0, burst)
+
+
+_login_ip = buckets('login_ip', LOGIN_PER_IP)
+_login_username = buckets('login_username', LOGIN_PER_USERNAME)
+_predict_ip = buckets('predict_ip', PREDICT_PER_IP, PREDICT_BURST)
+_predict_user = buckets('predict_user', PREDICT_PER_USER, PREDICT_BURST)
+_rows_ip = buckets('rows_ip', PREDICT_ROWS_PER_MINUTE, MAX_BATCH_ROWS)
+_rows_user = buckets('rows_user', PREDICT_ROWS_PER_MINUTE, MAX_BATCH_ROWS)
+_inflight = threading.BoundedSemaphore(max(1, MAX_INFLIGHT))
+
+
+def login_retry_after(ip, username):
+    """Seconds before a login from this IP for this username may be attempted (0.0 when it may be now)"""
+    wait = _login_ip.take(ip)
+    if wait:
+        return wait
+    return _login_username.take((username or '').lower())
+
+
+def login_succeeded(username):
+    _login_username.refund((username or '').lower())
+
+
+def signup_retry_after(ip):
+    """Signups hash a password too, so they draw on the IP's login tokens"""
+    return _login_ip.take(ip)
+
+
+def _take_rows(ip, user_id, rows):
+    """0.0 when the client's row budget covered rows (at most MAX_BATCH_ROWS), else the seconds to wait"""
+    wait = _rows_ip.take(ip, rows)
+    if not wait and user_id is not None:
+        wait = _rows_user.take(user_id, rows)
+        if wait:
+            _rows_ip.refund(ip, rows)
+    return wait
+
+
+def admit_prediction(ip, user_id=None, rows=1, slot=True):
+    """
+    Take the client's request token, rows row tokens and (unless slot is
+    False) an in-flight slot, or raise RateLimitedError / OverloadedError.
+    Call release_prediction() once done when a slot was taken.
+    """
+    wait = _predict_ip.take(ip)
+    if not wait and user_id is not None:
+        wait = _predict_user.take(user_id)
+    if not wait and rows:
+        wait = _take_rows(ip, user_id, rows)
+    if wait:
+        raise RateLimitedError(wait)
+    if slot:
+        _acquire_slot()
+
+
+def _acquire_slot():
+    if not _inflight.acquire(timeout=ADMISSION_WAIT):
+        raise OverloadedError('Server is busy, please retry shortly.')
+
+
+@contextmanager
+def scoring_slot():
+    """An in-flight slot for one piece of work of a request admitted with slot=False"""
+    _acquire_slot()
+    try:
+        yield
+    finally:
+        _inflight.release()
+
+
+def throttle_rows(ip, user_id, rows):
+    """
+    Charge rows to an admitted request that learns its size as it goes (a
+    streamed screening), MAX_BATCH_ROWS at a time, sleeping while the
+    client's budget refills. Call it without holding an in-flight slot.
+    """
+    while rows > 0:
+        part = min(rows, MAX_BATCH_ROWS)
+        wait = _take_rows(ip, user_id, part)
+        if wait:
+            time.sleep(wait)
+            continue
+        rows -= part
+
+
+def release_prediction():
+    _inflight.release()
@@ -0,0 +1,122 @@
+import io
+import os
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.platypus import Table, TableStyle, SimpleDocTemplate, Paragraph, Spacer, Image, HRFlowable
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER
+from services.metrics import span
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), '../static/images/doctor.png')
+FEATURE_LABELS = ['Age', 'Sex', 'CP', 'BP', 'Chol', 'FBS', 'ECG', 'Thalach', 'Exang', 'Oldpeak', 'Slope', 'CA', 'Thal']
+FEATURE_KEYS = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+
+def valid_top_features(top_features):
+    """top_features when it is a list of dicts with a string feature and a numeric contribution, else None"""
+    if not isinstance(top_features, list):
+        return None
+    for item in top_features:
+        if not (isinstance(item, dict) and isinstance(item.get('feature'), str)
+                and isinstance(item.get('contribution'), (int, float)) and not isinstance(item['contribution'], bool)):
+            return None
+    return top_features
+
+def build_report_pdf(prediction, reasoning, recommendations, features, top_features=None):
+    """
+    Render the prediction report PDF and return its bytes
+    recommendations: list of strings (rendered as bullets) or a raw string
+    features: list of the 13 input values (rendered as a table) or a raw string
+    top_features: optional list of {'feature', 'value', 'contribution'} dicts
+    Takes only plain values so it can run in a worker process.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Custom styles
+    title_style = ParagraphStyle('title', parent=styles['Title'], alignment=TA_CENTER, textColor=colors.HexColor('#c0392b'), fontSize=22, spaceAfter=12)
+    section_header = ParagraphStyle('section', parent=styles['Heading2'], textColor=colors.HexColor('#c0392b'), spaceBefore=12, spaceAfter=6)
+    normal_bold = ParagraphStyle('bold', parent=styles['Normal'], fontName='Helvetica-Bold')
+
+    # Header
+    if os.path.exists(LOGO_PATH):
+        elements.append(Image(LOGO_PATH, width=1.1*inch, height=1.1*inch))
+    elements.append(Paragraph('Heart Care+ - Heart Disease Prediction Report', title_style))
+    elements.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#c0392b')))
+    elements.append(Spacer(1, 10))
+
+    # Prediction section
+    pred_text = f'<b>Prediction:</b> <font color="#c0392b">{"High Risk" if float(prediction) >= 0.5 else "Low Risk"}</font>'
+    elements.append(Paragraph(pred_text, section_header))
+    elements.append(Spacer(1, 6))
+
+    # Reasoning
+    elements.append(Paragraph('<b>Reasoning:</b>', normal_bold))
+    elements.append(Paragraph(reasoning, styles['Normal']))
+    elements.append(Spacer(1, 8))
+
+    # Recommendations
+    if isinstance(recommendations, (list, tuple)):
+        if recommendations:
+            elements.append(Paragraph('<b>Recommendations:</b>', normal_bold))
+            for rec in recommendations:
+                elements.append(Paragraph(f'- {rec}', styles['Normal']))
+            elements.append(Spacer(1, 8))
+    elif recommendations:
+        elements.append(Paragraph(f'<b>Recommendations:</b> {recommendations}', styles['Normal']))
+
+    elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#c0392b')))
+    elements.append(Spacer(1, 10))
+
+    # Features table
+    if isinstance(features, (list, tuple)):
+        if features:
+            table_data = [['Feature', 'Value']]
+            for name, value in zip(FEATURE_LABELS, features):
+                table_data.append([name, value])
+            t = Table(table_data, hAlign='LEFT', colWidths=[2*inch, 2.5*inch])
+            t.setStyle(TableStyle([
+                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#c0392b')),
+                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+                ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+                ('BOTTOMPADDING', (0,0), (-1,0), 8),
+                ('BACKGROUND', (0,1), (-1,-1), colors.whitesmoke),
+                ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+            ]))
+            elements.append(Paragraph('Input Features', section_header))
+            elements.append(t)
+    elif features:
+        elements.append(Paragraph(f'<b>Features:</b> {features}', styles['Normal']))
+
+    # Top contributing factors (they come back from a form field, so anything malformed drops the table)
+    top_features = valid_top_features(top_features)
+    if top_features:
+        labels = dict(zip(FEATURE_KEYS, FEATURE_LABELS))
+        table_data = [['Feature', 'Value', 'Effect on Risk']]
+        for item in top_features:
+            effect = 'Raises' if item['contribution'] > 0 else 'Lowers'
+            table_data.append([labels.get(item['feature'], item['feature']), str(item.get('value', '')), f"{effect} ({item['contribution']:+.3f})"])
+        t = Table(table_data, hAlign='LEFT', colWidths=[2*inch, 1.2*inch, 1.8*inch])
+        t.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#c0392b')),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0,0), (-1,0), 8),
+            ('BACKGROUND', (0,1), (-1,-1), colors.whitesmoke),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+        ]))
+        elements.append(Paragraph('Top Contributing Factors', section_header))
+        elements.append(t)
+
+    # Footer
+    elements.append(Spacer(1, 24))
+    elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#c0392b')))
+    elements.append(Paragraph('<font size=10 color="#888">Generated by Heart Care+ | For informational purposes only</font>', styles['Normal']))
+
+    with span('pdf_build'):
+        doc.build(elements)
+    return buffer.getvalue()
@@ -0,0 +1,293 @@
+"""
+Server-side sessions
+The session cookie holds only a random session id; the session data lives in
+a store every app node can reach, so a user stays logged in whichever node
+serves the request:
+
+- sqlite (default): a sessions table in HEARTCARE_SESSION_DB. Enough for the
+  gunicorn workers of one host.
+- file: one JSON file per session in HEARTCARE_SESSION_DIR. Put it on a
+  mount shared by the nodes.
+- cookie: Flask's signed cookie, as before.
+
+Loaded sessions are cached in process for HEARTCARE_SESSION_CACHE_SECONDS,
+so most requests do not read the store; a logout on another node therefore
+takes effect here within that time. A session is written back only when it
+changed, or when less than half of its lifetime (the app's
+PERMANENT_SESSION_LIFETIME) is left, and only while the store still has it:
+a stale cached copy never brings a deleted (logged out) session back.
+"""
+
+import copy
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SESSION_STORE = os.environ.get('HEARTCARE_SESSION_STORE', 'sqlite')
+SESSION_DB_PATH = os.environ.get('HEARTCARE_SESSION_DB', os.path.join(os.path.dirname(__file__), '../sessions.db'))
+SESSION_DIR = os.environ.get('HEARTCARE_SESSION_DIR', os.path.join(os.path.dirname(__file__), '../sessions'))
+CACHE_SECONDS = float(os.environ.get('HEARTCARE_SESSION_CACHE_SECONDS', '5'))
+CACHE_SIZE = 10000
+# Expired sessions are deleted on roughly one write in PURGE_EVERY
+PURGE_EVERY = 1000
+# secrets.token_urlsafe(32); anything else in the cookie is ignored before touching the store
+SID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43}$')
+# The serializer of Flask's cookie sessions: flashed messages (tuples), bytes and datetimes round-trip
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+
+class SqliteSessionStore:
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, sid):
+        """(data, expires_at), or None for an unknown or expired session"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?', (sid, time.time())).fetchone()
+        finally:
+            conn.close()
+        return (serializer.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires_at, create=False):
+        """Write a session; unless create, only one that still exists. Returns whether it was written"""
+        conn = self._connect()
+        try:
+            with conn:
+                if create:
+                    conn.execute('INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)', (sid, serializer.dumps(data), expires_at))
+                    return True
+                return conn.execute('UPDATE sessions SET data = ?, expires_at = ? WHERE id = ? AND expires_at > ?',
+                                    (serializer.dumps(data), expires_at, sid, time.time())).rowcount == 1
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+        finally:
+            conn.close()
+
+    def purge_expired(self):
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+        finally:
+            conn.close()
+
+
+class FileSessionStore:
+    """One <sid>.json file per session, written with an atomic rename"""
+
+    def __init__(self, directory=SESSION_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid + '.json')
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record['expires_at'] <= time.time():
+            return None
+        return serializer.loads(record['data']), record['expires_at']
+
+    def save(self, sid, data, expires_at, create=False):
+        """Write a session; unless create, only one that still exists. Returns whether it was written"""
+        path = self._path(sid)
+        if not create and self.load(sid) is None:
+            return False
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'data': serializer.dumps(data), 'expires_at': expires_at}, f)
+        os.replace(tmp, path)
+        return True
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self):
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') and self.load(name[:-len('.json')]) is None:
+                self.delete(name[:-len('.json')])
+                removed += 1
+        return removed
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, cache_seconds=CACHE_SECONDS, cache_size=CACHE_SIZE):
+        self.store = store
+        self.cache_seconds = cache_seconds
+        self.cache_size = cache_size
+        # sid -> (data, expires_at, cached_at), least recently used first
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _cache_get(self, sid):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.cache_seconds or entry[1] <= time.time():
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+            return entry
+
+    def _cache_put(self, sid, data, expires_at):
+        with self._lock:
+            self._cache[sid] = (data, expires_at, time.monotonic())
+            self._cache.move_to_end(sid)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_pop(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if not sid or not SID_PATTERN.match(sid):
+            return ServerSession()
+        entry = self._cache_get(sid)
+        if entry is None:
+            loaded = self.store.load(sid)
+            if loaded is None:
+                return ServerSession()
+            self._cache_put(sid, *loaded)
+            data, expires_at = loaded
+        else:
+            data, expires_at = entry[0], entry[1]
+        # A copy, so changes made during the request do not leak into the cache
+        return ServerSession(copy.deepcopy(data), sid, expires_at)
+
+    def save_session(self, app, session, response):
+        name = app.config['SESSION_COOKIE_NAME']
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.sid is not None:
+            response.vary.add('Cookie')
+
+        if not session:
+            # Cleared (logout): forget it everywhere
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                self._cache_pop(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        new_sid = session.sid is None or session.rotate
+        if new_sid:
+            if session.sid is not None:
+                # Logging in: drop the id the client had before, so it cannot be fixed by someone else
+                self.store.delete(session.sid)
+                self._cache_pop(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+        refresh = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (new_sid or session.modified or refresh):
+            return
+
+        expires_at = now + lifetime
+        data = dict(session)
+        if not self.store.save(session.sid, data, expires_at, create=new_sid):
+            # Deleted from the store since it was cached here (logged out on another node)
+            self._cache_pop(session.sid)
+            response.delete_cookie(name, domain=domain, path=path)
+            return
+        self._cache_put(session.sid, data, expires_at)
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            removed = self.store.purge_expired()
+            print(f"DEBUG: Purged {removed} expired sessions")
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_sessions(app):
+    """Store sessions server side (HEARTCARE_SESSION_STORE=sqlite|file), or keep the signed cookie (cookie)"""
+    if SESSION_STORE == 'cookie':
+        return
+    if SESSION_STORE == 'sqlite':
+        store = SqliteSessionStore()
+    elif SESSION_STORE == 'file':
+        store = FileSessionStore()
+    else:
+        raise ValueError(f'Unknown HEARTCARE_SESSION_STORE: {SESSION_STORE} (expected sqlite, file or cookie)')
+    app.session_interface = ServerSessionInterface(store)
+    print(f"DEBUG: {SESSION_STORE} session store")
+
+
+def regenerate():
+    """Give the session a new id at login and logout (no-op with cookie sessions)"""
+    if isinstance(session._get_current_object(), ServerSession):
+        session.rotate = True
+
+
+def current_user_info():
+    """
+    username, name and email of the logged-in user. They are stored in the
+    session at login; sessions without them are filled in from users once.
+    """
+    if 'user_id' not in session:
+        return None
+    if 'name' not in session:
+        from models.user_model import get_user_info
+        user = get_user_info(session['user_id'])
+        if user is None:
+            return None
+        session['name'] = user['name']
+        session['email'] = user['email']
+    return {'username': session.get('username'), 'name': session['name'], 'email': session.get('email')}
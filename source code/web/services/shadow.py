@@ -0,0 +1,169 @@
+import os
+import queue
+import random
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Candidate scored in the shadow of live traffic: '<model_name>' for the built-in
+# artifact or '<model_name>@<version>' for a model-store version; empty disables
+SHADOW_MODEL = os.environ.get('HEARTCARE_SHADOW_MODEL', '')
+SHADOW_SAMPLE_RATE = float(os.environ.get('HEARTCARE_SHADOW_SAMPLE_RATE', '1'))
+SHADOW_QUEUE_SIZE = int(os.environ.get('HEARTCARE_SHADOW_QUEUE_SIZE', '1000'))
+SHADOW_LOG_DIR = os.environ.get('HEARTCARE_SHADOW_LOG_DIR', os.path.join(os.path.dirname(__file__), '../shadow_log'))
+
+MODEL_NAMES = ['logistic', 'random_forest', 'xgboost']
+# One 25-byte record per scored row: time, primary model, primary and shadow
+# probability, primary and shadow predict_proba time (ms) of the call
+RECORD = struct.Struct('<dBffff')
+RECORD_DTYPE = np.dtype([('ts', '<f8'), ('primary', 'u1'), ('primary_prob', '<f4'), ('shadow_prob', '<f4'),
+                         ('primary_ms', '<f4'), ('shadow_ms', '<f4')])
+
+
+def parse_candidate(candidate):
+    model_name, _, version = candidate.partition('@')
+    if model_name not in MODEL_NAMES:
+        raise ValueError('Unknown shadow model: ' + model_name)
+    return model_name, version or None
+
+
+def log_path(candidate, log_dir=None):
+    model_name, version = parse_candidate(candidate)
+    return os.path.join(log_dir or SHADOW_LOG_DIR, f"{model_name}@{version or 'builtin'}.bin")
+
+
+class ShadowScorer:
+    """
+    Scores a candidate model on the encoded features of live predictions.
+    The request thread only puts a reference on a bounded queue (dropped when
+    full); a background thread loads the candidate, scores it and appends
+    fixed-size records to the log with one O_APPEND write per call, so
+    several processes can share the file.
+    """
+
+    def __init__(self, candidate, sample_rate=SHADOW_SAMPLE_RATE, queue_size=SHADOW_QUEUE_SIZE, log_dir=SHADOW_LOG_DIR):
+        self.candidate = candidate
+        self.model_name, self.version = parse_candidate(candidate)
+        self.sample_rate = sample_rate
+        self.path = log_path(candidate, log_dir)
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._entry = None
+        self.scored = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def observe(self, primary_name, primary_version, X_input, primary_probs, primary_seconds):
+        if primary_name == self.model_name and primary_version == (self.version or 'builtin'):
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((time.time(), primary_name, X_input, primary_probs, primary_seconds))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        from models import heart_model
+        if self._entry is None:
+            if self.version:
+                self._entry = heart_model._load_version(self.model_name, self.version)
+            else:
+                self._entry = heart_model._load_builtin(self.model_name)
+        return self._entry
+
+    def _score(self, item):
+        from models.heart_model import _predict_proba
+        ts, primary_name, X_input, primary_probs, primary_seconds = item
+        entry = self._load()
+        start = time.perf_counter()
+        shadow_probs = _predict_proba(entry, self.model_name, X_input)
+        shadow_ms = (time.perf_counter() - start) * 1000.0
+        primary_ms = primary_seconds * 1000.0
+        primary = MODEL_NAMES.index(primary_name)
+        return b''.join(RECORD.pack(ts, primary, p, s, primary_ms, shadow_ms)
+                        for p, s in zip(np.ravel(primary_probs), shadow_probs))
+
+    def _run(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        while True:
+            item = self._queue.get()
+            try:
+                records = self._score(item)
+                os.write(fd, records)
+                self.scored += len(records) // RECORD.size
+            except Exception as e:
+                self.errors += 1
+                print(f"DEBUG: Shadow scoring with {self.candidate} failed: {e}")
+
+
+_scorer = None
+if SHADOW_MODEL:
+    _scorer = ShadowScorer(SHADOW_MODEL)
+
+
+def observe(primary_name, primary_version, X_input, primary_probs, primary_seconds):
+    """Queue a primary prediction for shadow scoring; a no-op when no candidate is configured"""
+    if _scorer is not None:
+        _scorer.observe(primary_name, primary_version, X_input, primary_probs, primary_seconds)
+
+
+def read_log(candidate, last=None, log_dir=None):
+    """Records of a candidate's shadow log as a structured array (the last `last` rows)"""
+    path = log_path(candidate, log_dir)
+    if not os.path.exists(path):
+        return np.empty(0, dtype=RECORD_DTYPE)
+    # Ignore a trailing partial record from a write in progress
+    count = os.path.getsize(path) // RECORD.size
+    offset = max(0, count - last) if last else 0
+    return np.fromfile(path, dtype=RECORD_DTYPE, count=count - offset, offset=offset * RECORD.size)
+
+
+def summarize(records):
+    """Agreement rate and latency deltas per primary model"""
+    summary = {}
+    for index, model_name in enumerate(MODEL_NAMES):
+        rows = records[records['primary'] == index]
+        if not len(rows):
+            continue
+        primary_ms, shadow_ms = rows['primary_ms'].astype(float), rows['shadow_ms'].astype(float)
+        summary[model_name] = {
+            'count': int(len(rows)),
+            'agreement_rate': float(np.mean((rows['primary_prob'] >= 0.5) == (rows['shadow_prob'] >= 0.5))),
+            'mean_abs_diff': float(np.mean(np.abs(rows['primary_prob'].astype(float) - rows['shadow_prob']))),
+            'primary_ms': {'p50': float(np.percentile(primary_ms, 50)), 'p95': float(np.percentile(primary_ms, 95))},
+            'shadow_ms': {'p50': float(np.percentile(shadow_ms, 50)), 'p95': float(np.percentile(shadow_ms, 95))},
+            'latency_delta_ms': {'p50': float(np.percentile(shadow_ms, 50) - np.percentile(primary_ms, 50)),
+                                 'p95': float(np.percentile(shadow_ms, 95) - np.percentile(primary_ms, 95))},
+            'first_ts': float(rows['ts'].min()),
+            'last_ts': float(rows['ts'].max()),
+        }
+    return summary
+
+
+def status(last=100000):
+    """Candidate, this process's queue counters and the log summary"""
+    if _scorer is None:
+        return {'enabled': False}
+    return {
+        'enabled': True,
+        'candidate': _scorer.candidate,
+        'sample_rate': _scorer.sample_rate,
+        'scored': _scorer.scored,
+        'dropped': _scorer.dropped,
+        'errors': _scorer.errors,
+        'queued': _scorer._queue.qsize(),
+        'models': summarize(read_log(_scorer.candidate, last)),
+    }
@@ -16,12 +16,14 @@ from config import (
     SENDER_EMAIL,
     SENDER_NAME
 )
+from services.metrics import timed
 
 class TwilioService:
     def __init__(self):
         self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
         self.from_number = TWILIO_PHONE_NUMBER
     
+    @timed('twilio.send_sms')
     def send_sms(self, to_number, message):
         """
         Send SMS using Twilio
@@ -43,6 +45,7 @@ class TwilioService:
                 'error': str(e)
             }
     
+    @timed('smtp.send_email')
     def send_email(self, to_email, subject, message_body, html_body=None):
         """
         Send email using SMTP with optional HTML content